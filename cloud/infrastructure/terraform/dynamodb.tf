@@ -64,4 +64,114 @@ resource "aws_dynamodb_table" "avatar_cache" {
   tags = {
     Name = "${var.project_name}-avatar-cache"
   }
-}
\ No newline at end of file
+}
+resource "aws_dynamodb_table" "health_rollups" {
+  name           = "${var.project_name}-health-rollups-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "rollup_key" # "<user_id>#<resolution>"
+  range_key      = "bucket_ts"
+
+  attribute {
+    name = "rollup_key"
+    type = "S"
+  }
+
+  attribute {
+    name = "bucket_ts"
+    type = "N"
+  }
+
+  # 1m / 5m buckets expire; hourly buckets have no expires_at
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "${var.project_name}-health-rollups"
+  }
+}
+
+# Per-user coalescing gate in front of the State Reactor (see lambda/ingest/coalescer.py)
+resource "aws_dynamodb_table" "reactor_gate" {
+  name           = "${var.project_name}-reactor-gate-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "user_id"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "${var.project_name}-reactor-gate"
+  }
+}
+
+# Shared tier of the content-addressed LLM response cache (see lambda/agents/*/core/llm_cache.py)
+resource "aws_dynamodb_table" "llm_cache" {
+  name           = "${var.project_name}-llm-cache-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "${var.project_name}-llm-cache"
+  }
+}
+
+# Character message while the State Reactor generates it; served by GET /user/{id}/state
+resource "aws_dynamodb_table" "message_stream" {
+  name           = "${var.project_name}-message-stream-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "user_id"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "${var.project_name}-message-stream"
+  }
+}
+
+# Proactive Coach run bookkeeping: users a run did not reach before timing out
+resource "aws_dynamodb_table" "coach_runs" {
+  name           = "${var.project_name}-coach-runs-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "run_key"
+
+  attribute {
+    name = "run_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "${var.project_name}-coach-runs"
+  }
+}
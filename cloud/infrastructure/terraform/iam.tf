@@ -78,7 +78,8 @@ resource "aws_iam_role_policy" "bedrock_access" {
     Statement = [
       {
         Action = [
-          "bedrock:InvokeModel"
+          "bedrock:InvokeModel",
+          "bedrock:InvokeModelWithResponseStream" # ConverseStream (STREAM_CHARACTERIZER)
         ]
         Effect   = "Allow"
         Resource = "*"
@@ -115,3 +116,106 @@ resource "aws_iam_role_policy" "lambda_invoke_access" {
     ]
   })
 }
+
+# Role assumed by Bedrock to read batch inference input and write its output
+resource "aws_iam_role" "bedrock_batch_role" {
+  name = "${var.project_name}-bedrock-batch-role-${var.environment}"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = "sts:AssumeRole"
+        Effect = "Allow"
+        Principal = {
+          Service = "bedrock.amazonaws.com"
+        }
+        Condition = {
+          StringEquals = {
+            "aws:SourceAccount" = data.aws_caller_identity.current.account_id
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "bedrock_batch_s3_access" {
+  name = "bedrock_batch_s3_access"
+  role = aws_iam_role.bedrock_batch_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:ListBucket"
+        ]
+        Effect = "Allow"
+        Resource = [
+          aws_s3_bucket.coach_batch.arn,
+          "${aws_s3_bucket.coach_batch.arn}/*"
+        ]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "coach_batch_access" {
+  name = "coach_batch_access"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = [
+          "bedrock:CreateModelInvocationJob",
+          "bedrock:GetModelInvocationJob"
+        ]
+        Effect   = "Allow"
+        Resource = "*"
+      },
+      {
+        Action   = "iam:PassRole"
+        Effect   = "Allow"
+        Resource = aws_iam_role.bedrock_batch_role.arn
+      },
+      {
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:ListBucket"
+        ]
+        Effect = "Allow"
+        Resource = [
+          aws_s3_bucket.coach_batch.arn,
+          "${aws_s3_bucket.coach_batch.arn}/*"
+        ]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "reactor_flush_queue_access" {
+  name = "reactor_flush_queue_access"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = [
+          "sqs:SendMessage",
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes"
+        ]
+        Effect   = "Allow"
+        Resource = aws_sqs_queue.reactor_flush.arn
+      }
+    ]
+  })
+}
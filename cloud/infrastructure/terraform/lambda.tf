@@ -21,6 +21,10 @@ resource "aws_lambda_function" "sensor_ingest" {
     variables = {
       DYNAMODB_TABLE           = aws_dynamodb_table.user_state.name
       HEALTH_TABLE             = aws_dynamodb_table.health_data.name
+      ROLLUP_TABLE             = aws_dynamodb_table.health_rollups.name
+      REACTOR_GATE_TABLE       = aws_dynamodb_table.reactor_gate.name
+      COALESCE_WINDOW_SECONDS  = "30"
+      COALESCE_QUEUE_URL       = aws_sqs_queue.reactor_flush.url
       ENV                      = var.environment
       PROJECT_NAME             = var.project_name
       STATE_REACTOR_FUNCTION_NAME = aws_lambda_function.state_reactor.function_name
@@ -110,6 +114,7 @@ resource "aws_lambda_function" "user_manager" {
     variables = {
       USERS_TABLE      = aws_dynamodb_table.users.name
       USER_STATE_TABLE = aws_dynamodb_table.user_state.name
+      MESSAGE_STREAM_TABLE = aws_dynamodb_table.message_stream.name
       AVATAR_BUCKET    = aws_s3_bucket.avatars.id
       ENV              = var.environment
     }
@@ -202,3 +207,16 @@ resource "aws_lambda_function" "context_retriever" {
   }
 }
 
+
+# Trailing runs of the ingest coalescer: delayed messages, delivered back to the ingest function
+resource "aws_sqs_queue" "reactor_flush" {
+  name                       = "${var.project_name}-reactor-flush-${var.environment}"
+  visibility_timeout_seconds = 60
+  message_retention_seconds  = 3600
+}
+
+resource "aws_lambda_event_source_mapping" "reactor_flush" {
+  event_source_arn = aws_sqs_queue.reactor_flush.arn
+  function_name    = aws_lambda_function.sensor_ingest.arn
+  batch_size       = 10
+}
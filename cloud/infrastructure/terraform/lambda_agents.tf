@@ -19,11 +19,22 @@ resource "aws_lambda_function" "proactive_coach" {
 
   environment {
     variables = {
-      USERS_TABLE      = aws_dynamodb_table.users.name
-      HEALTH_TABLE     = aws_dynamodb_table.health_data.name
-      DYNAMODB_TABLE   = aws_dynamodb_table.user_state.name # User State
-      MODEL_ID         = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
-      ENV              = var.environment
+      USERS_TABLE          = aws_dynamodb_table.users.name
+      HEALTH_TABLE         = aws_dynamodb_table.health_data.name
+      ROLLUP_TABLE         = aws_dynamodb_table.health_rollups.name
+      DYNAMODB_TABLE       = aws_dynamodb_table.user_state.name # User State
+      MODEL_ID             = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      LARGE_MODEL_ID       = "eu.anthropic.claude-sonnet-4-5-20250929-v1:0"
+      LLM_CACHE_TABLE      = aws_dynamodb_table.llm_cache.name
+      COACH_RUNS_TABLE     = aws_dynamodb_table.coach_runs.name
+      COACH_CONCURRENCY    = "8"
+      LLM_POOL_WORKERS     = "16" # >= 2 x COACH_CONCURRENCY (see core/resilience.py)
+      LLM_HEDGE_AFTER_MS   = "0"  # latency-insensitive: no hedged duplicates during the hourly spike
+      COACH_SHARD_SIZE     = "40"
+      COACH_MODE           = "sync" # "batch": Bedrock batch inference (see batch.py)
+      COACH_BATCH_BUCKET   = aws_s3_bucket.coach_batch.bucket
+      COACH_BATCH_ROLE_ARN = aws_iam_role.bedrock_batch_role.arn
+      ENV                  = var.environment
     }
   }
 }
@@ -54,9 +65,23 @@ resource "aws_lambda_function" "state_reactor" {
     variables = {
       USERS_TABLE            = aws_dynamodb_table.users.name
       HEALTH_TABLE           = aws_dynamodb_table.health_data.name
+      ROLLUP_TABLE           = aws_dynamodb_table.health_rollups.name
       DYNAMODB_TABLE         = aws_dynamodb_table.user_state.name
       CONTEXT_RETRIEVER_LAMBDA_ARN = aws_lambda_function.context_retriever.arn
       ENV                    = var.environment
+      RULE_ENGINE_MIN_CONFIDENCE = "0.9"
+      # "fanout" (3 experts + supervisor Lambdas) or "fused" (one model call)
+      REACTOR_MODE           = "fanout"
+      # "local" runs experts/supervisor/characterizer in-process (co-packaged); "remote" invokes their Lambdas
+      EXPERT_BACKEND         = "local"
+      SPECULATIVE_CHARACTERIZER = "true"
+      STREAM_CHARACTERIZER   = "true"
+      MESSAGE_STREAM_TABLE   = aws_dynamodb_table.message_stream.name
+      MODEL_ID               = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      # Per-schema model routing (core/routing.py): experts/characterizer small, supervisor large
+      SMALL_MODEL_ID         = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      LARGE_MODEL_ID         = "eu.anthropic.claude-sonnet-4-5-20250929-v1:0"
+      LLM_CACHE_TABLE        = aws_dynamodb_table.llm_cache.name
       # Child Functions
       ACTIVITY_FUNCTION      = aws_lambda_function.expert_activity.function_name
       VITALS_FUNCTION        = aws_lambda_function.expert_vitals.function_name
@@ -82,7 +107,8 @@ resource "aws_lambda_function" "expert_activity" {
 
   environment {
     variables = {
-      MODEL_ID = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      MODEL_ID        = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      LLM_CACHE_TABLE = aws_dynamodb_table.llm_cache.name
     }
   }
 }
@@ -101,7 +127,8 @@ resource "aws_lambda_function" "expert_vitals" {
 
   environment {
     variables = {
-      MODEL_ID = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      MODEL_ID        = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      LLM_CACHE_TABLE = aws_dynamodb_table.llm_cache.name
     }
   }
 }
@@ -120,7 +147,8 @@ resource "aws_lambda_function" "expert_wellbeing" {
 
   environment {
     variables = {
-      MODEL_ID = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      MODEL_ID        = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      LLM_CACHE_TABLE = aws_dynamodb_table.llm_cache.name
     }
   }
 }
@@ -139,7 +167,8 @@ resource "aws_lambda_function" "expert_supervisor" {
 
   environment {
     variables = {
-      MODEL_ID = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      MODEL_ID        = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      LLM_CACHE_TABLE = aws_dynamodb_table.llm_cache.name
     }
   }
 }
@@ -158,7 +187,9 @@ resource "aws_lambda_function" "characterizer" {
 
   environment {
     variables = {
-      MODEL_ID = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      MODEL_ID             = "eu.anthropic.claude-haiku-4-5-20251001-v1:0"
+      LLM_CACHE_TABLE      = aws_dynamodb_table.llm_cache.name
+      MESSAGE_STREAM_TABLE = aws_dynamodb_table.message_stream.name
     }
   }
 }
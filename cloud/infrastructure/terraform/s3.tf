@@ -46,3 +46,30 @@ resource "google_storage_bucket_iam_member" "video_assets_public_read" {
   role   = "roles/storage.objectViewer"
   member = "allUsers"
 }
+
+# Proactive Coach batch inference input / output (private)
+resource "aws_s3_bucket" "coach_batch" {
+  bucket = "${var.project_name}-coach-batch-${var.environment}"
+}
+
+resource "aws_s3_bucket_public_access_block" "coach_batch" {
+  bucket = aws_s3_bucket.coach_batch.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "coach_batch" {
+  bucket = aws_s3_bucket.coach_batch.id
+
+  rule {
+    id     = "expire-batch-runs"
+    status = "Enabled"
+    filter {}
+    expiration {
+      days = 14
+    }
+  }
+}
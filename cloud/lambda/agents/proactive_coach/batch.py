@@ -0,0 +1,370 @@
+"""
+Bedrock batch inference mode for the Proactive Coach (COACH_MODE=batch).
+
+The hourly coach workload is latency-insensitive, so instead of one synchronous
+Converse call per user the run is submitted as one batch inference job (lower
+per-token price, no throttling at the top of the hour):
+1. run: prepares every user's request (watermark gating and daily summary, on the
+   coach_pool), writes one JSONL record per user ({recordId, modelInput}) plus the
+   request metadata, and submits the job. Runs with fewer than COACH_BATCH_MIN_RECORDS
+   requests (Bedrock's minimum job size) are coached synchronously instead.
+2. collect: every later scheduled invocation checks the open jobs; a finished job's
+   outputs are parsed against the tool schema and recorded like synchronous answers.
+   Progress is checkpointed, so a large job is collected over several invocations.
+
+Backends: 'bedrock' (S3 + CreateModelInvocationJob) or 'local', a file-based
+stand-in used when COACH_BATCH_LOCAL_DIR is set; its jobs are completed with
+LocalBatchBackend.complete (or `python batch.py --complete RUN_ID`).
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import boto3
+from core import database, instrumentation, llm, routing
+from core.llm import INTERVENTION_TOOL_SCHEMA
+from core.utils import from_dynamo
+import coach_pool
+import scheduler
+
+BATCH_MODE = os.environ.get('COACH_MODE', 'sync').lower() == 'batch'
+COACH_BATCH_BUCKET = os.environ.get('COACH_BATCH_BUCKET')
+COACH_BATCH_PREFIX = os.environ.get('COACH_BATCH_PREFIX', 'coach-batch')
+COACH_BATCH_ROLE_ARN = os.environ.get('COACH_BATCH_ROLE_ARN')
+COACH_BATCH_LOCAL_DIR = os.environ.get('COACH_BATCH_LOCAL_DIR')
+COACH_BATCH_MIN_RECORDS = int(os.environ.get('COACH_BATCH_MIN_RECORDS', '100'))
+COACH_BATCH_MODEL_ID = os.environ.get('COACH_BATCH_MODEL_ID')
+
+ANTHROPIC_VERSION = 'bedrock-2023-05-31'
+INPUT_FILE = 'input/records.jsonl'
+REQUESTS_FILE = 'requests.json'
+
+# Batch job statuses (GetModelInvocationJob)
+COLLECTABLE_STATUSES = {'Completed', 'PartiallyCompleted'}
+FAILED_STATUSES = {'Failed', 'Stopped', 'Expired'}
+
+# Recorded users are checkpointed on the job item after this many records
+COLLECT_CHECKPOINT_RECORDS = int(os.environ.get('COACH_BATCH_CHECKPOINT_RECORDS', '25'))
+
+# Skip reason of users whose request is in a job that is not collected yet
+BATCH_PENDING = 'batch_pending'
+
+def model_input(system_prompt, user_message, tool_schema, temperature=0.5, max_tokens=500, system_context=None):
+    """
+    One batch record body: the InvokeModel (Anthropic Messages) equivalent of
+    llm._build_request, forcing the given tool.
+    """
+    spec = tool_schema['toolSpec']
+    return {
+        'anthropic_version': ANTHROPIC_VERSION,
+        'max_tokens': max_tokens,
+        'temperature': temperature,
+        'system': [{'type': 'text', 'text': text} for text in (system_prompt, system_context) if text],
+        'messages': [{'role': 'user', 'content': [{'type': 'text', 'text': user_message}]}],
+        'tools': [{'name': spec['name'], 'description': spec['description'], 'input_schema': spec['inputSchema']['json']}],
+        'tool_choice': {'type': 'tool', 'name': spec['name']}
+    }
+
+def parse_output(model_output, tool_schema):
+    """The tool input of a batch record's modelOutput, or None if missing or invalid."""
+    name = tool_schema['toolSpec']['name']
+    for block in (model_output or {}).get('content', []):
+        if block.get('type') == 'tool_use' and block.get('name') == name:
+            errors = routing.validate(block.get('input'), tool_schema['toolSpec']['inputSchema']['json'])
+            if errors:
+                print(f"Invalid batch output: {'; '.join(errors[:3])}")
+                return None
+            return block['input']
+    return None
+
+# --- Backends ---
+
+class BedrockBatchBackend:
+    """Batch inference jobs on Bedrock, with input and output in S3."""
+    name = 'bedrock'
+
+    def __init__(self, bucket=COACH_BATCH_BUCKET, prefix=COACH_BATCH_PREFIX, role_arn=COACH_BATCH_ROLE_ARN, s3_client=None, bedrock_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.role_arn = role_arn
+        self.s3 = s3_client or boto3.client('s3')
+        self.bedrock = bedrock_client or boto3.client('bedrock')
+
+    def _key(self, run_id, name):
+        return f"{self.prefix}/{run_id}/{name}"
+
+    def put(self, run_id, name, body):
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(run_id, name), Body=body.encode('utf-8'))
+
+    def get(self, run_id, name):
+        return self.s3.get_object(Bucket=self.bucket, Key=self._key(run_id, name))['Body'].read().decode('utf-8')
+
+    def submit(self, run_id, model_id):
+        response = self.bedrock.create_model_invocation_job(
+            jobName=re.sub(r'[^a-zA-Z0-9-]', '-', f"coach-{run_id}")[:63],
+            roleArn=self.role_arn,
+            modelId=model_id,
+            inputDataConfig={'s3InputDataConfig': {'s3Uri': f"s3://{self.bucket}/{self._key(run_id, 'input/')}", 's3InputFormat': 'JSONL'}},
+            outputDataConfig={'s3OutputDataConfig': {'s3Uri': f"s3://{self.bucket}/{self._key(run_id, 'output/')}"}}
+        )
+        return response['jobArn']
+
+    def status(self, run_id, job_id):
+        return self.bedrock.get_model_invocation_job(jobIdentifier=job_id)['status']
+
+    def outputs(self, run_id, job_id):
+        """Output records (dicts) of a finished job."""
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(run_id, 'output/')):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.jsonl.out'):
+                    body = self.s3.get_object(Bucket=self.bucket, Key=obj['Key'])['Body'].read().decode('utf-8')
+                    yield from (json.loads(line) for line in body.splitlines() if line.strip())
+
+class LocalBatchBackend:
+    """File-based stand-in for batch jobs: <root>/<run_id>/{input,output}/, job.json."""
+    name = 'local'
+
+    def __init__(self, root_dir=COACH_BATCH_LOCAL_DIR):
+        self.root_dir = root_dir
+
+    def _path(self, run_id, name):
+        return os.path.join(self.root_dir, run_id, *name.split('/'))
+
+    def put(self, run_id, name, body):
+        path = self._path(run_id, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(body)
+
+    def get(self, run_id, name):
+        with open(self._path(run_id, name), encoding='utf-8') as f:
+            return f.read()
+
+    def submit(self, run_id, model_id):
+        self.put(run_id, 'job.json', json.dumps({'status': 'Submitted', 'model_id': model_id}))
+        return f"local:{run_id}"
+
+    def status(self, run_id, job_id):
+        return json.loads(self.get(run_id, 'job.json'))['status']
+
+    def outputs(self, run_id, job_id):
+        body = self.get(run_id, 'output/records.jsonl.out')
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+    def complete(self, run_id, responder):
+        """
+        Runs a submitted job, as the batch service would.
+
+        :param responder: Function modelInput -> modelOutput (e.g. invoke_model_responder).
+        """
+        job = json.loads(self.get(run_id, 'job.json'))
+        lines = []
+        for line in self.get(run_id, INPUT_FILE).splitlines():
+            record = json.loads(line)
+            try:
+                record['modelOutput'] = responder(record['modelInput'])
+            except Exception as e:
+                record['error'] = {'errorMessage': str(e)}
+            lines.append(json.dumps(record))
+        self.put(run_id, 'output/records.jsonl.out', '\n'.join(lines))
+        self.put(run_id, 'job.json', json.dumps(dict(job, status='Completed')))
+
+def invoke_model_responder(model_id):
+    """Responder for LocalBatchBackend.complete that answers each record with InvokeModel."""
+    def respond(body):
+        response = llm.bedrock_runtime.invoke_model(modelId=model_id, body=json.dumps(body))
+        return json.loads(response['body'].read())
+    return respond
+
+_backend = None
+
+def get_backend():
+    """The configured backend (created once per warm container)."""
+    global _backend
+    if _backend is None:
+        _backend = LocalBatchBackend() if COACH_BATCH_LOCAL_DIR else BedrockBatchBackend()
+        print(f"Coach batch backend: {_backend.name}")
+    return _backend
+
+def set_backend(backend):
+    """Overrides the backend (tests)."""
+    global _backend
+    _backend = backend
+
+def batch_model_id():
+    return COACH_BATCH_MODEL_ID or routing.route(INTERVENTION_TOOL_SCHEMA['toolSpec']['name'], llm.MODEL_ID)[0]
+
+# --- Run / Collect ---
+
+def run(run_id, prepare_user, coach_prepared, build_model_input, deadline=None):
+    """
+    Prepares all users and submits their requests as one batch job. Users not prepared
+    before the deadline are prepared first in the next run.
+
+    :param prepare_user: Function user -> request, or {'user', 'skipped': reason}.
+    :param coach_prepared: Function (request, deadline) -> result, for runs too small to batch.
+    :param build_model_input: Function request -> batch record body.
+    :return: Summary dict of the run.
+    """
+    users = database.get_users(database.scan_user_ids(scheduler.COACH_SCAN_SEGMENTS))
+    # Least recently checked first: users not prepared before the deadline (their
+    # coach_checked_at is not advanced) lead the next run instead of missing it again
+    users.sort(key=lambda user: int(user.get('coach_checked_at') or 0))
+    open_runs = set(database.get_open_batch_runs())
+
+    def prepare(user, _deadline):
+        # One request per user in flight: an active user's data changes every hour, so
+        # without this gate every hourly job would coach them again for the same window
+        if user.get('coach_batch_run') in open_runs:
+            return {'user': user['user_id'], 'skipped': BATCH_PENDING}
+        return prepare_user(user)
+
+    prepared, unprepared = coach_pool.run(users, prepare, deadline=deadline)
+    requests = [r for r in prepared if not r.get('skipped')]
+    skipped = len(prepared) - len(requests)
+    summary = {'run_id': run_id, 'users': len(users), 'skipped': skipped, 'unprepared': len(unprepared)}
+
+    if len(requests) < COACH_BATCH_MIN_RECORDS:
+        print(f"Coach run {run_id}: {len(requests)} requests, below the batch minimum; coaching synchronously")
+        results, remaining = coach_pool.run(requests, coach_prepared, deadline=deadline)
+        return dict(summary, mode='sync', results=results, remaining=len(remaining))
+
+    backend = get_backend()
+    model_id = batch_model_id()
+    records = [json.dumps({'recordId': r['user_id'], 'modelInput': build_model_input(r)}) for r in requests]
+    metadata = {r['user_id']: {'latest_ts': r['latest_ts'], 'digest': r['digest']} for r in requests}
+    backend.put(run_id, INPUT_FILE, '\n'.join(records))
+    backend.put(run_id, REQUESTS_FILE, json.dumps(from_dynamo(metadata)))
+    job_id = backend.submit(run_id, model_id)
+    database.open_batch_job(run_id, job_id, model_id, len(requests))
+
+    # Submitted users count as seen and are not resubmitted until the job is collected
+    now_ms = int(time.time() * 1000)
+    for r in requests:
+        database.update_coach_watermark(r['user_id'], {
+            'coach_watermark_ts': r['latest_ts'],
+            'coach_summary_digest': r['digest'],
+            'coach_batch_run': run_id,
+            'coach_checked_at': now_ms
+        })
+    print(f"Coach run {run_id}: submitted {len(requests)} requests as batch job {job_id} ({model_id})")
+    return dict(summary, mode='batch', job_id=job_id, records=len(requests))
+
+def release_users(user_ids):
+    """
+    Lets the next run coach users whose batch answer is missing: the watermark set at
+    submission is cleared, so they count as having new samples and a changed summary.
+    """
+    for user_id in user_ids:
+        database.update_coach_watermark(user_id, {
+            'coach_watermark_ts': None,
+            'coach_summary_digest': None,
+            'coach_skip_reason': 'batch_failed'
+        })
+
+def collect(job, finish_user, backend=None, deadline=None):
+    """
+    Records the outputs of a finished batch job. Users without a valid answer (failed or
+    missing record, failed job) are released for the next run. Recorded users are
+    checkpointed on the job item; a collection cut short by the deadline stays open and
+    the next invocation continues with the records not yet done.
+
+    :param job: Batch job item (see database.open_batch_job).
+    :param finish_user: Function (request, analysis) -> result; raises if analysis is None.
+    :param deadline: Absolute time.monotonic() deadline of the invocation (None: no limit).
+    :return: Summary dict of the job ('pending' while it is still running, 'partial' if
+             the deadline was reached).
+    """
+    backend = backend or get_backend()
+    run_id, job_id = job['run_id'], job['job_id']
+    status = backend.status(run_id, job_id)
+    if status in FAILED_STATUSES:
+        try:
+            release_users(json.loads(backend.get(run_id, REQUESTS_FILE)))
+        except Exception as e:
+            print(f"Failed to release users of batch job {job_id}: {e}")
+        database.close_batch_job(run_id, 'failed')
+        print(f"Coach batch job {job_id} ended with status {status}")
+        return {'run_id': run_id, 'status': 'failed', 'job_status': status}
+    if status not in COLLECTABLE_STATUSES:
+        return {'run_id': run_id, 'status': 'pending', 'job_status': status}
+
+    requests = json.loads(backend.get(run_id, REQUESTS_FILE))
+    schema_name = INTERVENTION_TOOL_SCHEMA['toolSpec']['name']
+    done = set(job.get('done_users') or [])
+    results, failed_users, seen, checkpoint = [], [], set(done), []
+    out_of_time = False
+    for record in backend.outputs(run_id, job_id):
+        user_id = record.get('recordId')
+        if user_id not in requests or user_id in seen:
+            continue
+        if deadline is not None and time.monotonic() >= deadline:
+            out_of_time = True
+            break
+        seen.add(user_id)
+        model_output = record.get('modelOutput') or {}
+        analysis = None if record.get('error') else parse_output(model_output, INTERVENTION_TOOL_SCHEMA)
+        usage = model_output.get('usage') or {}
+        instrumentation.record(
+            schema_name, job.get('model_id'),
+            usage={'inputTokens': usage.get('input_tokens', 0), 'outputTokens': usage.get('output_tokens', 0)},
+            outcome='ok' if analysis else 'failed'
+        )
+        try:
+            result = finish_user(dict(requests[user_id], user_id=user_id), analysis)
+            if result is not None:
+                results.append(result)
+        except Exception as e:
+            failed_users.append(user_id)
+            release_users([user_id])
+            print(f"Failed to record batch answer for {user_id}: {e}")
+        checkpoint.append(user_id)
+        if len(checkpoint) >= COLLECT_CHECKPOINT_RECORDS:
+            database.mark_batch_records(run_id, checkpoint)
+            checkpoint = []
+    if checkpoint:
+        database.mark_batch_records(run_id, checkpoint)
+
+    answered = len(seen) - len(done) - len(failed_users)
+    if out_of_time:
+        print(f"Coach batch job {job_id}: deadline reached, {answered} answers recorded, {len(requests) - len(seen)} left")
+        return {'run_id': run_id, 'status': 'partial', 'answered': answered, 'failed': len(failed_users), 'remaining': len(requests) - len(seen), 'results': results}
+
+    # Requests without an output record (e.g. a PartiallyCompleted job) failed as well
+    missing = [user_id for user_id in requests if user_id not in seen]
+    failed_users.extend(missing)
+    release_users(missing)
+
+    database.close_batch_job(run_id, 'collected')
+    print(f"Coach batch job {job_id}: {answered} answers recorded, {len(failed_users)} failed ({len(missing)} missing)")
+    return {'run_id': run_id, 'status': 'collected', 'answered': answered, 'failed': len(failed_users), 'missing': len(missing), 'results': results}
+
+def collect_open_jobs(finish_user, deadline=None):
+    """Collects every open batch job that has finished (as far as the deadline allows)."""
+    collected = []
+    for run_id in database.get_open_batch_runs():
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        job = database.get_batch_job(run_id)
+        if not job:
+            database.close_batch_job(run_id, 'missing')
+            continue
+        try:
+            collected.append(collect(job, finish_user, deadline=deadline))
+        except Exception as e:
+            print(f"Failed to collect coach batch job {run_id}: {e}")
+    return collected
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Complete a coach batch job in the local file-based stand-in.')
+    parser.add_argument('--complete', metavar='RUN_ID', required=True, help='Run whose job to complete')
+    parser.add_argument('--local-dir', default=COACH_BATCH_LOCAL_DIR, help='Stand-in directory (default: COACH_BATCH_LOCAL_DIR)')
+    args = parser.parse_args()
+
+    local = LocalBatchBackend(args.local_dir)
+    job_model = json.loads(local.get(args.complete, 'job.json'))['model_id']
+    local.complete(args.complete, invoke_model_responder(job_model))
+    print(f"Completed local batch job for run {args.complete}")
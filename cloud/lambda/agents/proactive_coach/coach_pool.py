@@ -0,0 +1,134 @@
+"""
+Bounded-concurrency worker pool for the Proactive Coach loop.
+
+Users are coached by up to COACH_CONCURRENCY worker threads (history query +
+Bedrock call each). The number of users in flight adapts to Bedrock pressure
+(AIMD): a call that had to be retried (throttling), timed out or hit an open
+circuit halves the limit and pauses dispatching with exponential backoff; clean
+calls grow the limit back by one. Every user gets its own deadline
+(COACH_USER_TIMEOUT_MS, capped by the invocation deadline), and no user is started
+unless it can finish before the Lambda times out. Users not reached are returned
+so the caller can retry them (see scheduler).
+
+The model calls themselves run on the shared resilience pool (LLM_POOL_WORKERS, at
+least 2 x COACH_CONCURRENCY); the coach disables hedging (LLM_HEDGE_AFTER_MS=0) so
+duplicate requests do not add load while the limiter backs off.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from core import instrumentation
+
+COACH_CONCURRENCY = int(os.environ.get('COACH_CONCURRENCY', '8'))
+COACH_USER_TIMEOUT_MS = int(os.environ.get('COACH_USER_TIMEOUT_MS', '15000'))
+COACH_BACKOFF_BASE_MS = int(os.environ.get('COACH_BACKOFF_BASE_MS', '500'))
+COACH_BACKOFF_CAP_MS = int(os.environ.get('COACH_BACKOFF_CAP_MS', '8000'))
+
+# Call outcomes (see core.instrumentation) that signal Bedrock pressure
+PRESSURE_OUTCOMES = ('timeout', 'breaker_open')
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with exponential dispatch backoff."""
+
+    def __init__(self, max_limit=COACH_CONCURRENCY, backoff_base_ms=COACH_BACKOFF_BASE_MS, backoff_cap_ms=COACH_BACKOFF_CAP_MS):
+        self._lock = threading.Lock()
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.backoff_base_ms = backoff_base_ms
+        self.backoff_cap_ms = backoff_cap_ms
+        self.backoff_ms = 0
+        self.paused_until = 0.0
+        self.throttles = 0
+
+    def on_call(self, record):
+        """instrumentation listener: adjusts the limit from one model call record."""
+        if record.get('outcome') == 'cache_hit':
+            return
+        if record.get('retries') or record.get('outcome') in PRESSURE_OUTCOMES:
+            self.on_throttle()
+        else:
+            self.on_success()
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.limit = max(1, self.limit // 2)
+            self.backoff_ms = min(self.backoff_cap_ms, max(self.backoff_base_ms, self.backoff_ms * 2))
+            self.paused_until = time.monotonic() + self.backoff_ms / 1000
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.backoff_ms = 0
+
+    def pause_remaining(self):
+        return max(0.0, self.paused_until - time.monotonic())
+
+def run(users, coach_user, deadline=None, limiter=None, user_timeout_ms=COACH_USER_TIMEOUT_MS):
+    """
+    Coaches users concurrently.
+
+    :param users: User items, in the order they should be coached.
+    :param coach_user: Function (user, deadline) -> result or None; runs in a worker thread.
+    :param deadline: Absolute time.monotonic() deadline of the invocation (None: no limit).
+    :param limiter: AdaptiveLimiter (default: a new one with COACH_CONCURRENCY).
+    :param user_timeout_ms: Time budget of one user.
+    :return: (results, remaining) where results are the non-None coach_user results and
+             remaining the users that were not started or did not finish before the deadline.
+    """
+    limiter = limiter or AdaptiveLimiter()
+    queue = list(users)
+    in_flight = {}
+    results = []
+    failed = 0
+    pool = ThreadPoolExecutor(max_workers=limiter.max_limit)
+    instrumentation.add_listener(limiter.on_call)
+
+    def user_deadline():
+        own = time.monotonic() + user_timeout_ms / 1000
+        return min(own, deadline) if deadline is not None else own
+
+    try:
+        while queue or in_flight:
+            # Start users while the limit allows, no backoff is active and a user can still finish in time
+            while queue and len(in_flight) < limiter.limit and not limiter.pause_remaining():
+                if deadline is not None and time.monotonic() + user_timeout_ms / 1000 > deadline:
+                    break
+                user = queue.pop(0)
+                in_flight[pool.submit(coach_user, user, user_deadline())] = user
+
+            if not in_flight:
+                if not queue or limiter.pause_remaining() == 0:
+                    break  # Out of time for the remaining users
+                time.sleep(limiter.pause_remaining())
+                continue
+
+            # Wake for the first finished user, the end of a backoff pause or the deadline
+            timeout = limiter.pause_remaining() or None
+            if deadline is not None:
+                until_deadline = max(0.0, deadline - time.monotonic())
+                timeout = min(timeout, until_deadline) if timeout else until_deadline
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                user = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    if result is not None:
+                        results.append(result)
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to coach user {user.get('user_id')}: {e}")
+
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+    finally:
+        instrumentation.remove_listener(limiter.on_call)
+        # Do not wait for stragglers past the deadline; they are checkpointed below
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    remaining = list(in_flight.values()) + queue
+    print(f"Coach pool: {len(users) - len(remaining)} users done ({failed} failed), {len(remaining)} remaining, "
+          f"limit {limiter.limit}/{limiter.max_limit}, {limiter.throttles} throttle signals")
+    return results, remaining
@@ -17,3 +17,17 @@ def invoke_avatar_generator(user_id):
         )
     except Exception as e:
         print(f"Failed to invoke avatar generator ({function_name}): {e}")
+
+
+def invoke_coach_shard(function_name, run_id, shard):
+    """Asynchronously starts a coach worker for one shard of a coach run."""
+    try:
+        lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType='Event',
+            Payload=json.dumps({'coach_shard': {'run_id': run_id, 'shard': shard}})
+        )
+        return True
+    except Exception as e:
+        print(f"Failed to dispatch coach shard {run_id}#{shard} ({function_name}): {e}")
+        return False
@@ -1,63 +1,115 @@
 import os
+import time
 import boto3
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from boto3.dynamodb.conditions import Key
+from .utils import from_dynamo
 
 # Environment Variables
 USER_STATE_TABLE = os.environ.get('DYNAMODB_TABLE', 'user_state')
 HEALTH_TABLE = os.environ.get('HEALTH_TABLE', 'health_data')
 USERS_TABLE = os.environ.get('USERS_TABLE', 'users')
+ROLLUP_TABLE = os.environ.get('ROLLUP_TABLE', 'health_rollups')
+COACH_RUNS_TABLE = os.environ.get('COACH_RUNS_TABLE', 'coach_runs')
+COACH_RUN_TTL_SECONDS = int(os.environ.get('COACH_RUN_TTL_SECONDS', str(24 * 3600)))
 
 # Clients
 dynamodb = boto3.resource('dynamodb')
 user_state_table = dynamodb.Table(USER_STATE_TABLE)
 health_table = dynamodb.Table(HEALTH_TABLE)
 users_table = dynamodb.Table(USERS_TABLE)
+rollup_table = dynamodb.Table(ROLLUP_TABLE)
+coach_runs_table = dynamodb.Table(COACH_RUNS_TABLE)
+
+# In a real scenario, these would come from a user profile table
+# For now, we'll mock some user profiles for demonstration
+MOCK_PROFILES = {
+    "user123": {
+        "motivation_style": "ENCOURAGING",
+        "goals": ["SLEEP_OPTIMIZATION", "STRESS_MANAGEMENT"],
+        "preferred_tone": "supportive"
+    },
+    "user456": {
+        "motivation_style": "STRICT",
+        "goals": ["MARATHON_TRAINING"],
+        "preferred_tone": "direct"
+    },
+    "user789": {
+        "motivation_style": "ANALYTICAL",
+        "goals": ["DATA_DRIVEN_IMPROVEMENT"],
+        "preferred_tone": "informative"
+    }
+}
+
+def _with_profile(user):
+    """Enriches a user item with its (mock) coach profile."""
+    # Default profile if not in MOCK_PROFILES
+    user.update(MOCK_PROFILES.get(user.get('user_id'), MOCK_PROFILES["user123"]))
+    return user
 
 def get_all_users():
     try:
-        # In a real scenario, this would come from a user profile table
-        # For now, we'll mock some user profiles for demonstration
         all_users = users_table.scan().get('Items', [])
-        
-        mock_profiles = {
-            "user123": {
-                "motivation_style": "ENCOURAGING",
-                "goals": ["SLEEP_OPTIMIZATION", "STRESS_MANAGEMENT"],
-                "preferred_tone": "supportive"
-            },
-            "user456": {
-                "motivation_style": "STRICT",
-                "goals": ["MARATHON_TRAINING"],
-                "preferred_tone": "direct"
-            },
-            "user789": {
-                "motivation_style": "ANALYTICAL",
-                "goals": ["DATA_DRIVEN_IMPROVEMENT"],
-                "preferred_tone": "informative"
-            }
-        }
 
         # Enrich users with mock profiles
-        enriched_users = []
-        for user in all_users:
-            user_id = user.get('user_id')
-            if user_id in mock_profiles:
-                user.update(mock_profiles[user_id])
-            else:
-                # Default profile if not in mock_profiles
-                user.update(mock_profiles.get("user123")) # Default to user123's profile
-            enriched_users.append(user)
-        
-        if not enriched_users: # If no real users, create a mock user
-            enriched_users.append({"user_id": "user123", **mock_profiles["user123"]})
+        enriched_users = [_with_profile(user) for user in all_users]
 
+        if not enriched_users: # If no real users, create a mock user
+            enriched_users.append({"user_id": "user123", **MOCK_PROFILES["user123"]})
 
         return enriched_users
     except Exception as e:
         print(f"DB Scan Error: {e}")
         return []
 
+def _scan_segment_user_ids(segment, total_segments):
+    user_ids = []
+    kwargs = {
+        'ProjectionExpression': 'user_id',
+        'Segment': segment,
+        'TotalSegments': total_segments
+    }
+    while True:
+        response = users_table.scan(**kwargs)
+        user_ids.extend(item['user_id'] for item in response.get('Items', []) if item.get('user_id'))
+        if 'LastEvaluatedKey' not in response:
+            return user_ids
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def scan_user_ids(segments=1):
+    """
+    All user IDs, read with a parallel segmented Scan (user_id projection only).
+
+    :param segments: Number of Scan segments read concurrently.
+    :return: List of user IDs (in segment order), or [] on error.
+    """
+    try:
+        if segments <= 1:
+            return _scan_segment_user_ids(0, 1)
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            parts = executor.map(lambda segment: _scan_segment_user_ids(segment, segments), range(segments))
+            return [user_id for part in parts for user_id in part]
+    except Exception as e:
+        print(f"DB Scan Error: {e}")
+        return []
+
+def get_users(user_ids):
+    """User items (with coach profiles) for the given IDs, in that order; unknown IDs get a bare item."""
+    found = {}
+    try:
+        for start in range(0, len(user_ids), 100):  # BatchGetItem limit
+            request = {USERS_TABLE: {'Keys': [{'user_id': user_id} for user_id in user_ids[start:start + 100]]}}
+            while request:
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(USERS_TABLE, []):
+                    found[item['user_id']] = item
+                request = response.get('UnprocessedKeys') or None
+    except Exception as e:
+        print(f"DB BatchGet Error: {e}")
+    return [_with_profile(found.get(user_id) or {'user_id': user_id}) for user_id in user_ids]
+
 def get_last_health_reading(user_id):
     try:
         response = health_table.query(
@@ -88,24 +140,111 @@ def get_recent_history(user_id, limit=5):
         print(f"History Query Error: {e}")
         return []
 
-def get_health_data_range(user_id, start_ts, end_ts):
+def iter_health_data_pages(user_id, start_ts, end_ts, attributes=None, page_size=None):
+    """
+    Streams health data for a time range page by page, following LastEvaluatedKey
+    so ranges larger than the 1 MB query limit are returned completely.
+
+    :param user_id: The user ID.
+    :param start_ts: Start timestamp (inclusive) in milliseconds.
+    :param end_ts: End timestamp (inclusive) in milliseconds.
+    :param attributes: Optional list of attributes to project (timestamp is always included).
+    :param page_size: Optional DynamoDB Limit per page.
+    :return: Generator of item lists, in ascending timestamp order.
+    """
+    query_kwargs = {
+        'KeyConditionExpression': Key('user_id').eq(user_id) & Key('timestamp').between(start_ts, end_ts)
+    }
+    if attributes:
+        # 'timestamp' is a DynamoDB reserved word, so every name goes through a placeholder
+        names = list(dict.fromkeys(['timestamp', *attributes]))
+        placeholders = {f"#a{i}": name for i, name in enumerate(names)}
+        query_kwargs['ProjectionExpression'] = ', '.join(placeholders)
+        query_kwargs['ExpressionAttributeNames'] = placeholders
+    if page_size:
+        query_kwargs['Limit'] = page_size
+
+    while True:
+        response = health_table.query(**query_kwargs)
+        yield response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+def split_time_range(start_ts, end_ts, segments):
+    """Splits an inclusive [start_ts, end_ts] range into contiguous, non-overlapping sub-ranges."""
+    segments = max(1, min(int(segments), end_ts - start_ts + 1))
+    step = (end_ts - start_ts + 1) / segments
+    bounds = [start_ts + int(round(i * step)) for i in range(segments)] + [end_ts + 1]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(segments)]
+
+def iter_health_data_range(user_id, start_ts, end_ts, attributes=None, segments=1):
+    """
+    Streams health items for a time range in ascending timestamp order.
+    With segments > 1 the range is split into sub-ranges that are queried in parallel;
+    items are still yielded in order, as soon as each sub-range completes.
+    """
+    if segments <= 1:
+        for page in iter_health_data_pages(user_id, start_ts, end_ts, attributes):
+            yield from page
+        return
+
+    def fetch(sub_range):
+        items = []
+        for page in iter_health_data_pages(user_id, sub_range[0], sub_range[1], attributes):
+            items.extend(page)
+        return items
+
+    sub_ranges = split_time_range(start_ts, end_ts, segments)
+    with ThreadPoolExecutor(max_workers=len(sub_ranges)) as executor:
+        futures = [executor.submit(fetch, sub_range) for sub_range in sub_ranges]
+        for future in futures:
+            yield from future.result()
+
+def get_health_data_range(user_id, start_ts, end_ts, attributes=None, segments=1):
     """
     Fetches health data for a user within a specific time range.
     
     :param user_id: The user ID.
     :param start_ts: Start timestamp (inclusive) in milliseconds.
     :param end_ts: End timestamp (inclusive) in milliseconds.
+    :param attributes: Optional list of attributes to project (reduces read size).
+    :param segments: Number of parallel sub-range queries.
     :return: List of health data items.
     """
     try:
-        response = health_table.query(
-            KeyConditionExpression=Key('user_id').eq(user_id) & Key('timestamp').between(start_ts, end_ts)
-        )
-        return response.get('Items', [])
+        return list(iter_health_data_range(user_id, start_ts, end_ts, attributes, segments))
     except Exception as e:
         print(f"Range Query Error: {e}")
         return []
 
+def get_rollups(user_id, resolution, start_ts, end_ts):
+    """
+    Fetches pre-aggregated rollup buckets (maintained by the ingest Lambda).
+
+    :param user_id: The user ID.
+    :param resolution: '1m', '5m' or '1h'.
+    :param start_ts: Start timestamp (inclusive) in milliseconds.
+    :param end_ts: End timestamp (inclusive) in milliseconds.
+    :return: List of rollup items ({bucket_ts, stats: {metric: {count, sum, sumsq, min, max}}}).
+    """
+    try:
+        query_kwargs = {
+            'KeyConditionExpression': Key('rollup_key').eq(f"{user_id}#{resolution}") & Key('bucket_ts').between(start_ts, end_ts)
+        }
+        items = []
+        while True:
+            response = rollup_table.query(**query_kwargs)
+            items.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return items
+            query_kwargs['ExclusiveStartKey'] = last_key
+    except Exception as e:
+        print(f"Rollup Query Error: {e}")
+        return []
+
 def get_last_state(user_id):
     try:
         resp = user_state_table.get_item(Key={'user_id': user_id})
@@ -126,3 +265,171 @@ def update_state_db(user_id, analysis, time_gap):
         user_state_table.put_item(Item=item)
     except Exception as e:
         print(f"Failed to update DB: {e}")
+
+def update_coach_watermark(user_id, fields):
+    """Sets coaching watermark attributes (see watermark) on the user item."""
+    try:
+        names, values, assignments = {}, {}, []
+        for i, (key, value) in enumerate(fields.items()):
+            names[f'#w{i}'] = key
+            values[f':w{i}'] = value
+            assignments.append(f'#w{i} = :w{i}')
+        users_table.update_item(
+            Key={'user_id': user_id},
+            UpdateExpression=f"SET {', '.join(assignments)}",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except Exception as e:
+        print(f"Watermark Write Error ({user_id}): {e}")
+
+# --- Coach run shard tracker (coach_runs table, one item per "<run_id>#<shard>") ---
+
+def _shard_key(run_id, shard):
+    return f"{run_id}#{shard}"
+
+def create_shard(run_id, shard, user_ids):
+    """Records a shard of a coach run; a shard that already exists (planner retried) is kept."""
+    try:
+        coach_runs_table.put_item(
+            Item={
+                'run_key': _shard_key(run_id, shard),
+                'run_id': run_id,
+                'shard': shard,
+                'user_ids': list(user_ids),
+                'status': 'pending',
+                'attempts': 0,
+                'updated_at': int(time.time() * 1000),
+                'expires_at': int(time.time()) + COACH_RUN_TTL_SECONDS
+            },
+            ConditionExpression='attribute_not_exists(run_key)'
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            print(f"Shard {shard} of run {run_id} already planned")
+            return False
+        print(f"Shard Write Error: {e}")
+        return False
+    except Exception as e:
+        print(f"Shard Write Error: {e}")
+        return False
+
+def claim_shard(run_id, shard):
+    """
+    Starts an attempt on a shard: bumps its attempt counter and marks it running.
+
+    :return: The shard item (native values, done_users as a list) or None if unknown.
+    """
+    try:
+        response = coach_runs_table.update_item(
+            Key={'run_key': _shard_key(run_id, shard)},
+            UpdateExpression='SET #status = :running, updated_at = :now ADD attempts :one',
+            ConditionExpression='attribute_exists(run_key)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':running': 'running', ':now': int(time.time() * 1000), ':one': 1},
+            ReturnValues='ALL_NEW'
+        )
+        return from_dynamo(response['Attributes'])
+    except Exception as e:
+        print(f"Shard Claim Error ({run_id}#{shard}): {e}")
+        return None
+
+def mark_users_coached(run_id, shard, user_ids):
+    """Adds users to the shard's done set, so a retried shard skips them."""
+    try:
+        coach_runs_table.update_item(
+            Key={'run_key': _shard_key(run_id, shard)},
+            UpdateExpression='ADD done_users :users',
+            ExpressionAttributeValues={':users': set(user_ids)}
+        )
+    except Exception as e:
+        print(f"Shard Progress Error ({run_id}#{shard}): {e}")
+
+def set_shard_status(run_id, shard, status):
+    try:
+        coach_runs_table.update_item(
+            Key={'run_key': _shard_key(run_id, shard)},
+            UpdateExpression='SET #status = :status, updated_at = :now',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':status': status, ':now': int(time.time() * 1000)}
+        )
+    except Exception as e:
+        print(f"Shard Status Error ({run_id}#{shard}): {e}")
+
+# --- Coach batch jobs (coach_runs table, item "batch#<run_id>"; open runs in the "batch#open" set) ---
+
+OPEN_BATCH_KEY = 'batch#open'
+COACH_BATCH_TTL_SECONDS = int(os.environ.get('COACH_BATCH_TTL_SECONDS', str(4 * 24 * 3600)))
+
+def _batch_key(run_id):
+    return f"batch#{run_id}"
+
+def open_batch_job(run_id, job_id, model_id, records):
+    """Records a submitted batch job and adds its run to the open set."""
+    now_ms = int(time.time() * 1000)
+    try:
+        coach_runs_table.put_item(Item={
+            'run_key': _batch_key(run_id),
+            'run_id': run_id,
+            'job_id': job_id,
+            'model_id': model_id,
+            'records': records,
+            'status': 'submitted',
+            'updated_at': now_ms,
+            'expires_at': int(time.time()) + COACH_BATCH_TTL_SECONDS
+        })
+        coach_runs_table.update_item(
+            Key={'run_key': OPEN_BATCH_KEY},
+            UpdateExpression='ADD run_ids :run SET updated_at = :now',
+            ExpressionAttributeValues={':run': {run_id}, ':now': now_ms}
+        )
+    except Exception as e:
+        print(f"Batch Job Write Error ({run_id}): {e}")
+
+def get_open_batch_runs():
+    """Run IDs of the batch jobs not yet collected."""
+    try:
+        response = coach_runs_table.get_item(Key={'run_key': OPEN_BATCH_KEY}, ConsistentRead=True)
+        return sorted(response.get('Item', {}).get('run_ids') or [])
+    except Exception as e:
+        print(f"Batch Job Read Error: {e}")
+        return []
+
+def get_batch_job(run_id):
+    try:
+        response = coach_runs_table.get_item(Key={'run_key': _batch_key(run_id)}, ConsistentRead=True)
+        item = response.get('Item')
+        return from_dynamo(item) if item else None
+    except Exception as e:
+        print(f"Batch Job Read Error ({run_id}): {e}")
+        return None
+
+def mark_batch_records(run_id, user_ids):
+    """Adds users to the batch job's done set, so a continued collection skips them."""
+    try:
+        coach_runs_table.update_item(
+            Key={'run_key': _batch_key(run_id)},
+            UpdateExpression='ADD done_users :users SET updated_at = :now',
+            ExpressionAttributeValues={':users': set(user_ids), ':now': int(time.time() * 1000)}
+        )
+    except Exception as e:
+        print(f"Batch Job Progress Error ({run_id}): {e}")
+
+def close_batch_job(run_id, status):
+    """Marks a batch job finished and removes its run from the open set."""
+    now_ms = int(time.time() * 1000)
+    try:
+        coach_runs_table.update_item(
+            Key={'run_key': _batch_key(run_id)},
+            UpdateExpression='SET #status = :status, updated_at = :now',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':status': status, ':now': now_ms}
+        )
+        coach_runs_table.update_item(
+            Key={'run_key': OPEN_BATCH_KEY},
+            UpdateExpression='DELETE run_ids :run SET updated_at = :now',
+            ExpressionAttributeValues={':run': {run_id}, ':now': now_ms}
+        )
+    except Exception as e:
+        print(f"Batch Job Status Error ({run_id}): {e}")
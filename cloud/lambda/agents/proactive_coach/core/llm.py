@@ -1,9 +1,24 @@
 import os
+import re
 import boto3
 import json
+import time
+from . import llm_cache, resilience, routing, instrumentation
 
 bedrock_runtime = boto3.client('bedrock-runtime')
 MODEL_ID = os.environ.get('MODEL_ID', 'eu.anthropic.claude-sonnet-4-5-20250929-v1:0')
+# Cheaper model used when MODEL_ID is throttled, failing or its circuit is open
+FALLBACK_MODEL_ID = os.environ.get('FALLBACK_MODEL_ID')
+
+# Bedrock prompt caching: the tool spec + static system prompt form a cached prefix
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+# Model families that accept cachePoint blocks in the Converse API
+PROMPT_CACHE_MODELS = ('claude-3-5-haiku', 'claude-3-7-sonnet', 'claude-sonnet-4', 'claude-opus-4', 'claude-haiku-4-5', 'amazon.nova')
+# Minimum cacheable prefix (tokens) per model family; shorter prefixes are not cached
+PROMPT_CACHE_MIN_TOKENS = {'claude-3-5-haiku': 2048, 'claude-haiku-4-5': 4096}
+PROMPT_CACHE_DEFAULT_MIN_TOKENS = 1024
+# Rough token estimate for the prefix size check
+CHARS_PER_TOKEN = 4
 
 # --- JSON Schemas for Structured Output ---
 PET_STATE_TOOL_SCHEMA = {
@@ -58,41 +73,262 @@ INTERVENTION_TOOL_SCHEMA = {
   }
 }
 
-def invoke_model_structured(system_prompt, user_message, tool_schema, temperature=0.5):
+def model_chain(primary=None):
+    """Model IDs to try, primary first (default: MODEL_ID)."""
+    primary = primary or MODEL_ID
+    if FALLBACK_MODEL_ID and FALLBACK_MODEL_ID != primary:
+        return [primary, FALLBACK_MODEL_ID]
+    return [primary]
+
+def supports_prompt_cache(model_id):
+    return PROMPT_CACHE_ENABLED and any(name in model_id for name in PROMPT_CACHE_MODELS)
+
+def prompt_cache_min_tokens(model_id):
+    return next((tokens for name, tokens in PROMPT_CACHE_MIN_TOKENS.items() if name in model_id), PROMPT_CACHE_DEFAULT_MIN_TOKENS)
+
+def static_prefix_tokens(request):
+    """Estimated tokens of the static prefix: tool spec + static system prompt."""
+    chars = len(json.dumps(request.get('toolConfig', {}))) + len(request['system'][0].get('text', ''))
+    return chars // CHARS_PER_TOKEN
+
+def with_cache_point(request, model_id):
+    """
+    Request for a specific model: on models with prompt caching a cachePoint follows
+    the static system prompt, so tool spec + system rules are read from cache. Bedrock
+    ignores prefixes below the model's minimum, so short prefixes (experts, supervisor,
+    characterizer, coach) get no cachePoint; today only the fused analysis prefix
+    (~1.1k tokens, on Sonnet) is long enough.
+    """
+    if not supports_prompt_cache(model_id) or static_prefix_tokens(request) < prompt_cache_min_tokens(model_id):
+        return request
+    system = list(request['system'])
+    system.insert(1, {"cachePoint": {"type": "default"}})
+    return dict(request, system=system)
+
+def _build_request(system_prompt, user_message, tool_schema, temperature, max_tokens, system_context=None):
+    """Converse request (without modelId) forcing the given tool."""
+    return {
+        'system': [{"text": system_prompt}] + ([{"text": system_context}] if system_context else []),
+        'messages': [
+            {
+                "role": "user",
+                "content": [{"text": user_message}]
+            }
+        ],
+        'toolConfig': {
+            "tools": [tool_schema],
+            "toolChoice": {"tool": {"name": tool_schema['toolSpec']['name']}}
+        },
+        'inferenceConfig': {
+            "temperature": temperature,
+            "maxTokens": max_tokens
+        }
+    }
+
+def _converse_tool(request, tool_name, model_id, deadline, info=None):
+    """
+    One resilient Converse call.
+
+    :param info: Optional dict that receives retry count and outcome (see resilience.invoke).
+
+    :return: (tool input or None, model that answered, raw response or None)
+    """
+    response, model_used = resilience.invoke(
+        lambda m: bedrock_runtime.converse(modelId=m, **with_cache_point(request, m)),
+        model_chain(model_id),
+        deadline=deadline,
+        info=info
+    )
+    if response is None:
+        return None, None, None
+
+    output_content = response['output']['message']['content']
+    for content_block in output_content:
+        if 'toolUse' in content_block:
+            return content_block['toolUse']['input'], model_used, response
+
+    print(f"Warning: No tool use found in model response ({tool_name}): {output_content}")
+    return None, model_used, response
+
+def invoke_model_structured(system_prompt, user_message, tool_schema, temperature=0.5, use_cache=True, usage=None, max_tokens=500, deadline=None, system_context=None):
     """
     Invokes the Bedrock model using the Converse API with tool use for structured output.
+    The model is chosen per tool schema (see core.routing); a small-model answer that
+    fails validation or reports low confidence is retried on the large model.
+    Identical requests are served from the LLM response cache (see core.llm_cache).
+    Calls go through core.resilience (deadline, hedging, retries, circuit breaker,
+    FALLBACK_MODEL_ID); None means no model answered in time. Every call is recorded
+    by core.instrumentation (EMF metrics + in-process aggregator).
+
+    Keep system_prompt static (rules, instructions): together with the tool spec it is
+    the prompt-cache prefix. Per-call data belongs in user_message (or system_context).
+
+    :param system_context: Optional per-call system text placed after the cached prefix.
+    :param use_cache: Set False to always call the model for this request.
+    :param usage: Optional dict that receives the token usage and latency of the model call(s).
+    :param max_tokens: Output token limit.
+    :param deadline: Absolute time.monotonic() deadline (default: the invocation deadline, capped per call).
     """
-    print(f"Invoking Model: {MODEL_ID} with tool {tool_schema['toolSpec']['name']}")
+    schema_name = tool_schema['toolSpec']['name']
+    model_id, tier, escalate = routing.route(schema_name, MODEL_ID)
+    cache_key = None
+    started = time.perf_counter()
+    if use_cache and llm_cache.is_enabled(schema_name):
+        cache_key = llm_cache.request_key(model_id, [system_prompt, system_context], user_message, tool_schema, temperature)
+        cached = llm_cache.get(cache_key, schema_name)
+        if cached is not None:
+            print(f"LLM Cache Hit: {schema_name}")
+            instrumentation.record(schema_name, model_id, client_latency_ms=(time.perf_counter() - started) * 1000, outcome='cache_hit')
+            return cached
+
+    print(f"Invoking Model: {model_id} with tool {schema_name}")
     try:
-        response = bedrock_runtime.converse(
-            modelId=MODEL_ID,
-            system=[{"text": system_prompt}],
-            messages=[
-                {
-                    "role": "user",
-                    "content": [{"text": user_message}]
-                }
-            ],
-            toolConfig={
-                "tools": [tool_schema],
-                "toolChoice": {"tool": {"name": tool_schema['toolSpec']['name']}}
-            },
-            inferenceConfig={
-                "temperature": temperature,
-                "maxTokens": 500
-            }
-        )
-        
-        output_content = response['output']['message']['content']
-        
-        # Extract tool use from the response
-        for content_block in output_content:
-            if 'toolUse' in content_block:
-                return content_block['toolUse']['input']
-        
-        print(f"Warning: No tool use found in model response: {output_content}")
-        return None
+        request = _build_request(system_prompt, user_message, tool_schema, temperature, max_tokens, system_context)
+        attempts = [(model_id, tier, False)]
+        result, model_used = None, None
+        rejected = None
+        while attempts:
+            attempt_model, attempt_tier, escalated = attempts.pop(0)
+            attempt_started = time.perf_counter()
+            info = {}
+            attempt_result, attempt_used, response = _converse_tool(request, schema_name, attempt_model, deadline, info)
+            client_ms = (time.perf_counter() - attempt_started) * 1000
+            if response is None:
+                instrumentation.record(schema_name, attempt_model, client_latency_ms=client_ms, retries=info.get('retries', 0), outcome=info.get('outcome', 'failed'))
+                break
+            if attempt_result is not None or result is None:
+                result, model_used = attempt_result, attempt_used
+                rejected = None
+
+            call_usage = response.get('usage', {})
+            server_ms = response.get('metrics', {}).get('latencyMs')
+            routing.record(schema_name, attempt_tier, call_usage, client_ms, escalated=escalated)
+            if usage is not None:
+                for key, value in call_usage.items():
+                    usage[key] = usage.get(key, 0) + value
+                usage['latencyMs'] = (usage.get('latencyMs') or 0) + (server_ms or 0)
+
+            outcome = 'ok' if attempt_result is not None else 'no_tool_use'
+            large_model = routing.MODEL_TIERS['large']
+            if escalate and not escalated and attempt_model != large_model:
+                reason = routing.escalation_reason(result, tool_schema)
+                if reason:
+                    print(f"Escalating {schema_name} to the large model: {reason}")
+                    rejected = reason
+                    attempts.append((large_model, 'large', True))
+                    outcome = 'escalated'
+            instrumentation.record(schema_name, attempt_used, call_usage, server_ms, client_ms, info.get('retries', 0), outcome)
+
+        # Fallback-model answers are not cached under the routed model's key, and an answer
+        # rejected for escalation (the escalated call failed) is not cached at all
+        if result is not None and not rejected and cache_key and model_used != FALLBACK_MODEL_ID:
+            llm_cache.put(cache_key, schema_name, result)
+        return result
 
     except Exception as e:
         print(f"Bedrock Structured Invocation Error: {e}")
-        return None
\ No newline at end of file
+        instrumentation.record(schema_name, model_id, client_latency_ms=(time.perf_counter() - started) * 1000, outcome='error')
+        return None
+
+# --- Streaming ---
+
+def partial_string_field(buffer, field):
+    """
+    Value of a top-level string field in a (possibly incomplete) JSON object, as far
+    as it has arrived. None if the field has not started yet.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), buffer)
+    if not match:
+        return None
+    chars = []
+    i = match.end()
+    while i < len(buffer):
+        char = buffer[i]
+        if char == '"':
+            break
+        if char == '\\':
+            if i + 1 >= len(buffer):
+                break
+            escaped = buffer[i + 1]
+            if escaped == 'u':
+                if i + 6 > len(buffer):
+                    break
+                chars.append(chr(int(buffer[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            chars.append(_JSON_ESCAPES.get(escaped, escaped))
+            i += 2
+            continue
+        chars.append(char)
+        i += 1
+    return ''.join(chars)
+
+_JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+def invoke_model_structured_stream(system_prompt, user_message, tool_schema, on_text, stream_field='message', temperature=0.5, use_cache=True, max_tokens=500, deadline=None, system_context=None):
+    """
+    Like invoke_model_structured, but uses the streaming Converse API and calls
+    on_text(text_so_far) whenever more of the string field `stream_field` arrives.
+    Routed, cached and instrumented like invoke_model_structured (no escalation).
+
+    :return: The final tool input, or None if the model did not answer in time.
+    """
+    schema_name = tool_schema['toolSpec']['name']
+    model_id, tier, _ = routing.route(schema_name, MODEL_ID)
+    started = time.perf_counter()
+    cache_key = None
+    if use_cache and llm_cache.is_enabled(schema_name):
+        cache_key = llm_cache.request_key(model_id, [system_prompt, system_context], user_message, tool_schema, temperature)
+        cached = llm_cache.get(cache_key, schema_name)
+        if cached is not None:
+            print(f"LLM Cache Hit: {schema_name}")
+            instrumentation.record(schema_name, model_id, client_latency_ms=(time.perf_counter() - started) * 1000, outcome='cache_hit')
+            on_text(cached.get(stream_field, ''))
+            return cached
+
+    print(f"Streaming Model: {model_id} with tool {schema_name}")
+    info = {}
+    try:
+        request = _build_request(system_prompt, user_message, tool_schema, temperature, max_tokens, system_context)
+        response, model_used = resilience.invoke(
+            lambda m: bedrock_runtime.converse_stream(modelId=m, **with_cache_point(request, m)),
+            model_chain(model_id),
+            deadline=deadline,
+            info=info
+        )
+        if response is None:
+            instrumentation.record(schema_name, model_id, client_latency_ms=(time.perf_counter() - started) * 1000, retries=info.get('retries', 0), outcome=info.get('outcome', 'failed'))
+            return None
+
+        stream_deadline = resilience.call_deadline(deadline)
+        buffer = ''
+        last_text = None
+        call_usage = {}
+        server_ms = None
+        for event in response['stream']:
+            if 'contentBlockDelta' in event:
+                buffer += event['contentBlockDelta']['delta'].get('toolUse', {}).get('input', '')
+                text = partial_string_field(buffer, stream_field)
+                if text and text != last_text:
+                    last_text = text
+                    on_text(text)
+            elif 'metadata' in event:
+                call_usage = event['metadata'].get('usage', {})
+                server_ms = event['metadata'].get('metrics', {}).get('latencyMs')
+            if time.monotonic() >= stream_deadline:
+                raise resilience.DeadlineExceeded(f"{model_used} stream did not finish before the deadline")
+
+        result = json.loads(buffer) if buffer else None
+        client_ms = (time.perf_counter() - started) * 1000
+        routing.record(schema_name, tier, call_usage, client_ms)
+        instrumentation.record(schema_name, model_used, call_usage, server_ms, client_ms, info.get('retries', 0), 'ok' if result else 'no_tool_use')
+
+        if result is not None and cache_key and model_used != FALLBACK_MODEL_ID:
+            llm_cache.put(cache_key, schema_name, result)
+        return result
+
+    except Exception as e:
+        print(f"Bedrock Streaming Invocation Error: {e}")
+        outcome = 'timeout' if isinstance(e, resilience.DeadlineExceeded) else 'error'
+        instrumentation.record(schema_name, model_id, client_latency_ms=(time.perf_counter() - started) * 1000, retries=info.get('retries', 0), outcome=outcome)
+        return None
@@ -0,0 +1,200 @@
+"""
+LLM Response Cache
+Content-addressed cache for structured model calls. The key is a SHA-256 of the
+canonical request (model, system prompt, user message, tool schema, temperature),
+so identical requests are answered without calling Bedrock.
+
+Two tiers:
+- In-process LRU (per warm container, microseconds)
+- Shared DynamoDB table with TTL (across containers and functions, single-digit ms)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import boto3
+
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TABLE = os.environ.get('LLM_CACHE_TABLE')
+LLM_CACHE_TTL_SECONDS = int(os.environ.get('LLM_CACHE_TTL_SECONDS', '3600'))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '256'))
+
+# Comma-separated tool names ('*' = all) and tool names that are never cached
+LLM_CACHE_SCHEMAS = os.environ.get('LLM_CACHE_SCHEMAS', '*')
+LLM_CACHE_DISABLED_SCHEMAS = os.environ.get('LLM_CACHE_DISABLED_SCHEMAS', '')
+
+dynamodb = boto3.resource('dynamodb')
+cache_table = dynamodb.Table(LLM_CACHE_TABLE) if LLM_CACHE_TABLE else None
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+_enabled_schemas = _split(LLM_CACHE_SCHEMAS)
+_disabled_schemas = _split(LLM_CACHE_DISABLED_SCHEMAS)
+
+def _json_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def request_key(model_id, system_prompt, user_message, tool_schema, temperature):
+    """Canonical SHA-256 of a structured model request."""
+    canonical = json.dumps(
+        {
+            'model': model_id,
+            'system': system_prompt,
+            'message': user_message,
+            'tool': tool_schema,
+            'temperature': float(temperature)
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+        default=_json_default
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def is_enabled(schema_name):
+    """True if responses for this tool schema may be cached."""
+    if not LLM_CACHE_ENABLED or schema_name in _disabled_schemas:
+        return False
+    return '*' in _enabled_schemas or schema_name in _enabled_schemas
+
+def set_schema_enabled(schema_name, enabled):
+    """Enables or disables caching for one tool schema at runtime."""
+    if enabled:
+        _disabled_schemas.discard(schema_name)
+        _enabled_schemas.add(schema_name)
+    else:
+        _enabled_schemas.discard(schema_name)
+        _disabled_schemas.add(schema_name)
+
+class LRUCache:
+    """Bounded in-process cache with per-entry expiry, shared by the worker threads."""
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if (time.time() if now is None else now) >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, now=None):
+        with self._lock:
+            self._entries[key] = ((time.time() if now is None else now) + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+_memory = LRUCache()
+
+# --- Metrics (per warm container) ---
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def _count(schema_name, counter):
+    with _stats_lock:
+        schema_stats = _stats.setdefault(schema_name, {'memory_hits': 0, 'shared_hits': 0, 'misses': 0, 'stores': 0, 'errors': 0})
+        schema_stats[counter] += 1
+
+def get_stats():
+    """Hit/miss counters per tool schema plus the overall hit rate."""
+    with _stats_lock:
+        schemas = {name: dict(s) for name, s in _stats.items()}
+    hits = sum(s['memory_hits'] + s['shared_hits'] for s in schemas.values())
+    lookups = hits + sum(s['misses'] for s in schemas.values())
+    return {
+        'schemas': schemas,
+        'memory_entries': len(_memory),
+        'hit_rate': hits / lookups if lookups else 0.0
+    }
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+def clear():
+    """Drops the in-process tier (the shared tier expires via TTL)."""
+    _memory.clear()
+
+# --- Lookup / Store ---
+
+def get(key, schema_name):
+    """
+    Looks a request up in the in-process tier, then the shared tier.
+
+    :return: Cached tool input dict, or None on a miss.
+    """
+    try:
+        value = _memory.get(key)
+        if value is not None:
+            _count(schema_name, 'memory_hits')
+            return json.loads(value)
+    except Exception as e:
+        # A cache fault counts as a miss, never fails the model call
+        print(f"LLM cache memory read error: {e}")
+        _count(schema_name, 'errors')
+
+    if cache_table is not None:
+        try:
+            item = cache_table.get_item(Key={'cache_key': key}).get('Item')
+            # DynamoDB TTL deletion is lazy, so check expiry ourselves
+            if item and int(item.get('expires_at', 0)) > time.time():
+                _memory.put(key, item['response'])
+                _count(schema_name, 'shared_hits')
+                return json.loads(item['response'])
+        except Exception as e:
+            print(f"LLM cache read error: {e}")
+            _count(schema_name, 'errors')
+
+    _count(schema_name, 'misses')
+    return None
+
+def put(key, schema_name, result):
+    """Stores a model result in both tiers. Failures never affect the caller."""
+    try:
+        value = json.dumps(result, default=_json_default)
+    except (TypeError, ValueError) as e:
+        print(f"LLM cache skipped unserializable result: {e}")
+        return
+
+    try:
+        _memory.put(key, value)
+        _count(schema_name, 'stores')
+    except Exception as e:
+        print(f"LLM cache memory write error: {e}")
+        _count(schema_name, 'errors')
+
+    if cache_table is not None:
+        try:
+            cache_table.put_item(Item={
+                'cache_key': key,
+                'schema': schema_name,
+                'response': value,
+                'expires_at': int(time.time()) + LLM_CACHE_TTL_SECONDS
+            })
+        except Exception as e:
+            print(f"LLM cache write error: {e}")
+            _count(schema_name, 'errors')
@@ -0,0 +1,266 @@
+"""
+Resilient model invocation.
+
+Wraps a blocking model call with:
+- a deadline (derived from the Lambda's remaining time, capped per call)
+- a hedged duplicate request once the call is slower than LLM_HEDGE_AFTER_MS (~p95)
+- jittered exponential backoff retries on throttling / transient errors
+- a per-model circuit breaker
+- fallback across a chain of model IDs (e.g. a cheaper model)
+
+Callers get (None, None) when no model could answer in time and degrade on their own
+(e.g. the experts fall back to the rule engine).
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from botocore.exceptions import ClientError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+
+# Send a duplicate request if the first one has not answered after this long (0 disables hedging)
+HEDGE_AFTER_MS = int(os.environ.get('LLM_HEDGE_AFTER_MS', '4000'))
+MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+RETRY_BASE_MS = int(os.environ.get('LLM_RETRY_BASE_MS', '200'))
+RETRY_CAP_MS = int(os.environ.get('LLM_RETRY_CAP_MS', '2000'))
+# Upper bound for a single model call, and time kept back for work after it
+CALL_TIMEOUT_MS = int(os.environ.get('LLM_CALL_TIMEOUT_MS', '20000'))
+DEADLINE_RESERVE_MS = int(os.environ.get('LLM_DEADLINE_RESERVE_MS', '3000'))
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN_S = float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS', '30'))
+
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+    'InternalServerException',
+    'ModelTimeoutException',
+}
+
+class DeadlineExceeded(Exception):
+    pass
+
+# Model calls (primaries and hedges) run on this shared pool. It must hold a primary and a
+# hedge for every concurrent caller (e.g. 2 x COACH_CONCURRENCY), or calls queue behind others.
+LLM_POOL_WORKERS = int(os.environ.get('LLM_POOL_WORKERS', '16'))
+
+_pool = ThreadPoolExecutor(max_workers=LLM_POOL_WORKERS)
+_invocation_deadline = None
+
+def start_invocation(lambda_context, reserve_ms=DEADLINE_RESERVE_MS):
+    """
+    Sets the deadline for model calls in this invocation from the Lambda context.
+    A None context (agent handlers called in-process) keeps the current deadline.
+    """
+    global _invocation_deadline
+    if lambda_context is not None and hasattr(lambda_context, 'get_remaining_time_in_millis'):
+        remaining_ms = lambda_context.get_remaining_time_in_millis()
+        _invocation_deadline = time.monotonic() + max(0, remaining_ms - reserve_ms) / 1000
+    return _invocation_deadline
+
+def call_deadline(deadline=None):
+    """Absolute (monotonic) deadline for one call: the invocation deadline, capped per call."""
+    cap = time.monotonic() + CALL_TIMEOUT_MS / 1000
+    deadline = deadline if deadline is not None else _invocation_deadline
+    return min(deadline, cap) if deadline is not None else cap
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial call through after the cooldown."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown_s=BREAKER_COOLDOWN_S):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.cooldown_s else 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Ends a call that says nothing about model health (request error): frees the trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(model_id):
+    with _breakers_lock:
+        if model_id not in _breakers:
+            _breakers[model_id] = CircuitBreaker()
+        return _breakers[model_id]
+
+# --- Metrics (per warm container) ---
+
+_stats = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'retries': 0, 'timeouts': 0, 'breaker_skips': 0, 'fallbacks': 0, 'failures': 0}
+_stats_lock = threading.Lock()
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    return dict(stats, breakers={model_id: b.state for model_id, b in _breakers.items()})
+
+def reset():
+    """Clears metrics and breaker state."""
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+    with _breakers_lock:
+        _breakers.clear()
+
+# --- Invocation ---
+
+def is_retryable(error):
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES
+    return isinstance(error, (ReadTimeoutError, ConnectTimeoutError, EndpointConnectionError))
+
+def _close_response(future):
+    """Done-callback for an abandoned call: closes a streaming response's event stream."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    response = future.result()
+    stream = response.get('stream') if isinstance(response, dict) else None
+    if stream is not None and hasattr(stream, 'close'):
+        try:
+            stream.close()
+        except Exception as e:
+            print(f"Failed to close abandoned model stream: {e}")
+
+def _abandon(futures):
+    """Cancels calls not yet started; the others release their response when they finish."""
+    for future in futures:
+        if not future.cancel():
+            future.add_done_callback(_close_response)
+
+def _hedged_attempt(call, model_id, deadline):
+    """One attempt; sends a duplicate after HEDGE_AFTER_MS and returns the first success."""
+    hedge_at = time.monotonic() + HEDGE_AFTER_MS / 1000 if HEDGE_AFTER_MS > 0 else None
+    primary = _pool.submit(call, model_id)
+    pending = {primary}
+    last_error = None
+
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            # The losing calls would otherwise hold their pooled connections
+            _abandon(pending)
+            raise DeadlineExceeded(f"{model_id} did not answer before the deadline")
+        wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+        done, pending = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    _count('hedge_wins')
+                _abandon((done | pending) - {future})
+                return future.result()
+            last_error = future.exception()
+
+        if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+            pending.add(_pool.submit(call, model_id))
+            hedge_at = None
+            _count('hedges')
+
+    raise last_error
+
+def invoke(call, model_ids, deadline=None, info=None):
+    """
+    Runs call(model_id) against each model in order until one succeeds.
+
+    :param call: Function taking a model ID and returning the raw response.
+    :param model_ids: Primary model first, then fallbacks.
+    :param deadline: Absolute time.monotonic() deadline (default: see call_deadline).
+    :param info: Optional dict that receives 'retries', 'fallback' and 'outcome'
+                 ('ok', 'timeout', 'failed' or 'breaker_open') for this call.
+    :return: (response, model_id) or (None, None).
+    """
+    deadline = call_deadline(deadline)
+    _count('calls')
+    info = info if info is not None else {}
+    info.update(retries=0, fallback=False, outcome='failed')
+    skipped = 0
+
+    for index, model_id in enumerate(model_ids):
+        breaker = get_breaker(model_id)
+        if not breaker.allow():
+            _count('breaker_skips')
+            skipped += 1
+            print(f"Circuit open for {model_id}, skipping")
+            continue
+
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = _hedged_attempt(call, model_id, deadline)
+                breaker.record_success()
+                if index > 0:
+                    _count('fallbacks')
+                info.update(fallback=index > 0, outcome='ok')
+                return response, model_id
+            except DeadlineExceeded as e:
+                breaker.record_failure()
+                _count('timeouts')
+                print(f"Model call timed out: {e}")
+                info['outcome'] = 'timeout'
+                return None, None
+            except Exception as e:
+                if not is_retryable(e):
+                    # Request problem, not model health: do not trip the breaker, but free a
+                    # half-open trial slot so the breaker can still close
+                    breaker.release_trial()
+                    print(f"Model call failed ({model_id}): {e}")
+                    break
+                if attempt == MAX_RETRIES:
+                    breaker.record_failure()
+                    print(f"Model call failed after {attempt + 1} attempts ({model_id}): {e}")
+                    break
+                # Full jitter backoff, never past the deadline
+                backoff = random.uniform(0, min(RETRY_CAP_MS, RETRY_BASE_MS * 2 ** attempt)) / 1000
+                if time.monotonic() + backoff >= deadline:
+                    breaker.record_failure()
+                    break
+                _count('retries')
+                info['retries'] += 1
+                time.sleep(backoff)
+
+    _count('failures')
+    if skipped == len(model_ids):
+        info['outcome'] = 'breaker_open'
+    return None, None
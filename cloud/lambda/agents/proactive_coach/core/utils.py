@@ -1,6 +1,7 @@
 import json
+import math
 from decimal import Decimal
-from statistics import mean, stdev
+from .series import HealthSeries
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
@@ -8,9 +9,138 @@ class DecimalEncoder(json.JSONEncoder):
             return float(o)
         return super(DecimalEncoder, self).default(o)
 
+class RunningStats:
+    """
+    Single-pass (Welford) accumulator for count, mean and sample variance.
+    Avoids re-scanning a growing window every time a sample is added.
+    """
+    __slots__ = ('count', 'mean', '_m2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        # Sample variance, matching statistics.variance / stdev
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+def from_dynamo(value):
+    """
+    Converts a DynamoDB item to native Python values in a single pass: integral
+    Decimals become int, other Decimals float, number/string sets lists.
+    Containers without Decimals are returned as-is (no copy), so normalizing an
+    already-native payload is free.
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        converted = None
+        for key, item in value.items():
+            native = from_dynamo(item)
+            if native is not item:
+                if converted is None:
+                    converted = dict(value)
+                converted[key] = native
+        return value if converted is None else converted
+    if isinstance(value, list):
+        converted = None
+        for i, item in enumerate(value):
+            native = from_dynamo(item)
+            if native is not item:
+                if converted is None:
+                    converted = list(value)
+                converted[i] = native
+        return value if converted is None else converted
+    if isinstance(value, (set, frozenset)):
+        return [from_dynamo(item) for item in value]
+    return value
+
+def to_float(value):
+    """Converts a DynamoDB Decimal (or any number) to float, passing None through."""
+    if value is None:
+        return None
+    return float(value)
+
+def iter_adaptive_aggregate(data_items, min_window_ms=300000, max_window_ms=3600000, threshold=5.0, target_metric='heart_rate', metrics=('heart_rate', 'hrv', 'sleep_score')):
+    """
+    Streaming version of adaptive_aggregate_data.
+    Consumes any iterable of items (e.g. DynamoDB query pages as they arrive) in
+    a single pass and yields each aggregated window as soon as it closes.
+
+    Items MUST already be in ascending timestamp order (DynamoDB returns
+    range-key order by default). Running mean/variance is kept per window, so
+    each sample is visited once and converted from Decimal once.
+
+    :param data_items: Iterable of raw data dicts, sorted by timestamp.
+    :return: Generator of aggregated dicts (same shape as adaptive_aggregate_data).
+    """
+    metrics = list(metrics)
+    keys = metrics if target_metric in metrics else metrics + [target_metric]
+
+    window_start_ts = None
+    last_ts = None
+    target_stats = None
+    metric_stats = None
+
+    for item in data_items:
+        ts = item.get('timestamp', 0)
+
+        if window_start_ts is None:
+            window_start_ts = ts
+            target_stats = RunningStats()
+            metric_stats = {key: RunningStats() for key in metrics}
+
+        # Convert each Decimal exactly once per item
+        values = {key: to_float(item.get(key)) for key in keys}
+        for key in metrics:
+            v = values[key]
+            if v is not None:
+                metric_stats[key].add(v)
+
+        # Extract target value for volatility check
+        target_val = values[target_metric]
+        if target_val is not None:
+            target_stats.add(target_val)
+
+        last_ts = ts
+        duration = ts - window_start_ts
+
+        # 1. If we haven't reached min_window, keep adding
+        if duration < min_window_ms:
+            continue
+
+        # 2. Close at max_window, or early on high volatility (only with enough data points)
+        if duration >= max_window_ms or (target_stats.count > 2 and target_stats.stdev > threshold):
+            yield _finalize_window(window_start_ts, last_ts, metric_stats)
+            window_start_ts = None
+
+    if window_start_ts is not None:
+        yield _finalize_window(window_start_ts, last_ts, metric_stats)
+
+def _finalize_window(start_ts, end_ts, metric_stats):
+    agg_item = {'timestamp': start_ts}
+    for key, stats in metric_stats.items():
+        agg_item[key] = stats.mean if stats.count else None
+    # Add duration for debug/context
+    agg_item['window_duration_min'] = (end_ts - start_ts) / 60000
+    return agg_item
+
 def adaptive_aggregate_data(data_items, min_window_ms=300000, max_window_ms=3600000, threshold=5.0, target_metric='heart_rate', metrics=['heart_rate', 'hrv', 'sleep_score']):
     """
     Aggregates data using adaptive time windows based on volatility of a target metric.
+    Runs on the vectorized HealthSeries engine; use iter_adaptive_aggregate to stream.
     - Steady data (low stdev) -> Larger windows (up to max_window_ms).
     - Volatile data (high stdev) -> Smaller windows (down to min_window_ms).
     
@@ -25,157 +155,93 @@ def adaptive_aggregate_data(data_items, min_window_ms=300000, max_window_ms=3600
     if not data_items:
         return []
 
-    sorted_data = sorted(data_items, key=lambda x: x.get('timestamp', 0))
-    results = []
-    
-    n = len(sorted_data)
-    batch_start_idx = 0
-    
-    while batch_start_idx < n:
-        batch_values_target = []
-        batch_items = []
-        
-        batch_start_ts = sorted_data[batch_start_idx].get('timestamp', 0)
-        
-        current_idx = batch_start_idx
-        
-        while current_idx < n:
-            item = sorted_data[current_idx]
-            ts = item.get('timestamp', 0)
-            
-            # Extract target value for volatility check
-            val = item.get(target_metric)
-            if val is not None:
-                if isinstance(val, Decimal): val = float(val)
-                batch_values_target.append(val)
-            
-            batch_items.append(item)
-            
-            duration = ts - batch_start_ts
-            
-            # Check constraints
-            # 1. If we haven't reached min_window, keep adding (unless we hit end)
-            if duration < min_window_ms:
-                current_idx += 1
-                continue
-                
-            # 2. If we reached max_window, stop here
-            if duration >= max_window_ms:
-                current_idx += 1
-                break
-                
-            # 3. Check Volatility (only if we have enough data points)
-            if len(batch_values_target) > 2:
-                try:
-                    volatility = stdev(batch_values_target)
-                except:
-                    volatility = 0
-                
-                if volatility > threshold:
-                    # High volatility detected! Close this kernel now to keep it small/detailed.
-                    current_idx += 1
-                    break
-            
-            # If stable, continue expanding this kernel
-            current_idx += 1
-            
-        # Finalize aggregation for this batch
-        agg_item = {'timestamp': batch_start_ts}
-        
-        # Calculate means for all requested metrics
-        for key in metrics:
-            values = []
-            for item in batch_items:
-                v = item.get(key)
-                if v is not None:
-                    if isinstance(v, Decimal): v = float(v)
-                    values.append(v)
-            
-            agg_item[key] = mean(values) if values else None
-        
-        # Add duration for debug/context
-        agg_item['window_duration_min'] = (sorted_data[current_idx-1]['timestamp'] - batch_start_ts) / 60000
-            
-        results.append(agg_item)
-        
-        # Advance
-        batch_start_idx = current_idx
-        
-    return results
-
-def aggregate_data_by_window(data_items, window_ms=3600000, metrics=['heart_rate', 'hrv', 'sleep_score']):
+    columns = list(metrics) if target_metric in metrics else list(metrics) + [target_metric]
+    return HealthSeries.from_items(data_items, columns).adaptive_windows(
+        min_window_ms=min_window_ms,
+        max_window_ms=max_window_ms,
+        threshold=threshold,
+        target_metric=target_metric,
+        metrics=metrics
+    )
+
+def aggregate_data_by_window(data_items, window_ms=3600000, metrics=['heart_rate', 'hrv', 'sleep_score'], aligned=False):
     """
     Aggregates a list of data items into time windows.
     
     :param data_items: List of dicts containing 'timestamp' and metric values.
     :param window_ms: Window size in milliseconds (default: 1 hour).
     :param metrics: List of keys to aggregate (calculate mean).
+    :param aligned: Align windows to a global window_ms grid instead of starting at the first item.
     :return: List of aggregated dicts.
     """
     if not data_items:
         return []
 
-    # Sort by timestamp
-    sorted_data = sorted(data_items, key=lambda x: x.get('timestamp', 0))
-    
-    aggregated_results = []
-    current_window_start = sorted_data[0]['timestamp']
-    current_window_end = current_window_start + window_ms
-    
-    current_batch = {key: [] for key in metrics}
-    current_batch_count = 0
-    
-    for item in sorted_data:
-        ts = item.get('timestamp', 0)
-        
-        # If item is outside current window, process the batch and start a new one
-        if ts >= current_window_end:
-            # Finalize current window
-            agg_item = {'timestamp': current_window_start}
-            for key in metrics:
-                values = current_batch[key]
-                if values:
-                    agg_item[key] = mean(values)
-                else:
-                    agg_item[key] = None # Or keep it missing
-            
-            if current_batch_count > 0:
-                aggregated_results.append(agg_item)
-            
-            # Reset for next window(s)
-            # Handle gaps: simple approach, jump to next item's window
-            current_window_start = ts - (ts % window_ms) # Align to grid if preferred, or just use ts
-            # Or strictly follow windows:
-            # while ts >= current_window_end:
-            #    current_window_start += window_ms
-            #    current_window_end += window_ms
-            
-            # Let's just start the new window at the current item for simplicity in this version
-            current_window_start = ts
-            current_window_end = current_window_start + window_ms
-            current_batch = {key: [] for key in metrics}
-            current_batch_count = 0
-        
-        # Add item to current batch
+    return HealthSeries.from_items(data_items, metrics).fixed_windows(window_ms=window_ms, metrics=metrics, aligned=aligned)
+
+def rollups_to_items(rollups, metrics=('heart_rate', 'hrv', 'sleep_score')):
+    """
+    Converts rollup buckets into per-bucket mean items ({'timestamp', metric: mean}),
+    the same shape as raw health items, so they can feed the aggregation helpers.
+    Buckets without stats for any of the metrics are skipped.
+    """
+    items = []
+    for row in rollups:
+        stats = row.get('stats') or {}
+        item = {'timestamp': int(row.get('bucket_ts', 0))}
         for key in metrics:
-            val = item.get(key)
-            if val is not None:
-                # Handle Decimal from DynamoDB
-                if isinstance(val, Decimal):
-                    val = float(val)
-                current_batch[key].append(val)
-        current_batch_count += 1
-
-    # Process the final batch
-    agg_item = {'timestamp': current_window_start}
-    for key in metrics:
-        values = current_batch[key]
-        if values:
-            agg_item[key] = mean(values)
-        else:
-            agg_item[key] = None
-    
-    if current_batch_count > 0:
-        aggregated_results.append(agg_item)
-        
-    return aggregated_results
+            s = stats.get(key)
+            if s and s.get('count'):
+                item[key] = float(s['sum']) / float(s['count'])
+        if len(item) > 1:
+            items.append(item)
+    return items
+
+def rollup_gap(rollups, start_ts, end_ts, bucket_ms):
+    """
+    Range at the start of a window that the rollup buckets do not cover, to be read from
+    raw samples: the whole window without buckets, or the head before the first bucket
+    when the window is only partly rolled up (e.g. right after deploy or during a backfill).
+
+    :return: (start_ts, end_ts) inclusive, or None if the buckets cover the window.
+    """
+    if not rollups:
+        return start_ts, end_ts
+    first_ts = min(int(row.get('bucket_ts', 0)) for row in rollups)
+    if first_ts >= start_ts + bucket_ms:
+        return start_ts, first_ts - 1
+    return None
+
+def rollup_stats(rollups, metric):
+    """
+    Combines rollup buckets into overall stats for one metric.
+
+    :return: Dict with count, mean, stdev, min, max (None if no samples).
+    """
+    count = 0
+    total = 0.0
+    total_sq = 0.0
+    lo = None
+    hi = None
+    for row in rollups:
+        s = (row.get('stats') or {}).get(metric)
+        if not s or not s.get('count'):
+            continue
+        count += int(s['count'])
+        total += float(s['sum'])
+        total_sq += float(s['sumsq'])
+        lo = float(s['min']) if lo is None else min(lo, float(s['min']))
+        hi = float(s['max']) if hi is None else max(hi, float(s['max']))
+
+    if not count:
+        return None
+    avg = total / count
+    variance = (total_sq - count * avg * avg) / (count - 1) if count > 1 else 0.0
+    return {
+        'count': count,
+        'mean': avg,
+        'stdev': math.sqrt(max(variance, 0.0)),
+        'min': lo,
+        'max': hi
+    }
+
@@ -0,0 +1,218 @@
+"""
+Compact statistical daily summary for the coach prompt.
+
+Replaces the JSON dump of the last 20 raw health items (thousands of tokens of
+repeated keys, covering only the last minutes) with per-metric statistics over
+the last SUMMARY_HOURS, built from the 5-minute rollups maintained at ingest
+(<= 288 rows per day; raw samples cover the part of the window without rollups):
+- mean / min / max and a least-squares trend slope (per hour) for every gauge metric,
+- steps taken over the window (step_count is a cumulative counter, see step_total),
+- minutes per heart-rate zone (HR_ZONE_BOUNDS, from 5-minute bucket means),
+- stress-score distribution (share of buckets low / mid / high),
+- sleep score (mean and latest).
+The text format is fixed (one line per item, metrics in SUMMARY_METRICS order),
+so identical days give identical prompts.
+"""
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from core import database
+from core.utils import rollup_gap, rollup_stats
+
+SUMMARY_HOURS = int(os.environ.get('COACH_SUMMARY_HOURS', '24'))
+ROLLUP_RESOLUTION = '5m'
+BUCKET_MS = 300000
+# Parallel sub-range queries for the raw-sample fallback
+RANGE_QUERY_SEGMENTS = int(os.environ.get('RANGE_QUERY_SEGMENTS', '4'))
+
+# Canonical metric name (as in the rollups) -> keys it may arrive under in raw samples
+SUMMARY_METRICS = {
+    'heart_rate': ('heart_rate', 'heartRate'),
+    'hrv': ('hrv', 'hrvRMSSD'),
+    'spo2': ('spo2',),
+    'body_temp': ('body_temp', 'bodyTemperature'),
+    'stress_score': ('stress_score', 'stressScore'),
+    'sleep_score': ('sleep_score', 'sleepScore'),
+    'step_count': ('step_count', 'stepCount'),
+}
+
+# Cumulative counters: summarised as the amount over the window, not as gauge statistics
+COUNTER_METRICS = ('step_count',)
+
+# Upper bounds (bpm) of the heart-rate zones; the last zone is open-ended
+HR_ZONE_BOUNDS = (60, 100, 120, 140, 160)
+# Upper bounds of the low and mid stress-score bands; above is high
+STRESS_BANDS = (('low', 30), ('mid', 60), ('high', None))
+
+def _is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+def samples_to_buckets(items):
+    """Raw health samples as single-sample rollup buckets ({bucket_ts, stats})."""
+    buckets = []
+    for item in items:
+        stats = {}
+        for metric, aliases in SUMMARY_METRICS.items():
+            value = next((item[alias] for alias in aliases if _is_number(item.get(alias))), None)
+            if value is None:
+                continue
+            value = float(value)
+            stats[metric] = {'count': 1, 'sum': value, 'sumsq': value * value, 'min': value, 'max': value}
+        if stats:
+            buckets.append({'bucket_ts': int(item.get('timestamp', 0)), 'stats': stats})
+    return buckets
+
+def load_buckets(user_id, now=None):
+    """Rollup buckets of the summary window; the part they do not cover is read from raw samples."""
+    now = now or datetime.now()
+    end_ts = int(now.timestamp() * 1000)
+    start_ts = int((now - timedelta(hours=SUMMARY_HOURS)).timestamp() * 1000)
+
+    buckets = database.get_rollups(user_id, ROLLUP_RESOLUTION, start_ts, end_ts)
+    gap = rollup_gap(buckets, start_ts, end_ts, BUCKET_MS)
+    if not gap:
+        return buckets
+    attributes = ['timestamp'] + [alias for aliases in SUMMARY_METRICS.values() for alias in aliases]
+    samples = database.get_health_data_range(user_id, gap[0], gap[1], attributes=attributes, segments=RANGE_QUERY_SEGMENTS)
+    return samples_to_buckets(samples) + list(buckets)
+
+def _bucket_means(buckets, metric):
+    """[(hours since the first bucket, bucket mean)] for one metric, in time order."""
+    points = []
+    for row in sorted(buckets, key=lambda r: int(r.get('bucket_ts', 0))):
+        s = (row.get('stats') or {}).get(metric)
+        if s and s.get('count'):
+            points.append((int(row['bucket_ts']), float(s['sum']) / float(s['count'])))
+    if not points:
+        return []
+    first_ts = points[0][0]
+    return [((ts - first_ts) / 3600000, mean) for ts, mean in points]
+
+def trend_slope(points):
+    """Least-squares slope (units per hour) of [(hours, value)], 0.0 for fewer than two distinct times."""
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+def _zone_label(index):
+    if index == 0:
+        return f"<{HR_ZONE_BOUNDS[0]}"
+    if index == len(HR_ZONE_BOUNDS):
+        return f">={HR_ZONE_BOUNDS[-1]}"
+    return f"{HR_ZONE_BOUNDS[index - 1]}-{HR_ZONE_BOUNDS[index]}"
+
+def hr_zone_minutes(points):
+    """
+    Minutes per heart-rate zone. Each point's value holds until the next point, for at
+    most one bucket (5 minutes), so gaps in wear time are not counted.
+    """
+    cap_h = BUCKET_MS / 3600000
+    minutes = {_zone_label(i): 0.0 for i in range(len(HR_ZONE_BOUNDS) + 1)}
+    for i, (hours, hr) in enumerate(points):
+        duration_h = min(points[i + 1][0] - hours, cap_h) if i + 1 < len(points) else cap_h
+        index = next((z for z, bound in enumerate(HR_ZONE_BOUNDS) if hr < bound), len(HR_ZONE_BOUNDS))
+        minutes[_zone_label(index)] += duration_h * 60
+    return {zone: int(round(m)) for zone, m in minutes.items()}
+
+def stress_distribution(points):
+    """Share (percent) of points per stress band."""
+    counts = {band: 0 for band, _ in STRESS_BANDS}
+    for _, score in points:
+        band = next(band for band, bound in STRESS_BANDS if bound is None or score < bound)
+        counts[band] += 1
+    total = sum(counts.values())
+    return {band: int(round(100 * c / total)) for band, c in counts.items()} if total else {}
+
+def step_total(buckets):
+    """
+    Steps taken over the window from the cumulative step counter: its rise within each
+    run of buckets, restarting at a counter reset (new day, watch reboot), so a reset
+    never counts as negative steps.
+
+    :return: Steps as int, or None without step data.
+    """
+    total = 0.0
+    start = last = None
+    for row in sorted(buckets, key=lambda r: int(r.get('bucket_ts', 0))):
+        s = (row.get('stats') or {}).get('step_count')
+        if not s or not s.get('count'):
+            continue
+        low, high = float(s['min']), float(s['max'])
+        if last is None:
+            start, last = low, high
+        elif low < last:
+            # Counter reset: close the previous run; a bucket spanning the reset only
+            # contributes from its low value on
+            total += last - start
+            start = last = low
+        else:
+            last = max(last, high)
+    if last is None:
+        return None
+    return int(round(total + last - start))
+
+def build_summary(buckets):
+    """
+    Computes the daily statistics from rollup buckets.
+
+    :param buckets: Rollup items ({bucket_ts, stats: {metric: {count, sum, sumsq, min, max}}}).
+    :return: Summary dict (plain numbers, stable key order); see format_summary.
+    """
+    summary = {'hours': SUMMARY_HOURS, 'buckets': len(buckets), 'metrics': {}}
+    for metric in SUMMARY_METRICS:
+        if metric in COUNTER_METRICS:
+            continue
+        stats = rollup_stats(buckets, metric)
+        if not stats:
+            continue
+        summary['metrics'][metric] = {
+            'mean': round(stats['mean'], 1),
+            'min': round(stats['min'], 1),
+            'max': round(stats['max'], 1),
+            'slope_h': round(trend_slope(_bucket_means(buckets, metric)), 2),
+            'n': stats['count']
+        }
+
+    hr_points = _bucket_means(buckets, 'heart_rate')
+    if hr_points:
+        summary['hr_zones_min'] = hr_zone_minutes(hr_points)
+    stress_points = _bucket_means(buckets, 'stress_score')
+    if stress_points:
+        summary['stress_pct'] = stress_distribution(stress_points)
+    steps = step_total(buckets)
+    if steps is not None:
+        summary['steps'] = steps
+    sleep_points = _bucket_means(buckets, 'sleep_score')
+    if sleep_points:
+        summary['sleep_score'] = {
+            'mean': round(sum(v for _, v in sleep_points) / len(sleep_points)),
+            'last': round(sleep_points[-1][1])
+        }
+    return summary
+
+def _number(value):
+    return f"{value:g}"
+
+def format_summary(summary):
+    """Fixed compact text format of a build_summary result."""
+    if not summary['metrics'] and 'steps' not in summary:
+        return f"last {summary['hours']}h: no data"
+    lines = [f"last {summary['hours']}h, {summary['buckets']} buckets; metric: mean min max slope/h (samples)"]
+    for metric, s in summary['metrics'].items():
+        lines.append(f"{metric}: {_number(s['mean'])} {_number(s['min'])} {_number(s['max'])} {s['slope_h']:+g} ({s['n']})")
+    if 'hr_zones_min' in summary:
+        lines.append("hr_zone_minutes: " + ' '.join(f"{zone}:{m}" for zone, m in summary['hr_zones_min'].items()))
+    if 'stress_pct' in summary:
+        lines.append("stress_pct: " + ' '.join(f"{band}:{pct}" for band, pct in summary['stress_pct'].items()))
+    if 'steps' in summary:
+        lines.append(f"steps: {summary['steps']}")
+    if 'sleep_score' in summary:
+        lines.append(f"sleep_score: mean {summary['sleep_score']['mean']} last {summary['sleep_score']['last']}")
+    return '\n'.join(lines)
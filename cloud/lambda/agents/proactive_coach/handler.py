@@ -1,64 +1,162 @@
 import json
-from core import database, llm
+import time
+from core import database, llm, resilience, routing
 from core.utils import DecimalEncoder
 from core.llm import INTERVENTION_TOOL_SCHEMA
+import batch
+import daily_summary
+import scheduler
+import watermark
+
+# Static prefix (cached with the tool spec); the persona follows it, the summary goes into the user message
+SYSTEM_PROMPT = """You are a Health Coach for a Tamagotchi-like health companion.
+Your goal is to analyze the user's daily summary and decide if an intervention is needed.
+Follow the coach persona below for style, goals and tone.
+
+The daily summary covers the last 24 hours:
+- one line per metric: mean, min, max, trend slope per hour and sample count,
+- steps: steps taken over the window,
+- hr_zone_minutes: minutes spent per heart-rate zone (bpm),
+- stress_pct: share of the day with low (<30), mid (30-60) and high (>=60) stress score,
+- sleep_score: mean and latest sleep score.
+
+Based on the daily summary, call the 'proactive_coach_intervention' tool to recommend an intervention or indicate none is needed.
+"""
+COACH_TEMPERATURE = 0.7
 
 def handler(event, context):
     """
     Lambda handler for the Proactive Coach.
-    Iterates through active users and runs the Coach Model for each.
+    A scheduled invocation plans the run and fans it out as one worker invocation per
+    shard of users; an invocation with a 'coach_shard' coaches that shard (see scheduler).
+    Users are coached on a bounded-concurrency worker pool (see coach_pool).
+    In batch mode (COACH_MODE=batch) the run is submitted as one Bedrock batch inference
+    job instead; every scheduled invocation first collects finished jobs (see batch).
     """
     print(f"Received event: {json.dumps(event)}")
-    print("Starting Proactive Coach Loop")
-
-    # Get all users
-    users = database.get_all_users()
-    print(f"Running Coach for {len(users)} users.")
-    
-    results = []
-    
-    for user in users:
-        user_id = user.get('user_id')
-        if not user_id:
-            continue
-
-        print(f"Coaching User: {user_id}")
-        
-        history = database.get_recent_history(user_id, limit=20)
-        summary_str = json.dumps(history, cls=DecimalEncoder)
-        
-        # Extract user profile data for persona injection
-        motivation_style = user.get('motivation_style', 'Proactive')
-        goals = ', '.join(user.get('goals', ['overall health']))
-        preferred_tone = user.get('preferred_tone', 'supportive')
-        
-        system_prompt = f"""You are a {motivation_style} Health Coach for a Tamagotchi-like health companion.
-Your goal is to analyze the user's daily summary and decide if an intervention is needed.
-The user's primary health goals include: {goals}.
-When providing advice or interventions, use a {preferred_tone} tone.
+    deadline = resilience.start_invocation(context)
+    function_name = getattr(context, 'function_name', None)
 
-Based on the daily summary, call the 'proactive_coach_intervention' tool to recommend an intervention or indicate none is needed.
-"""
+    shard = event.get('coach_shard')
+    if shard:
+        print(f"Starting Proactive Coach shard {shard['run_id']}#{shard['shard']}")
+        summary = scheduler.run_shard(shard['run_id'], shard['shard'], coach_user, deadline, function_name)
+    elif event.get('coach_batch_collect'):
+        summary = {'batch_collected': batch.collect_open_jobs(finish_user, deadline)}
+    else:
+        print("Starting Proactive Coach Loop")
+        run_id = scheduler.new_run_id(event)
+        summary = {'batch_collected': batch.collect_open_jobs(finish_user, deadline)} if batch.BATCH_MODE else {}
+        if batch.BATCH_MODE:
+            summary.update(batch.run(run_id, prepare_user, coach_prepared, build_model_input, deadline))
+        else:
+            summary.update(scheduler.plan(run_id, coach_user, deadline, function_name))
+
+    print(json.dumps({'llm_routes': routing.get_report()}))
+    return {'statusCode': 200, 'body': json.dumps(summary, cls=DecimalEncoder)}
+
+def prepare_user(user):
+    """
+    Builds one user's coach request; users without new samples or with an unchanged
+    summary are skipped (see watermark).
+
+    :return: {'user', 'skipped': reason} for a skipped user, otherwise the request:
+             {'user_id', 'persona', 'user_message', 'latest_ts', 'digest'}.
+    """
+    user_id = user['user_id']
+    now_ms = int(time.time() * 1000)
+
+    latest = database.get_last_health_reading(user_id)
+    latest_ts = latest.get('timestamp') if latest else None
+    if not watermark.has_new_samples(user, latest_ts):
+        return skip_user(user_id, watermark.NO_NEW_SAMPLES, now_ms)
+
+    summary = daily_summary.build_summary(daily_summary.load_buckets(user_id))
+    digest = watermark.summary_digest(summary)
+    if watermark.is_unchanged(user, digest, has_data=bool(summary['metrics'] or summary.get('steps'))):
+        return skip_user(user_id, watermark.UNCHANGED_SUMMARY, now_ms, latest_ts)
+
+    summary_str = daily_summary.format_summary(summary)
+
+    # Extract user profile data for persona injection
+    motivation_style = user.get('motivation_style', 'Proactive')
+    goals = ', '.join(user.get('goals', ['overall health']))
+    preferred_tone = user.get('preferred_tone', 'supportive')
+
+    persona = f"""Coach Persona:
+- Style: You are a {motivation_style} Health Coach.
+- The user's primary health goals include: {goals}.
+- When providing advice or interventions, use a {preferred_tone} tone."""
+
+    user_message = f"""Daily Summary for {user_id}:
+{summary_str}
+
+Analyze this summary and suggest an intervention if needed."""
+    return {'user_id': user_id, 'persona': persona, 'user_message': user_message, 'latest_ts': latest_ts, 'digest': digest}
+
+def build_model_input(request):
+    """The request as a batch inference record body (see batch.model_input)."""
+    return batch.model_input(SYSTEM_PROMPT, request['user_message'], INTERVENTION_TOOL_SCHEMA,
+                             temperature=COACH_TEMPERATURE, system_context=request['persona'])
+
+def coach_prepared(request, deadline=None):
+    """Runs the coach model for a prepared request and records the outcome."""
+    print(f"Coaching User: {request['user_id']}")
+    analysis = llm.invoke_model_structured(
+        SYSTEM_PROMPT, request['user_message'], INTERVENTION_TOOL_SCHEMA,
+        temperature=COACH_TEMPERATURE, deadline=deadline, system_context=request['persona']
+    )
+    return finish_user(request, analysis)
+
+def coach_user(user, deadline=None):
+    """
+    Coaches one user (runs in a coach_pool worker).
+
+    :param deadline: Absolute time.monotonic() deadline for this user's model call.
+    :return: The suggested intervention, {'user', 'skipped': reason} for a skipped user,
+             or None if no intervention is needed.
+    :raises RuntimeError: If no model answered (the user is retried with the shard).
+    """
+    request = prepare_user(user)
+    if request.get('skipped'):
+        return request
+    return coach_prepared(request, deadline)
+
+def finish_user(request, analysis):
+    """
+    Records a coach answer (synchronous or from a batch job) for a prepared request.
+
+    :return: The suggested intervention, or None if none is needed.
+    :raises RuntimeError: If there is no answer.
+    """
+    user_id = request['user_id']
+    if analysis is None:
+        raise RuntimeError(f"No coach answer for {user_id}")
+
+    now_ms = int(time.time() * 1000)
+    database.update_coach_watermark(user_id, {
+        'coach_watermark_ts': request['latest_ts'],
+        'coach_summary_digest': request['digest'],
+        'coached_at': now_ms,
+        'coach_checked_at': now_ms,
+        'coach_skip_reason': None
+    })
+
+    if analysis.get('intervention') != 'NONE':
+        # TODO: Implement actual push notification
+        print(f"Intervention Suggested for {user_id}: {analysis['intervention']} - {analysis['reasoning']}")
+        return {
+            'user': user_id,
+            'intervention': analysis['intervention'],
+            'reasoning': analysis['reasoning']
+        }
+    return None
 
-        user_message = f"""
-        Daily Summary for {user_id}:
-        {summary_str}
-        
-        Analyze this summary and suggest an intervention if needed.
-        """
-        try:
-            analysis = llm.invoke_model_structured(system_prompt, user_message, INTERVENTION_TOOL_SCHEMA, temperature=0.7)
-            
-            if analysis and analysis.get('intervention') != 'NONE':
-                # TODO: Implement actual push notification
-                print(f"Intervention Suggested for {user_id}: {analysis['intervention']} - {analysis['reasoning']}")
-                results.append({
-                    'user': user_id,
-                    'intervention': analysis['intervention'],
-                    'reasoning': analysis['reasoning']
-                })
-                
-        except Exception as e:
-            print(f"Failed to coach user {user_id}: {e}")
-            
-    return {'statusCode': 200, 'body': json.dumps({'results': results}, cls=DecimalEncoder)}
\ No newline at end of file
+def skip_user(user_id, reason, now_ms, latest_ts=None):
+    """Records why a user was not coached this run (and advances the watermark past seen samples)."""
+    print(f"Skipping User: {user_id} ({reason})")
+    fields = {'coach_skip_reason': reason, 'coach_checked_at': now_ms}
+    if latest_ts is not None:
+        fields['coach_watermark_ts'] = latest_ts
+    database.update_coach_watermark(user_id, fields)
+    return {'user': user_id, 'skipped': reason}
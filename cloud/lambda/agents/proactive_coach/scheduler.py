@@ -0,0 +1,115 @@
+"""
+Two-level scheduler for the hourly coach run.
+
+Planner (scheduled invocation): reads all user IDs with a parallel segmented Scan,
+splits them into shards of at most COACH_SHARD_SIZE users, records every shard in
+the coach_runs tracker and dispatches one asynchronous coach worker per shard. A
+single shard is coached inline, without the extra invocation.
+
+Worker (invocation with a 'coach_shard'): claims its shard, coaches the users not
+yet marked done on the coach_pool and marks each user done as soon as it is
+coached. A shard that did not finish (deadline, failed users) is re-dispatched up
+to COACH_SHARD_MAX_ATTEMPTS times; the retry only coaches the users still pending.
+
+Shards run in parallel, so the hourly run time depends on the shard size, not on
+the number of users.
+"""
+import os
+import time
+
+from core import actions, database
+import coach_pool
+
+COACH_SHARD_SIZE = int(os.environ.get('COACH_SHARD_SIZE', '40'))
+COACH_SCAN_SEGMENTS = int(os.environ.get('COACH_SCAN_SEGMENTS', '4'))
+COACH_SHARD_MAX_ATTEMPTS = int(os.environ.get('COACH_SHARD_MAX_ATTEMPTS', '3'))
+
+# Shard statuses (see database.create_shard / claim_shard)
+COMPLETE = 'complete'
+RETRYING = 'retrying'
+FAILED = 'failed'
+
+def split_shards(user_ids, shard_size=COACH_SHARD_SIZE):
+    """Consecutive chunks of at most shard_size user IDs."""
+    shard_size = max(1, shard_size)
+    return [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+
+def plan(run_id, coach_user, deadline=None, function_name=None):
+    """
+    Plans a coach run and dispatches its shards.
+
+    :param run_id: Unique ID of the run (the schedule event ID, so a retried planner is idempotent).
+    :param coach_user: Function (user, deadline) -> result or None, used for an inline shard.
+    :param function_name: Coach function the shard workers are dispatched to.
+    :return: Summary dict of the run.
+    """
+    user_ids = database.scan_user_ids(COACH_SCAN_SEGMENTS)
+    shards = split_shards(user_ids)
+    print(f"Coach run {run_id}: {len(user_ids)} users in {len(shards)} shards")
+
+    for shard, shard_user_ids in enumerate(shards):
+        database.create_shard(run_id, shard, shard_user_ids)
+
+    if len(shards) == 1 or not function_name:
+        # Nothing to fan out to: coach the shards here
+        results = [run_shard(run_id, shard, coach_user, deadline, function_name) for shard in range(len(shards))]
+        return {'run_id': run_id, 'users': len(user_ids), 'shards': len(shards), 'inline': results}
+
+    dispatched = sum(actions.invoke_coach_shard(function_name, run_id, shard) for shard in range(len(shards)))
+    return {'run_id': run_id, 'users': len(user_ids), 'shards': len(shards), 'dispatched': dispatched}
+
+def run_shard(run_id, shard, coach_user, deadline=None, function_name=None):
+    """
+    Coaches the pending users of one shard and records progress.
+
+    :return: Summary dict of this attempt (status, coached, remaining, results).
+    """
+    item = database.claim_shard(run_id, shard)
+    if not item:
+        return {'run_id': run_id, 'shard': shard, 'status': FAILED, 'error': 'unknown shard'}
+
+    done = set(item.get('done_users') or [])
+    pending = [user_id for user_id in item.get('user_ids', []) if user_id not in done]
+    attempt = int(item.get('attempts') or 1)
+    print(f"Coach shard {run_id}#{shard} attempt {attempt}: {len(pending)} pending, {len(done)} already coached")
+
+    coached = []
+
+    def coach_and_record(user, user_deadline):
+        result = coach_user(user, user_deadline)
+        # Recorded per user, so a crashed or timed-out attempt keeps its progress
+        database.mark_users_coached(run_id, shard, [user['user_id']])
+        coached.append(user['user_id'])
+        return result
+
+    results, _ = coach_pool.run(database.get_users(pending), coach_and_record, deadline=deadline)
+
+    remaining = len(pending) - len(coached)
+    if not remaining:
+        status = COMPLETE
+    elif attempt < COACH_SHARD_MAX_ATTEMPTS and function_name and actions.invoke_coach_shard(function_name, run_id, shard):
+        status = RETRYING
+    else:
+        status = FAILED
+    database.set_shard_status(run_id, shard, status)
+
+    # Skipped users (see watermark) count as done but are reported separately
+    skipped = {}
+    for result in results:
+        if result.get('skipped'):
+            skipped[result['skipped']] = skipped.get(result['skipped'], 0) + 1
+    interventions = [result for result in results if not result.get('skipped')]
+    print(f"Coach shard {run_id}#{shard}: {status}, {len(coached)} done ({sum(skipped.values())} skipped), {remaining} remaining")
+    return {
+        'run_id': run_id,
+        'shard': shard,
+        'status': status,
+        'coached': len(coached),
+        'skipped': skipped,
+        'remaining': remaining,
+        'results': interventions
+    }
+
+def new_run_id(event):
+    """The schedule event ID (stable across planner retries), else the current time."""
+    return event.get('id') or f"run-{int(time.time() * 1000)}"
@@ -0,0 +1,77 @@
+"""
+Skip-if-unchanged gating for proactive coaching.
+
+Every user item carries a coaching watermark: the timestamp of the newest sample
+the coach has seen (coach_watermark_ts) and a digest of the summary it last sent
+to the model (coach_summary_digest). A user is not sent to Bedrock if:
+- no sample arrived since the watermark (watch off, no sync): 'no_new_samples', or
+- the summary is materially identical to the last coached one: 'unchanged_summary'.
+Materially identical means equal after dropping volatile keys (timestamps, counts)
+and rounding numbers to COACH_DIGEST_DECIMALS. A user is coached again regardless
+after COACH_RECOACH_SECONDS, but only while there is data to coach on: the newest
+sample is within the summary window and the summary has metrics, so spend tracks
+active users. Skips are recorded on the user item (coach_skip_reason).
+"""
+import hashlib
+import json
+import os
+import time
+from decimal import Decimal
+
+COACH_DIGEST_DECIMALS = int(os.environ.get('COACH_DIGEST_DECIMALS', '0'))
+COACH_RECOACH_SECONDS = int(os.environ.get('COACH_RECOACH_SECONDS', str(24 * 3600)))
+# Same window as daily_summary: older samples are not in the summary
+COACH_SUMMARY_HOURS = int(os.environ.get('COACH_SUMMARY_HOURS', '24'))
+
+# Keys that change with every sample without changing what the coach would say
+# (raw-item timestamps / IDs, daily_summary sample and bucket counts)
+VOLATILE_KEYS = {'timestamp', 'user_id', 'expires_at', 'ttl', 'received_at', 'n', 'buckets'}
+
+# Skip reasons
+NO_NEW_SAMPLES = 'no_new_samples'
+UNCHANGED_SUMMARY = 'unchanged_summary'
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        rounded = round(float(value), COACH_DIGEST_DECIMALS)
+        return int(rounded) if COACH_DIGEST_DECIMALS <= 0 else rounded
+    return value
+
+def summary_digest(summary_input):
+    """Short SHA-256 of the material content of the coach's summary input."""
+    canonical = json.dumps(_normalize(summary_input), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+def _recoach_due(user, now_s):
+    coached_at = int(user.get('coached_at') or 0) / 1000
+    return now_s - coached_at >= COACH_RECOACH_SECONDS
+
+def has_new_samples(user, latest_ts, now_s=None):
+    """
+    True if a sample newer than the user's watermark exists, or a periodic re-coach is
+    due and the newest sample is still within the summary window.
+    """
+    if latest_ts is None:
+        return False
+    watermark = user.get('coach_watermark_ts')
+    if watermark is None or int(latest_ts) > int(watermark):
+        return True
+    now_s = now_s if now_s is not None else time.time()
+    if int(latest_ts) / 1000 < now_s - COACH_SUMMARY_HOURS * 3600:
+        return False
+    return _recoach_due(user, now_s)
+
+def is_unchanged(user, digest, now_s=None, has_data=True):
+    """
+    True if the summary digest equals the last coached one and no periodic re-coach is
+    due; a summary without metrics (has_data False) never forces a re-coach.
+    """
+    if digest != user.get('coach_summary_digest'):
+        return False
+    return not (has_data and _recoach_due(user, now_s if now_s is not None else time.time()))
@@ -0,0 +1,112 @@
+"""
+Execution backends for the State Reactor's agents (experts, supervisor, characterizer).
+
+- local:  calls the agent handler functions directly in a thread pool inside the
+          reactor process (no Lambda hop, no cold starts of child functions).
+- remote: invokes each agent as its own Lambda function (original behaviour).
+
+EXPERT_BACKEND selects the backend; by default 'local' is used whenever the
+agent modules are packaged with the reactor.
+"""
+import importlib
+import importlib.util
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from core.utils import DecimalEncoder, from_dynamo
+
+# Agent -> handler module (local) and function-name env var (remote)
+AGENT_MODULES = {
+    'activity': 'experts.activity',
+    'vitals': 'experts.vitals',
+    'wellbeing': 'experts.wellbeing',
+    'supervisor': 'supervisor',
+    'characterizer': 'characterizer'
+}
+
+AGENT_FUNCTION_ENV = {
+    'activity': 'ACTIVITY_FUNCTION',
+    'vitals': 'VITALS_FUNCTION',
+    'wellbeing': 'WELLBEING_FUNCTION',
+    'supervisor': 'SUPERVISOR_FUNCTION',
+    'characterizer': 'CHARACTERIZER_FUNCTION'
+}
+
+MAX_WORKERS = int(os.environ.get('EXPERT_BACKEND_WORKERS', '4'))
+
+lambda_client = boto3.client('lambda')
+
+def _json_ready(payload):
+    # Same payload shape the agents get over Lambda (Decimals -> numbers); no copy if already native
+    return from_dynamo(payload)
+
+class LocalBackend:
+    """Runs agent handlers in-process."""
+    name = 'local'
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def invoke(self, agent, payload):
+        try:
+            module = importlib.import_module(AGENT_MODULES[agent])
+            return module.handler(_json_ready(payload), None)
+        except Exception as e:
+            print(f"Local agent '{agent}' failed: {e}")
+            return {"error": f"{agent} failed: {e}"}
+
+    def submit(self, agent, payload):
+        return self._pool.submit(self.invoke, agent, payload)
+
+class RemoteBackend:
+    """Invokes each agent as a separate Lambda function."""
+    name = 'remote'
+
+    def __init__(self, max_workers=MAX_WORKERS, client=None):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._client = client
+
+    def invoke(self, agent, payload):
+        return invoke_lambda(os.environ.get(AGENT_FUNCTION_ENV[agent]), payload, self._client)
+
+    def submit(self, agent, payload):
+        return self._pool.submit(self.invoke, agent, payload)
+
+def invoke_lambda(func_name, payload, client=None):
+    if not func_name:
+        print(f"Error: Function name missing for payload keys: {payload.keys()}")
+        return {"error": "Configuration Error: Missing Function Name"}
+
+    response = (client or lambda_client).invoke(
+        FunctionName=func_name,
+        InvocationType='RequestResponse',
+        Payload=json.dumps(payload, cls=DecimalEncoder)
+    )
+    return json.loads(response['Payload'].read())
+
+def agents_copackaged():
+    """True if every agent handler module can be imported from this package."""
+    try:
+        return all(importlib.util.find_spec(module) is not None for module in AGENT_MODULES.values())
+    except ModuleNotFoundError:
+        return False
+
+_backend = None
+
+def get_backend():
+    """The configured backend (created once per warm container)."""
+    global _backend
+    if _backend is None:
+        choice = os.environ.get('EXPERT_BACKEND', '').lower()
+        if not choice:
+            choice = 'local' if agents_copackaged() else 'remote'
+        _backend = LocalBackend() if choice == 'local' else RemoteBackend()
+        print(f"Expert backend: {_backend.name}")
+    return _backend
+
+def set_backend(backend):
+    """Overrides the backend (tests / per-invocation comparisons)."""
+    global _backend
+    _backend = backend
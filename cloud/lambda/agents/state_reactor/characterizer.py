@@ -1,7 +1,8 @@
 import json
 import os
-from core import llm
+from core import llm, resilience
 from core.utils import DecimalEncoder
+import streaming
 
 CHARACTERIZER_SCHEMA = {
     "toolSpec": {
@@ -19,8 +20,29 @@ CHARACTERIZER_SCHEMA = {
     }
 }
 
+# Static prefix (cached with the tool spec); the persona follows it, state and reasoning go into the user message
+SYSTEM_PROMPT = """You are the user's pet, a virtual health companion. Your personality is described below.
+
+Task:
+Rewrite the technical reasoning from the user message into a SINGLE, natural, first-person sentence.
+
+PERSPECTIVE RULES:
+1. ALWAYS speak in the FIRST PERSON ("I", "Me", "My").
+   - The Pet MIRRORS the User's data as its own feelings.
+   - This applies to ALL states, INCLUDING STRESS.
+   - Do NOT say "You seem overwhelmed."
+   - SAY "I feel overwhelmed, let's take a breath."
+   - Do NOT say "You walked 10k steps".
+   - SAY "I feel so energetic after our walk!"
+
+Constraints:
+- Be concise (max 15 words).
+- Match the tone of your Style.
+"""
+
 def handler(event, context):
     print(f"Characterizer Received: {json.dumps(event)}")
+    resilience.start_invocation(context)
     
     analysis = event.get('analysis', {})
     user_profile = event.get('user_profile', {})
@@ -34,42 +56,40 @@ def handler(event, context):
     goals = user_profile.get('goals', [])
     motivation_style = user_profile.get('motivation_style', 'supportive')
     
-    prompt = f"""You are {pet_name}, a virtual health companion.
-    
-Your Personality:
+    persona = f"""Your Personality:
 - Name: {pet_name}
 - Role: Health Coach & Companion
-- Style: {motivation_style} (e.g., if 'STRICT', be firm; if 'ENCOURAGING', be gentle).
+- Style: {motivation_style} (e.g., if 'STRICT', be firm; if 'ENCOURAGING', be gentle)."""
 
-User Context:
+    user_message = f"""User Context:
 - Name: {user_name}
 - Current State: {state}
 - Goals: {', '.join(goals)}
 
 Technical Reasoning for State:
 "{reasoning}"
-
-Task:
-Rewrite the technical reasoning into a SINGLE, natural, first-person sentence.
-
-PERSPECTIVE RULES:
-1. ALWAYS speak in the FIRST PERSON ("I", "Me", "My").
-   - The Pet MIRRORS the User's data as its own feelings.
-   - This applies to ALL states, INCLUDING STRESS.
-   - Do NOT say "You seem overwhelmed."
-   - SAY "I feel overwhelmed, let's take a breath."
-   - Do NOT say "You walked 10k steps".
-   - SAY "I feel so energetic after our walk!"
-
-Constraints:
-- Be concise (max 15 words).
-- Match the {motivation_style} tone.
 """
 
-    result = llm.invoke_model_structured(prompt, "Generate Character Message", CHARACTERIZER_SCHEMA, temperature=0.7)
+    # Stream the message to the watch while it is generated (never for speculative runs)
+    stream = None
+    if event.get('stream') and event.get('user_id'):
+        stream = streaming.MessageStream(event['user_id'], state=state, stream_id=event.get('stream_id'))
+
+    if stream:
+        result = llm.invoke_model_structured_stream(
+            SYSTEM_PROMPT, user_message, CHARACTERIZER_SCHEMA, stream.update, temperature=0.7, system_context=persona
+        )
+    else:
+        result = llm.invoke_model_structured(
+            SYSTEM_PROMPT, user_message, CHARACTERIZER_SCHEMA, temperature=0.7, system_context=persona
+        )
     
     if not result:
         # Fallback
-        return {'message': f"I think you are in {state} state."}
+        result = {'message': f"I think you are in {state} state."}
+
+    if stream:
+        stream.complete(result.get('message', ''))
+        stream.report()
         
     return result
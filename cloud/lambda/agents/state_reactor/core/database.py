@@ -1,18 +1,28 @@
 import os
+import time
 import boto3
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from boto3.dynamodb.conditions import Key
+from .utils import from_dynamo
 
 # Environment Variables
 USER_STATE_TABLE = os.environ.get('DYNAMODB_TABLE', 'user_state')
 HEALTH_TABLE = os.environ.get('HEALTH_TABLE', 'health_data')
 USERS_TABLE = os.environ.get('USERS_TABLE', 'users')
+ROLLUP_TABLE = os.environ.get('ROLLUP_TABLE', 'health_rollups')
+# Short-lived record with the character message while it is being generated
+MESSAGE_STREAM_TABLE = os.environ.get('MESSAGE_STREAM_TABLE', 'message_stream')
+MESSAGE_STREAM_TTL_SECONDS = int(os.environ.get('MESSAGE_STREAM_TTL_SECONDS', '300'))
 
 # Clients
 dynamodb = boto3.resource('dynamodb')
 user_state_table = dynamodb.Table(USER_STATE_TABLE)
 health_table = dynamodb.Table(HEALTH_TABLE)
 users_table = dynamodb.Table(USERS_TABLE)
+rollup_table = dynamodb.Table(ROLLUP_TABLE)
+message_stream_table = dynamodb.Table(MESSAGE_STREAM_TABLE)
 
 def get_all_users():
     try:
@@ -62,7 +72,7 @@ def get_user_profile(user_id):
     try:
         # Real fetch
         resp = users_table.get_item(Key={'user_id': user_id})
-        user = resp.get('Item')
+        user = from_dynamo(resp.get('Item'))
         
         # Mock profiles for dev (if user has no profile data or strict dev mode)
         mock_profiles = {
@@ -107,10 +117,8 @@ def get_last_health_reading(user_id):
         )
         items = response.get('Items', [])
         if items:
-            # Convert Decimal to float/int for JSON serialization logic handled elsewhere or here?
-            # The utils.DecimalEncoder handles the serialization, but for logic we might want floats.
-            # For now, returning as is (Decimals) is fine if the encoder is used later.
-            return items[0]
+            # Normalized once here; every consumer (rules, experts, payloads) shares the native dict
+            return from_dynamo(items[0])
         return None
     except Exception as e:
         print(f"DB Query Error: {e}")
@@ -123,39 +131,136 @@ def get_recent_history(user_id, limit=5):
             ScanIndexForward=False,
             Limit=limit
         )
-        return response.get('Items', [])
+        return from_dynamo(response.get('Items', []))
     except Exception as e:
         print(f"History Query Error: {e}")
         return []
 
-def get_health_data_range(user_id, start_ts, end_ts):
+def iter_health_data_pages(user_id, start_ts, end_ts, attributes=None, page_size=None):
+    """
+    Streams health data for a time range page by page, following LastEvaluatedKey
+    so ranges larger than the 1 MB query limit are returned completely.
+
+    :param user_id: The user ID.
+    :param start_ts: Start timestamp (inclusive) in milliseconds.
+    :param end_ts: End timestamp (inclusive) in milliseconds.
+    :param attributes: Optional list of attributes to project (timestamp is always included).
+    :param page_size: Optional DynamoDB Limit per page.
+    :return: Generator of item lists, in ascending timestamp order.
+    """
+    query_kwargs = {
+        'KeyConditionExpression': Key('user_id').eq(user_id) & Key('timestamp').between(start_ts, end_ts)
+    }
+    if attributes:
+        # 'timestamp' is a DynamoDB reserved word, so every name goes through a placeholder
+        names = list(dict.fromkeys(['timestamp', *attributes]))
+        placeholders = {f"#a{i}": name for i, name in enumerate(names)}
+        query_kwargs['ProjectionExpression'] = ', '.join(placeholders)
+        query_kwargs['ExpressionAttributeNames'] = placeholders
+    if page_size:
+        query_kwargs['Limit'] = page_size
+
+    while True:
+        response = health_table.query(**query_kwargs)
+        yield response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+def split_time_range(start_ts, end_ts, segments):
+    """Splits an inclusive [start_ts, end_ts] range into contiguous, non-overlapping sub-ranges."""
+    segments = max(1, min(int(segments), end_ts - start_ts + 1))
+    step = (end_ts - start_ts + 1) / segments
+    bounds = [start_ts + int(round(i * step)) for i in range(segments)] + [end_ts + 1]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(segments)]
+
+def iter_health_data_range(user_id, start_ts, end_ts, attributes=None, segments=1):
+    """
+    Streams health items for a time range in ascending timestamp order.
+    With segments > 1 the range is split into sub-ranges that are queried in parallel;
+    items are still yielded in order, as soon as each sub-range completes.
+    """
+    if segments <= 1:
+        for page in iter_health_data_pages(user_id, start_ts, end_ts, attributes):
+            yield from page
+        return
+
+    def fetch(sub_range):
+        items = []
+        for page in iter_health_data_pages(user_id, sub_range[0], sub_range[1], attributes):
+            items.extend(page)
+        return items
+
+    sub_ranges = split_time_range(start_ts, end_ts, segments)
+    with ThreadPoolExecutor(max_workers=len(sub_ranges)) as executor:
+        futures = [executor.submit(fetch, sub_range) for sub_range in sub_ranges]
+        for future in futures:
+            yield from future.result()
+
+def get_health_data_range(user_id, start_ts, end_ts, attributes=None, segments=1):
     """
     Fetches health data for a user within a specific time range.
     
     :param user_id: The user ID.
     :param start_ts: Start timestamp (inclusive) in milliseconds.
     :param end_ts: End timestamp (inclusive) in milliseconds.
+    :param attributes: Optional list of attributes to project (reduces read size).
+    :param segments: Number of parallel sub-range queries.
     :return: List of health data items.
     """
     try:
-        response = health_table.query(
-            KeyConditionExpression=Key('user_id').eq(user_id) & Key('timestamp').between(start_ts, end_ts)
-        )
-        return response.get('Items', [])
+        return list(iter_health_data_range(user_id, start_ts, end_ts, attributes, segments))
     except Exception as e:
         print(f"Range Query Error: {e}")
         return []
 
+def get_rollups(user_id, resolution, start_ts, end_ts):
+    """
+    Fetches pre-aggregated rollup buckets (maintained by the ingest Lambda).
+
+    :param user_id: The user ID.
+    :param resolution: '1m', '5m' or '1h'.
+    :param start_ts: Start timestamp (inclusive) in milliseconds.
+    :param end_ts: End timestamp (inclusive) in milliseconds.
+    :return: List of rollup items ({bucket_ts, stats: {metric: {count, sum, sumsq, min, max}}}).
+    """
+    try:
+        query_kwargs = {
+            'KeyConditionExpression': Key('rollup_key').eq(f"{user_id}#{resolution}") & Key('bucket_ts').between(start_ts, end_ts)
+        }
+        items = []
+        while True:
+            response = rollup_table.query(**query_kwargs)
+            items.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return items
+            query_kwargs['ExclusiveStartKey'] = last_key
+    except Exception as e:
+        print(f"Rollup Query Error: {e}")
+        return []
+
 def get_last_state(user_id):
     try:
         resp = user_state_table.get_item(Key={'user_id': user_id})
-        return resp.get('Item')
+        return from_dynamo(resp.get('Item'))
     except:
         return None
 
-def update_state_db(user_id, analysis, time_gap):
-    item = {
-        'user_id': user_id,
+def commit_state(user_id, analysis, extra=None, reading_ts=None):
+    """
+    Commits the user's state in one conditional update_item and returns the stored
+    item (ReturnValues=ALL_NEW), so no read is needed afterwards. Bumps state_version
+    and clears any pending proposal; avatar fields written by the avatar generator stay.
+
+    :param extra: Additional attributes (e.g. transition bookkeeping from transitions.decide).
+    :param reading_ts: Timestamp of the reading this state was derived from. The commit
+                       is rejected if a state from a newer reading is already stored.
+    :return: The new item (native values), or None if the commit was rejected as stale
+             or the write failed.
+    """
+    attributes = {
         'timestamp': int(datetime.now().timestamp() * 1000),
         'stateEnum': analysis.get('state'),
         'mood': analysis.get('mood', 'Neutral'),
@@ -164,7 +269,91 @@ def update_state_db(user_id, analysis, time_gap):
         'activity': analysis.get('activity', 'Unknown'),
         'last_updated': datetime.now().isoformat()
     }
+    attributes.update(extra or {})
+    if reading_ts is not None:
+        attributes['reading_ts'] = reading_ts
+
+    names = {'#pending_state': 'pending_state', '#pending_count': 'pending_count', '#version': 'state_version'}
+    values = {':one': 1}
+    assignments = []
+    for i, (key, value) in enumerate(attributes.items()):
+        names[f'#a{i}'] = key
+        values[f':a{i}'] = value
+        assignments.append(f'#a{i} = :a{i}')
+
+    kwargs = {
+        'Key': {'user_id': user_id},
+        'UpdateExpression': f"SET {', '.join(assignments)} ADD #version :one REMOVE #pending_state, #pending_count",
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+        'ReturnValues': 'ALL_NEW'
+    }
+    if reading_ts is not None:
+        names['#reading_ts'] = 'reading_ts'
+        kwargs['ConditionExpression'] = 'attribute_not_exists(#reading_ts) OR #reading_ts <= :a_reading_ts'
+        values[':a_reading_ts'] = reading_ts
+
     try:
-        user_state_table.put_item(Item=item)
+        return from_dynamo(user_state_table.update_item(**kwargs)['Attributes'])
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            print(f"Dropped stale state commit for {user_id}: a newer reading than {reading_ts} is already committed")
+            return None
+        print(f"Failed to update DB: {e}")
+        return None
     except Exception as e:
         print(f"Failed to update DB: {e}")
+        return None
+
+def update_pending_state(user_id, pending_state=None, pending_count=0):
+    """Records (or clears, if pending_state is None) an unconfirmed state proposal."""
+    try:
+        if pending_state:
+            user_state_table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET pending_state = :state, pending_count = :count',
+                ExpressionAttributeValues={':state': pending_state, ':count': pending_count}
+            )
+        else:
+            user_state_table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='REMOVE pending_state, pending_count'
+            )
+    except Exception as e:
+        print(f"Failed to update pending state: {e}")
+
+def write_message_stream(user_id, stream_id, message, complete=False, state=None):
+    """
+    Publishes (partial) character message text for the watch. Every write bumps the
+    record's version counter; writes from a stream older than the stored one are dropped.
+
+    :param stream_id: Start time (ms) of the reactor run producing the message.
+    :return: The new version, or None if the write was dropped or failed.
+    """
+    try:
+        resp = message_stream_table.update_item(
+            Key={'user_id': user_id},
+            UpdateExpression='SET #sid = :sid, #msg = :msg, #done = :done, #state = :state, #exp = :exp ADD #ver :one',
+            ConditionExpression='attribute_not_exists(#sid) OR #sid <= :sid',
+            ExpressionAttributeNames={
+                '#sid': 'stream_id', '#msg': 'message', '#done': 'complete',
+                '#state': 'stateEnum', '#exp': 'expires_at', '#ver': 'version'
+            },
+            ExpressionAttributeValues={
+                ':sid': stream_id,
+                ':msg': message,
+                ':done': complete,
+                ':state': state,
+                ':exp': int(time.time()) + MESSAGE_STREAM_TTL_SECONDS,
+                ':one': 1
+            },
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(resp['Attributes']['version'])
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            print(f"Failed to write message stream: {e}")
+        return None
+    except Exception as e:
+        print(f"Failed to write message stream: {e}")
+        return None
@@ -0,0 +1,198 @@
+"""
+Sensor feature extraction.
+Normalizes the different payload shapes (watch camelCase keys, seeder snake_case
+keys, contract / environment simulator nested objects) into one flat dict of
+canonical features used by the rule engine, and quantizes them into clinically
+meaningful bins that the Expert Agents use as prompt input (and therefore as
+their LLM cache key).
+"""
+import json
+import math
+import os
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+
+# Set to 'false' to send the raw sensor JSON to the experts instead of binned features
+QUANTIZE_EXPERT_INPUT = os.environ.get('QUANTIZE_EXPERT_INPUT', 'true').lower() == 'true'
+
+# Canonical feature -> keys it may arrive under, in priority order
+FEATURE_ALIASES = {
+    'heart_rate': ('heart_rate', 'heartRate'),
+    'spo2': ('spo2', 'SpO2'),
+    'body_temp': ('body_temp', 'bodyTemperature'),
+    'hrv': ('hrv', 'hrvRMSSD'),
+    'stress_score': ('stress_score', 'stressScore'),
+    'sleep_score': ('sleep_score', 'sleepScore'),
+    'step_count': ('step_count', 'stepCount'),
+    'speed': ('speed',),
+}
+
+# Where the same values live inside nested payloads (shared/contracts/sensor_data.json
+# sections, or the environment simulator's 'raw_complex' object)
+COMPLEX_PATHS = {
+    'heart_rate': (('vitals', 'heartRate'),),
+    'spo2': (('vitals', 'spo2'),),
+    'body_temp': (('vitals', 'bodyTemperature'),),
+    'hrv': (('vitals', 'hrvRMSSD'),),
+    'stress_score': (('vitals', 'stressScore'), ('wellbeing', 'stressScore')),
+    'sleep_score': (('wellbeing', 'sleepScore'),),
+    'step_count': (('activity', 'stepCount'),),
+    'speed': (('activity', 'speed'),),
+}
+
+# Accelerometer magnitude deviation from 1g (gravity) that counts as movement / stillness
+MOVING_ACCEL_G = 0.15
+STILL_ACCEL_G = 0.05
+
+def _number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    return None
+
+def _lookup(sensor_data, feature):
+    for key in FEATURE_ALIASES[feature]:
+        value = _number(sensor_data.get(key))
+        if value is not None:
+            return value
+    for container in (sensor_data, sensor_data.get('raw_complex')):
+        if not isinstance(container, dict):
+            continue
+        for section, key in COMPLEX_PATHS[feature]:
+            if isinstance(container.get(section), dict):
+                value = _number(container[section].get(key))
+                if value is not None:
+                    return value
+    return None
+
+def _nested(sensor_data, section, key):
+    for container in (sensor_data, sensor_data.get('raw_complex')):
+        if isinstance(container, dict) and isinstance(container.get(section), dict):
+            if container[section].get(key) is not None:
+                return container[section][key]
+    return None
+
+def accel_magnitude(accelerometer):
+    """Magnitude (in g) of an {x, y, z} accelerometer reading, or None."""
+    if not isinstance(accelerometer, dict):
+        return None
+    axes = [_number(accelerometer.get(axis)) for axis in ('x', 'y', 'z')]
+    if any(a is None for a in axes):
+        return None
+    return math.sqrt(sum(a * a for a in axes))
+
+def extract_features(sensor_data, previous=None):
+    """
+    Extracts canonical features from a raw sensor reading.
+
+    :param sensor_data: The reading to analyze.
+    :param previous: Optional earlier reading; used to turn cumulative step counts into a delta.
+    :return: Dict with heart_rate, spo2, body_temp, hrv, stress_score, sleep_score, step_count,
+             step_delta, steps, speed_kmh, accel_magnitude, accel_dynamic, sleep_status and
+             moving (True / False / None when unknown). Missing values are None.
+    """
+    sensor_data = sensor_data or {}
+    features = {feature: _lookup(sensor_data, feature) for feature in FEATURE_ALIASES}
+
+    previous_steps = _lookup(previous, 'step_count') if isinstance(previous, dict) else None
+    if features['step_count'] is not None and previous_steps is not None and features['step_count'] >= previous_steps:
+        features['step_delta'] = features['step_count'] - previous_steps
+    else:
+        features['step_delta'] = None
+    # Steps in this interval when known, otherwise the reported count
+    features['steps'] = features['step_delta'] if features['step_delta'] is not None else features['step_count']
+
+    # Speed arrives in m/s (see shared/contracts/sensor_data.json)
+    speed = features.pop('speed')
+    features['speed_kmh'] = speed * 3.6 if speed is not None else None
+
+    magnitude = accel_magnitude(sensor_data.get('accelerometer') or _nested(sensor_data, 'motion', 'accelerometer'))
+    features['accel_magnitude'] = magnitude
+    features['accel_dynamic'] = abs(magnitude - 1.0) if magnitude is not None else None
+
+    sleep_status = sensor_data.get('sleep_status') or _nested(sensor_data, 'wellbeing', 'sleepStatus')
+    features['sleep_status'] = sleep_status if isinstance(sleep_status, str) else None
+
+    # Movement: accelerometer is authoritative; a zero step count is the fallback
+    if features['accel_dynamic'] is not None:
+        if features['accel_dynamic'] >= MOVING_ACCEL_G:
+            features['moving'] = True
+        elif features['accel_dynamic'] <= STILL_ACCEL_G and not features['steps']:
+            features['moving'] = False
+        else:
+            features['moving'] = None
+    elif features['steps'] == 0:
+        features['moving'] = False
+    else:
+        features['moving'] = None
+
+    return features
+
+# --- Quantization ---
+
+# feature -> (bin edges, side). side='upper': a value equal to an edge falls in the
+# lower bin (matches '> x' rules, e.g. HR > 180 is critical). side='lower': it falls
+# in the upper bin (matches '< x' rules, e.g. SpO2 < 90 is critical).
+QUANTIZATION_BINS = {
+    'heart_rate': ((50, 60, 100, 110, 180), 'upper'),
+    'spo2': ((90, 95), 'lower'),
+    'body_temp': ((36.0, 37.5, 38.5), 'upper'),
+    'hrv': ((20, 50), 'lower'),
+    'stress_score': ((30, 80), 'upper'),
+    'sleep_score': ((60, 80), 'lower'),
+    'speed_kmh': ((1, 6, 10, 25), 'upper'),
+    'steps': ((0, 20, 100), 'upper'),
+    'accel_dynamic': ((STILL_ACCEL_G, MOVING_ACCEL_G, 0.5), 'upper'),
+}
+
+def _fmt(edge):
+    return f"{edge:g}"
+
+def bin_label(value, edges, side='upper'):
+    """Label of the bin a value falls in, e.g. '<=50', '60-100', '>180'."""
+    if side == 'upper':
+        i = bisect_left(edges, value)
+        if i == 0:
+            return f"<={_fmt(edges[0])}"
+        if i == len(edges):
+            return f">{_fmt(edges[-1])}"
+    else:
+        i = bisect_right(edges, value)
+        if i == 0:
+            return f"<{_fmt(edges[0])}"
+        if i == len(edges):
+            return f">={_fmt(edges[-1])}"
+    return f"{_fmt(edges[i - 1])}-{_fmt(edges[i])}"
+
+def quantize_features(features):
+    """
+    Buckets extracted features into bin labels. Volatile fields (timestamps, raw
+    accelerometer axes, device ids) are not part of the result, and missing
+    features are omitted.
+
+    :param features: Output of extract_features.
+    :return: Dict of feature -> bin label (plus sleep_status / moving as-is).
+    """
+    quantized = {}
+    for feature, (edges, side) in QUANTIZATION_BINS.items():
+        if features.get(feature) is not None:
+            quantized[feature] = bin_label(features[feature], edges, side)
+    if features.get('sleep_status'):
+        quantized['sleep_status'] = features['sleep_status']
+    if features.get('moving') is not None:
+        quantized['moving'] = features['moving']
+    return quantized
+
+def feature_key(quantized):
+    """Canonical string of a bin vector; identical bins give byte-identical prompts."""
+    return json.dumps(quantized, sort_keys=True, separators=(',', ':'))
+
+def expert_input(sensor_data, previous=None):
+    """
+    Sensor description passed to an Expert Agent prompt: the canonical bin vector,
+    or the raw reading when QUANTIZE_EXPERT_INPUT is disabled.
+    """
+    if not QUANTIZE_EXPERT_INPUT:
+        return json.dumps(sensor_data, default=lambda o: float(o) if isinstance(o, Decimal) else str(o))
+    return feature_key(quantize_features(extract_features(sensor_data, previous)))
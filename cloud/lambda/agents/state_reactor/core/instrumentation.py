@@ -0,0 +1,138 @@
+"""
+LLM call instrumentation.
+
+Every model call made through core.llm is recorded once with its schema, model,
+token counts (fresh / cache-read / cache-written input, output), server and client
+latency, retry count and outcome. Records are:
+- printed as CloudWatch Embedded Metric Format (EMF) lines, so CloudWatch turns
+  them into metrics without any API call, and
+- kept in an in-process aggregator (per warm container) for tests and benchmarks.
+Extra listeners (e.g. a benchmark collector) can be registered with add_listener.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+METRICS_NAMESPACE = os.environ.get('LLM_METRICS_NAMESPACE', 'TamagotchiHealth/LLM')
+EMF_ENABLED = os.environ.get('LLM_METRICS_EMF', 'true').lower() == 'true'
+# Records kept by the in-process aggregator (oldest dropped first)
+AGGREGATOR_MAX_RECORDS = int(os.environ.get('LLM_METRICS_MAX_RECORDS', '5000'))
+
+# Outcomes: ok, cache_hit, no_tool_use, escalated, timeout, breaker_open, failed, error
+METRICS = [
+    ('InputTokens', 'input_tokens', 'Count'),
+    ('OutputTokens', 'output_tokens', 'Count'),
+    ('CacheReadTokens', 'cache_read_tokens', 'Count'),
+    ('CacheWriteTokens', 'cache_write_tokens', 'Count'),
+    ('ServerLatency', 'server_latency_ms', 'Milliseconds'),
+    ('ClientLatency', 'client_latency_ms', 'Milliseconds'),
+    ('Retries', 'retries', 'Count'),
+]
+
+def call_record(schema, model, usage=None, server_latency_ms=None, client_latency_ms=0.0, retries=0, outcome='ok'):
+    """Builds one call record from a Converse usage dict."""
+    usage = usage or {}
+    return {
+        'schema': schema,
+        'model': model or 'none',
+        'input_tokens': usage.get('inputTokens', 0),
+        'output_tokens': usage.get('outputTokens', 0),
+        'cache_read_tokens': usage.get('cacheReadInputTokens', 0),
+        'cache_write_tokens': usage.get('cacheWriteInputTokens', 0),
+        'server_latency_ms': server_latency_ms or 0,
+        'client_latency_ms': round(client_latency_ms, 1),
+        'retries': retries,
+        'outcome': outcome
+    }
+
+def emf_line(record):
+    """CloudWatch EMF document for one call record (dimensions: Schema, Model, Outcome)."""
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Schema'], ['Schema', 'Model', 'Outcome']],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, _, unit in METRICS]
+            }]
+        },
+        'Schema': record['schema'],
+        'Model': record['model'],
+        'Outcome': record['outcome']
+    }
+    for name, key, _ in METRICS:
+        document[name] = record[key]
+    return json.dumps(document)
+
+# --- In-process Aggregator ---
+
+class Aggregator:
+    """Per-schema totals and client latency percentiles over the most recent calls."""
+
+    def __init__(self, max_records=AGGREGATOR_MAX_RECORDS):
+        self._lock = threading.Lock()
+        self.records = deque(maxlen=max_records)
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self):
+        with self._lock:
+            records = list(self.records)
+        schemas = {}
+        for r in records:
+            s = schemas.setdefault(r['schema'], {'calls': 0, 'outcomes': {}, 'latencies': [], **{key: 0 for _, key, _ in METRICS if key != 'client_latency_ms'}})
+            s['calls'] += 1
+            s['outcomes'][r['outcome']] = s['outcomes'].get(r['outcome'], 0) + 1
+            s['latencies'].append(r['client_latency_ms'])
+            for _, key, _ in METRICS:
+                if key != 'client_latency_ms':
+                    s[key] += r[key]
+        for s in schemas.values():
+            latencies = sorted(s.pop('latencies'))
+            s['client_latency_p50_ms'] = _percentile(latencies, 0.5)
+            s['client_latency_p95_ms'] = _percentile(latencies, 0.95)
+            s['client_latency_total_ms'] = round(sum(latencies), 1)
+        return schemas
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+aggregator = Aggregator()
+_listeners = []
+
+def add_listener(listener):
+    """Registers listener(record), called for every recorded call."""
+    _listeners.append(listener)
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+def record(schema, model, usage=None, server_latency_ms=None, client_latency_ms=0.0, retries=0, outcome='ok'):
+    """Records one model call: EMF log line, aggregator, listeners. Returns the record."""
+    entry = call_record(schema, model, usage, server_latency_ms, client_latency_ms, retries, outcome)
+    if EMF_ENABLED:
+        print(emf_line(entry))
+    aggregator.add(entry)
+    for listener in list(_listeners):
+        try:
+            listener(entry)
+        except Exception as e:
+            print(f"Instrumentation listener failed: {e}")
+    return entry
+
+def get_summary():
+    return aggregator.summary()
+
+def reset():
+    aggregator.reset()
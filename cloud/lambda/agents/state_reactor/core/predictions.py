@@ -1,6 +1,15 @@
+import os
 from datetime import datetime, timedelta
 from core import database, utils
 
+# Only these metrics are read for trend analysis; projecting them keeps range reads small.
+PREDICTION_METRICS = ['heart_rate', 'hrv', 'sleep_score']
+# Parallel sub-range queries used to fetch the 24h window
+RANGE_QUERY_SEGMENTS = int(os.environ.get('RANGE_QUERY_SEGMENTS', '4'))
+# Rollup resolution read for the 24h window
+ROLLUP_RESOLUTION = '5m'
+ROLLUP_BUCKET_MS = 300000
+
 def analyze_trend(data_points: list[float], threshold: float = 0.1) -> str:
     """
     Analyzes a list of numerical data points to determine if there's a trend.
@@ -39,7 +48,20 @@ def get_predictive_context(user_id: str, historical_data: list[dict]) -> dict:
     end_ts = int(datetime.now().timestamp() * 1000)
     start_ts = int((datetime.now() - timedelta(hours=24)).timestamp() * 1000)
     
-    raw_range_data = database.get_health_data_range(user_id, start_ts, end_ts)
+    # Prefer the 5-minute rollups maintained at ingest (<= 288 rows per day); the part
+    # of the window they do not cover (e.g. not backfilled yet) is read from raw samples.
+    rollups = database.get_rollups(user_id, ROLLUP_RESOLUTION, start_ts, end_ts)
+    raw_range_data = utils.rollups_to_items(rollups, PREDICTION_METRICS)
+    window_label = "24h_rollup"
+    gap = utils.rollup_gap(rollups, start_ts, end_ts, ROLLUP_BUCKET_MS)
+    if gap:
+        raw_range_data = database.get_health_data_range(
+            user_id, gap[0], gap[1],
+            attributes=PREDICTION_METRICS,
+            segments=RANGE_QUERY_SEGMENTS
+        ) + raw_range_data
+        if not rollups:
+            window_label = "24h_adaptive"
     
     # Aggregate into adaptive buckets based on volatility
     # If HR is steady, we get 2-hour chunks. If volatile, we get 5-min chunks.
@@ -49,7 +71,7 @@ def get_predictive_context(user_id: str, historical_data: list[dict]) -> dict:
         max_window_ms=7200000,   # 2 Hours
         threshold=10.0,          # HR StdDev threshold
         target_metric='heart_rate',
-        metrics=['heart_rate', 'hrv', 'sleep_score']
+        metrics=PREDICTION_METRICS
     )
     
     # Use aggregated data for trends if available, else fallback to raw history
@@ -84,5 +106,5 @@ def get_predictive_context(user_id: str, historical_data: list[dict]) -> dict:
         "sleep_score_trend": sleep_score_trend,
         "overall_readiness": overall_readiness,
         "burnout_risk": burnout_risk,
-        "analysis_window": "24h_adaptive" if aggregated_data else "recent_raw"
+        "analysis_window": window_label if aggregated_data else "recent_raw"
     }
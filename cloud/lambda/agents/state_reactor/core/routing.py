@@ -0,0 +1,167 @@
+"""
+Model routing.
+
+Maps each tool schema to a model tier. Near-deterministic classifications and
+short generations go to the small/fast model; synthesis goes to the large model.
+A small-model answer that fails schema validation (or reports low confidence) is
+escalated to the large model. Per-route token, cost and latency counters show
+what the routing saves compared to sending everything to the large model.
+"""
+import json
+import os
+import threading
+
+LLM_ROUTING_ENABLED = os.environ.get('LLM_ROUTING_ENABLED', 'true').lower() == 'true'
+
+MODEL_TIERS = {
+    'small': os.environ.get('SMALL_MODEL_ID', 'eu.anthropic.claude-haiku-4-5-20251001-v1:0'),
+    'large': os.environ.get('LARGE_MODEL_ID', 'eu.anthropic.claude-sonnet-4-5-20250929-v1:0'),
+}
+
+# USD per 1M tokens (input, output); used for the cost report only. Prompt-cache reads
+# and writes are billed at a fraction / multiple of the input price.
+TIER_PRICING = {
+    'small': (float(os.environ.get('SMALL_MODEL_INPUT_PRICE', '1.0')), float(os.environ.get('SMALL_MODEL_OUTPUT_PRICE', '5.0'))),
+    'large': (float(os.environ.get('LARGE_MODEL_INPUT_PRICE', '3.0')), float(os.environ.get('LARGE_MODEL_OUTPUT_PRICE', '15.0'))),
+}
+
+# Tool schema name -> (tier, escalate to 'large' on invalid / low-confidence output)
+ROUTES = {
+    'activity_expert_analysis': ('small', True),
+    'vitals_expert_analysis': ('small', True),
+    'wellbeing_expert_analysis': ('small', True),
+    'generate_character_message': ('small', False),
+    'pet_state_supervisor_decision': ('large', False),
+    'pet_state_fused_analysis': ('large', False),
+    # Hourly for every user: small model, large only for invalid / low-confidence output
+    'proactive_coach_intervention': ('small', True),
+}
+
+# Optional JSON override, e.g. {"vitals_expert_analysis": "large"}
+for _name, _tier in json.loads(os.environ.get('MODEL_ROUTES', '{}')).items():
+    ROUTES[_name] = (_tier, ROUTES.get(_name, (_tier, False))[1])
+
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+ESCALATION_MIN_CONFIDENCE = float(os.environ.get('ESCALATION_MIN_CONFIDENCE', '0.6'))
+
+def route(schema_name, default_model_id):
+    """
+    Model for a tool schema.
+
+    :return: (model_id, tier, escalate). Unrouted schemas (or routing disabled) use
+             default_model_id with tier None and no escalation.
+    """
+    if not LLM_ROUTING_ENABLED or schema_name not in ROUTES:
+        return default_model_id, None, False
+    tier, escalate = ROUTES[schema_name]
+    return MODEL_TIERS[tier], tier, escalate
+
+# --- Output validation ---
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'integer': int,
+    'number': (int, float),
+}
+
+def validate(value, schema, path='$'):
+    """Checks a tool result against its JSON schema (type, enum, required, bounds). Returns a list of errors."""
+    expected = schema.get('type')
+    if expected in _TYPES:
+        if not isinstance(value, _TYPES[expected]) or (expected in ('integer', 'number') and isinstance(value, bool)):
+            return [f"{path}: expected {expected}"]
+    errors = []
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: {value!r} not in enum")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if 'minimum' in schema and value < schema['minimum']:
+            errors.append(f"{path}: below minimum")
+        if 'maximum' in schema and value > schema['maximum']:
+            errors.append(f"{path}: above maximum")
+    if isinstance(value, dict):
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, sub_schema in schema.get('properties', {}).items():
+            if key in value:
+                errors.extend(validate(value[key], sub_schema, f"{path}.{key}"))
+    if isinstance(value, list) and 'items' in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema['items'], f"{path}[{i}]"))
+    return errors
+
+def escalation_reason(result, tool_schema):
+    """Why a small-model result should be escalated, or None if it is acceptable."""
+    if not result:
+        return 'no result'
+    errors = validate(result, tool_schema['toolSpec']['inputSchema']['json'])
+    if errors:
+        return f"invalid output: {'; '.join(errors[:3])}"
+    confidence = result.get('confidence')
+    if isinstance(confidence, (int, float)) and confidence < ESCALATION_MIN_CONFIDENCE:
+        return f"low confidence ({confidence})"
+    return None
+
+# --- Cost / Latency Report (per warm container) ---
+
+_routes = {}
+_lock = threading.Lock()
+
+def record(schema_name, tier, usage, latency_ms, escalated=False):
+    """Records one model call for the per-route report."""
+    tier = tier or 'large'
+    input_tokens = (usage or {}).get('inputTokens', 0)
+    output_tokens = (usage or {}).get('outputTokens', 0)
+    cache_read = (usage or {}).get('cacheReadInputTokens', 0)
+    cache_write = (usage or {}).get('cacheWriteInputTokens', 0)
+    # Input-price-equivalent tokens
+    billed_input = input_tokens + cache_read * CACHE_READ_PRICE_FACTOR + cache_write * CACHE_WRITE_PRICE_FACTOR
+    in_price, out_price = TIER_PRICING[tier]
+    large_in, large_out = TIER_PRICING['large']
+    with _lock:
+        r = _routes.setdefault(schema_name, {
+            'calls': 0, 'escalations': 0, 'input_tokens': 0, 'output_tokens': 0,
+            'cache_read_tokens': 0, 'cache_write_tokens': 0,
+            'latency_ms': 0.0, 'cost_usd': 0.0, 'large_only_cost_usd': 0.0, 'tiers': {}
+        })
+        r['calls'] += 1
+        r['escalations'] += 1 if escalated else 0
+        r['input_tokens'] += input_tokens
+        r['output_tokens'] += output_tokens
+        r['cache_read_tokens'] += cache_read
+        r['cache_write_tokens'] += cache_write
+        r['latency_ms'] += latency_ms
+        r['cost_usd'] += (billed_input * in_price + output_tokens * out_price) / 1e6
+        r['large_only_cost_usd'] += (billed_input * large_in + output_tokens * large_out) / 1e6
+        r['tiers'][tier] = r['tiers'].get(tier, 0) + 1
+
+def _cached_share(r):
+    total = r['input_tokens'] + r['cache_read_tokens'] + r['cache_write_tokens']
+    return round(r['cache_read_tokens'] / total, 3) if total else 0.0
+
+def get_report():
+    """Per-route calls, escalations, tokens (incl. prompt-cache reads), mean latency, cost and savings vs. large-only."""
+    with _lock:
+        routes = {}
+        for name, r in _routes.items():
+            routes[name] = dict(
+                r,
+                tiers=dict(r['tiers']),
+                avg_latency_ms=round(r['latency_ms'] / r['calls'], 1) if r['calls'] else 0.0,
+                cached_input_share=_cached_share(r),
+                savings_usd=r['large_only_cost_usd'] - r['cost_usd']
+            )
+    return {
+        'routes': routes,
+        'cost_usd': sum(r['cost_usd'] for r in routes.values()),
+        'savings_usd': sum(r['savings_usd'] for r in routes.values())
+    }
+
+def reset_report():
+    with _lock:
+        _routes.clear()
@@ -0,0 +1,189 @@
+"""
+Deterministic rule engine for the Expert Agents.
+
+The crisp rules spelled out in the expert prompts are declared here as a table,
+compiled once into predicates, and evaluated locally against extracted sensor
+features. When a high-confidence rule matches, its schema-conformant result is
+used instead of a Bedrock call; ambiguous readings fall through to the LLM.
+"""
+import copy
+import os
+import operator
+from .features import extract_features
+
+MIN_CONFIDENCE = float(os.environ.get('RULE_ENGINE_MIN_CONFIDENCE', '0.9'))
+RULE_ENGINE_ENABLED = os.environ.get('RULE_ENGINE_ENABLED', 'true').lower() == 'true'
+
+# --- Rule Table ---
+# (rule_id, expert, confidence, conditions, result)
+# Conditions are (feature, op, value) and must all hold. A missing feature never
+# satisfies a condition, except for the '*_or_missing' operators.
+# Rules are checked in order; the first match per expert wins.
+
+RULE_TABLE = [
+    # VITALS: Critical if HR > 180 or SpO2 < 90; Abnormal if BodyTemp > 37.5; Elevated if HR > 100 at rest
+    ('vitals.critical_heart_rate', 'vitals', 0.99,
+     [('heart_rate', '>', 180)],
+     {'status': 'Critical', 'potential_issues': ['Tachycardia'], 'reasoning': 'Heart rate above 180 bpm is critical.'}),
+    ('vitals.critical_spo2', 'vitals', 0.99,
+     [('spo2', '<', 90)],
+     {'status': 'Critical', 'potential_issues': ['Low SpO2'], 'reasoning': 'Blood oxygen below 90% is critical.'}),
+    ('vitals.fever', 'vitals', 0.95,
+     [('body_temp', '>', 37.5)],
+     {'status': 'Abnormal', 'potential_issues': ['Fever'], 'reasoning': 'Body temperature above 37.5C indicates fever.'}),
+    ('vitals.elevated_at_rest', 'vitals', 0.9,
+     [('heart_rate', '>', 100), ('moving', '==', False), ('spo2', 'ge_or_missing', 95)],
+     {'status': 'Elevated', 'potential_issues': ['Tachycardia'], 'reasoning': 'Heart rate above 100 bpm while at rest.'}),
+    ('vitals.normal', 'vitals', 0.9,
+     [('heart_rate', 'between', (50, 100)), ('spo2', 'ge_or_missing', 95), ('body_temp', 'le_or_missing', 37.5)],
+     {'status': 'Normal', 'potential_issues': [], 'reasoning': 'Heart rate, SpO2 and temperature are within standard ranges.'}),
+
+    # ACTIVITY
+    ('activity.asleep', 'activity', 1.0,
+     [('sleep_status', '==', 'ASLEEP')],
+     {'activity_type': 'Sleeping', 'intensity': 'Low', 'reasoning': 'User is marked as ASLEEP in sensor data.'}),
+    ('activity.commuting', 'activity', 0.9,
+     [('speed_kmh', '>', 10), ('steps', 'le_or_missing', 0)],
+     {'activity_type': 'Commuting', 'intensity': 'Low', 'reasoning': 'Speed above 10 km/h with no steps indicates a vehicle.'}),
+    ('activity.workout', 'activity', 0.9,
+     [('heart_rate', '>', 110), ('moving', '==', True)],
+     {'activity_type': 'Workout', 'intensity': 'High', 'reasoning': 'Heart rate above 110 bpm with significant movement.'}),
+    ('activity.stationary_high_hr', 'activity', 0.9,
+     [('heart_rate', '>', 100), ('moving', '==', False)],
+     {'activity_type': 'Sedentary', 'intensity': 'Low', 'reasoning': 'High heart rate while stationary is not a workout; likely stress or anxiety.'}),
+    ('activity.sedentary', 'activity', 0.9,
+     [('heart_rate', 'between', (60, 100)), ('moving', '==', False)],
+     {'activity_type': 'Sedentary', 'intensity': 'Low', 'reasoning': 'Low movement and resting heart rate.'}),
+
+    # WELLBEING (history-dependent states like 'Exhausted' are left to the LLM). There is
+    # no 'Calm' rule: low stress and good HRV now can still be Exhausted given the history,
+    # which is not part of the features.
+    ('wellbeing.stressed', 'wellbeing', 0.9,
+     [('stress_score', '>', 80)],
+     {'mental_state': 'Stressed', 'reasoning': 'Stress score above 80.'}),
+
+    # DEGRADED MODE: coarse low-confidence rules, only used by fallback() when no model answered
+    ('vitals.fallback_elevated', 'vitals', 0.6,
+     [('heart_rate', '>', 100)],
+     {'status': 'Elevated', 'potential_issues': [], 'reasoning': 'Heart rate above 100 bpm (model unavailable, rule estimate).'}),
+    ('vitals.fallback_normal', 'vitals', 0.5,
+     [('heart_rate', 'between', (40, 100))],
+     {'status': 'Normal', 'potential_issues': [], 'reasoning': 'Heart rate in a plausible resting range (model unavailable, rule estimate).'}),
+    ('activity.fallback_moving', 'activity', 0.6,
+     [('moving', '==', True)],
+     {'activity_type': 'Walking', 'intensity': 'Moderate', 'reasoning': 'Movement detected (model unavailable, rule estimate).'}),
+    ('activity.fallback_resting', 'activity', 0.5,
+     [('heart_rate', '<=', 100)],
+     {'activity_type': 'Sedentary', 'intensity': 'Low', 'reasoning': 'Resting heart rate (model unavailable, rule estimate).'}),
+    ('wellbeing.fallback_tense', 'wellbeing', 0.5,
+     [('stress_score', '>', 50)],
+     {'mental_state': 'Anxious', 'reasoning': 'Elevated stress score (model unavailable, rule estimate).'}),
+    ('wellbeing.fallback_calm', 'wellbeing', 0.5,
+     [('stress_score', 'le_or_missing', 50)],
+     {'mental_state': 'Calm', 'reasoning': 'No sign of elevated stress (model unavailable, rule estimate).'}),
+]
+
+_OPS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'between': lambda v, bounds: bounds[0] <= v <= bounds[1],
+}
+
+_MISSING_OK_OPS = {
+    'le_or_missing': operator.le,
+    'ge_or_missing': operator.ge,
+}
+
+def _compile_condition(feature, op, expected):
+    if op in _MISSING_OK_OPS:
+        fn = _MISSING_OK_OPS[op]
+        return lambda f: f.get(feature) is None or fn(f[feature], expected)
+    fn = _OPS[op]
+    return lambda f: f.get(feature) is not None and fn(f[feature], expected)
+
+def compile_rules(rule_table):
+    """Compiles the rule table into {expert: [(rule_id, confidence, [predicates], result)]}."""
+    compiled = {}
+    for rule_id, expert, confidence, conditions, result in rule_table:
+        predicates = [_compile_condition(*condition) for condition in conditions]
+        compiled.setdefault(expert, []).append((rule_id, confidence, predicates, result))
+    return compiled
+
+_COMPILED = compile_rules(RULE_TABLE)
+
+# --- Hit Counters (per warm container) ---
+
+_rule_hits = {rule[0]: 0 for rule in RULE_TABLE}
+_evaluations = {}
+_fallthroughs = {}
+# Degraded-mode answers (see fallback), kept out of the hit rate
+_fallback_hits = {}
+
+def evaluate(expert, sensor_data=None, features=None, min_confidence=None, previous=None, track=True):
+    """
+    Evaluates the rules for one expert.
+
+    :param expert: 'activity', 'vitals' or 'wellbeing'.
+    :param sensor_data: Raw sensor reading (ignored if features are given).
+    :param features: Pre-extracted features (see core.features.extract_features).
+    :param min_confidence: Override for RULE_ENGINE_MIN_CONFIDENCE.
+    :param previous: Earlier reading for step deltas (ignored if features are given).
+    :param track: Set False to leave the hit counters untouched (e.g. for lookahead guesses).
+    :return: (result, rule_id) on a confident match, else (None, None).
+    """
+    if not RULE_ENGINE_ENABLED:
+        return None, None
+
+    if features is None:
+        features = extract_features(sensor_data, previous)
+    threshold = MIN_CONFIDENCE if min_confidence is None else min_confidence
+
+    if track:
+        _evaluations[expert] = _evaluations.get(expert, 0) + 1
+    for rule_id, confidence, predicates, result in _COMPILED.get(expert, []):
+        if confidence >= threshold and all(p(features) for p in predicates):
+            if track:
+                _rule_hits[rule_id] += 1
+            # Copy so callers can't mutate the rule table
+            return copy.deepcopy(result), rule_id
+
+    if track:
+        _fallthroughs[expert] = _fallthroughs.get(expert, 0) + 1
+    return None, None
+
+def fallback(expert, sensor_data=None, features=None, previous=None):
+    """
+    Degraded-mode answer when the model is unavailable (circuit open, deadline hit):
+    the best matching rule regardless of confidence, including the fallback rules.
+
+    Counted separately (fallback_hits), so degraded answers do not inflate the hit rate.
+
+    :return: (result, rule_id), or (None, None) if not even a fallback rule matches.
+    """
+    result, rule_id = evaluate(expert, sensor_data=sensor_data, features=features, min_confidence=0.0, previous=previous, track=False)
+    if rule_id is not None:
+        _fallback_hits[rule_id] = _fallback_hits.get(rule_id, 0) + 1
+    return result, rule_id
+
+def get_stats():
+    """Rule hit counters and the share of expert evaluations answered without the LLM."""
+    total = sum(_evaluations.values())
+    hits = total - sum(_fallthroughs.values())
+    return {
+        'rule_hits': dict(_rule_hits),
+        'evaluations': dict(_evaluations),
+        'llm_fallthroughs': dict(_fallthroughs),
+        'fallback_hits': dict(_fallback_hits),
+        'hit_rate': hits / total if total else 0.0
+    }
+
+def reset_stats():
+    for rule_id in _rule_hits:
+        _rule_hits[rule_id] = 0
+    _evaluations.clear()
+    _fallthroughs.clear()
+    _fallback_hits.clear()
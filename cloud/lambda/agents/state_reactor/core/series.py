@@ -0,0 +1,226 @@
+"""
+Columnar health-series engine.
+
+Converts a list of health items (DynamoDB dicts with Decimals) into typed NumPy
+arrays once, then computes fixed and adaptive time-window aggregates with
+vectorized reductions (cumsum / searchsorted / reduceat) instead of per-item
+Python loops.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+DEFAULT_METRICS = ('heart_rate', 'hrv', 'sleep_score')
+
+# Initial number of candidate window ends scanned at once by adaptive_windows.
+# Doubles until a closing point is found, so volatile data stays cheap.
+_SCAN_CHUNK = 64
+_TIE_EPSILON = 1e-10
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def discover_metrics(items):
+    """Returns all numeric keys (except timestamp) present in the items, in first-seen order."""
+    found = {}
+    for item in items:
+        for key, value in item.items():
+            if key != 'timestamp' and key not in found and _is_number(value):
+                found[key] = True
+    return list(found)
+
+
+class HealthSeries:
+    """
+    Time-sorted, column-oriented view of health items.
+
+    timestamps: int64 array (ms), ascending.
+    columns:    metric name -> float64 array, NaN where the item had no value.
+    """
+
+    def __init__(self, timestamps, columns):
+        self.timestamps = timestamps
+        self.columns = columns
+
+    @classmethod
+    def from_items(cls, items, metrics=None):
+        """
+        Builds a series from raw items. Each value is converted exactly once.
+
+        :param items: List of dicts with 'timestamp' and metric values.
+        :param metrics: Metric keys to extract. None = every numeric key found.
+        """
+        items = list(items)
+        if metrics is None:
+            metrics = discover_metrics(items)
+        n = len(items)
+
+        timestamps = np.fromiter((int(item.get('timestamp', 0)) for item in items), dtype=np.int64, count=n)
+        # Stable sort keeps the same ordering as sorted(..., key=timestamp)
+        order = np.argsort(timestamps, kind='stable')
+
+        columns = {}
+        for key in metrics:
+            col = np.fromiter(
+                (np.nan if (v := item.get(key)) is None else float(v) for item in items),
+                dtype=np.float64,
+                count=n
+            )
+            columns[key] = col[order]
+
+        return cls(timestamps[order], columns)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    # --- Window boundaries ---
+
+    def fixed_window_starts(self, window_ms, aligned=False):
+        """
+        Start indices of fixed-size windows.
+
+        aligned=False: a window opens at the first sample and the next one opens at
+                       the first sample outside it (legacy aggregate_data_by_window behaviour).
+        aligned=True:  windows are aligned to a global grid of window_ms (epoch based).
+        """
+        ts = self.timestamps
+        if len(ts) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        if aligned:
+            buckets = ts // window_ms
+            return np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+
+        starts = []
+        s = 0
+        n = len(ts)
+        while s < n:
+            starts.append(s)
+            s = int(np.searchsorted(ts, ts[s] + window_ms, side='left'))
+        return np.asarray(starts, dtype=np.int64)
+
+    def adaptive_window_bounds(self, min_window_ms, max_window_ms, threshold, target_metric):
+        """
+        (start, end) index pairs (end inclusive) of adaptive windows.
+
+        Same boundaries as the sequential algorithm: a window grows until it spans
+        min_window_ms, then closes at max_window_ms or as soon as the sample stdev of
+        the target metric (>2 valid samples) exceeds the threshold. Variance of any
+        candidate window is O(1) from prefix sums, and candidates are checked in
+        vectorized chunks.
+        """
+        ts = self.timestamps
+        n = len(ts)
+        if n == 0:
+            return []
+
+        target = self.columns.get(target_metric)
+        if target is None:
+            target = np.full(n, np.nan)
+        valid = ~np.isnan(target)
+        # Shift by the mean to limit cancellation in sum-of-squares variance
+        shift = target[valid].mean() if valid.any() else 0.0
+        centered = np.where(valid, target - shift, 0.0)
+
+        cnt = np.concatenate(([0], np.cumsum(valid)))
+        s1 = np.concatenate(([0.0], np.cumsum(centered)))
+        s2 = np.concatenate(([0.0], np.cumsum(centered * centered)))
+
+        # Compare on the variance scale (stdev > t  <=>  var > t^2 for t >= 0)
+        limit = threshold * threshold if threshold > 0 else 0.0
+
+        bounds = []
+        s = 0
+        while s < n:
+            start_ts = ts[s]
+            lo = int(np.searchsorted(ts, start_ts + min_window_ms, side='left'))
+            hi = max(lo, int(np.searchsorted(ts, start_ts + max_window_ms, side='left')))
+
+            end = None
+            scan_from = lo
+            chunk = _SCAN_CHUNK
+            scan_to_limit = min(hi, n)
+            while scan_from < scan_to_limit:
+                scan_to = min(scan_from + chunk, scan_to_limit)
+                e = np.arange(scan_from, scan_to)
+                c = cnt[e + 1] - cnt[s]
+                sum1 = s1[e + 1] - s1[s]
+                sum2 = s2[e + 1] - s2[s]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    var = (sum2 - sum1 * sum1 / c) / (c - 1)
+                    # Prefix sums carry rounding noise proportional to their magnitude.
+                    # Require the variance to clear the threshold by more than that noise so
+                    # exact ties (e.g. integer HRV with stdev == threshold) don't close early.
+                    noise = _TIE_EPSILON * (np.abs(s2[e + 1]) + np.abs(s2[s]) + (np.abs(s1[e + 1]) + np.abs(s1[s])) ** 2 / c) / (c - 1)
+                above = (var - limit > noise) if threshold >= 0 else True
+                hits = np.flatnonzero((c > 2) & above)
+                if len(hits):
+                    end = scan_from + int(hits[0])
+                    break
+                scan_from = scan_to
+                chunk *= 2
+
+            if end is None:
+                end = hi if hi < n else n - 1
+
+            bounds.append((s, end))
+            s = end + 1
+        return bounds
+
+    # --- Reductions ---
+
+    def window_means(self, starts, metrics=None):
+        """
+        Per-window means via np.add.reduceat.
+
+        :param starts: Ascending start indices; each window runs to the next start.
+        :return: metric -> float64 array of means (NaN for windows with no values).
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        if metrics is None:
+            metrics = list(self.columns)
+        means = {}
+        for key in metrics:
+            col = self.columns.get(key)
+            if col is None or len(starts) == 0:
+                means[key] = np.full(len(starts), np.nan)
+                continue
+            valid = ~np.isnan(col)
+            sums = np.add.reduceat(np.where(valid, col, 0.0), starts)
+            counts = np.add.reduceat(valid.astype(np.int64), starts)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means[key] = np.where(counts > 0, sums / counts, np.nan)
+        return means
+
+    # --- Record output (same shape as the legacy dict-based helpers) ---
+
+    def fixed_windows(self, window_ms=3600000, metrics=DEFAULT_METRICS, aligned=False):
+        starts = self.fixed_window_starts(window_ms, aligned=aligned)
+        means = self.window_means(starts, metrics)
+        results = []
+        for i, s in enumerate(starts):
+            ts = int(self.timestamps[s])
+            agg_item = {'timestamp': ts - ts % window_ms if aligned else ts}
+            for key in metrics:
+                agg_item[key] = _nan_to_none(means[key][i])
+            results.append(agg_item)
+        return results
+
+    def adaptive_windows(self, min_window_ms=300000, max_window_ms=3600000, threshold=5.0, target_metric='heart_rate', metrics=DEFAULT_METRICS):
+        bounds = self.adaptive_window_bounds(min_window_ms, max_window_ms, threshold, target_metric)
+        means = self.window_means([s for s, _ in bounds], metrics)
+        results = []
+        for i, (s, e) in enumerate(bounds):
+            start_ts = int(self.timestamps[s])
+            agg_item = {'timestamp': start_ts}
+            for key in metrics:
+                agg_item[key] = _nan_to_none(means[key][i])
+            agg_item['window_duration_min'] = (int(self.timestamps[e]) - start_ts) / 60000
+            results.append(agg_item)
+        return results
+
+
+def _nan_to_none(value):
+    return None if np.isnan(value) else float(value)
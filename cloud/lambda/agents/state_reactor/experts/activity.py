@@ -1,41 +1,49 @@
 import json
 import os
-from core import llm
-from core.utils import DecimalEncoder
+from core import llm, rules, features, resilience
 from core.llm import ACTIVITY_EXPERT_SCHEMA
 
+# Static prefix (cached with the tool spec); the reading goes into the user message
+SYSTEM_PROMPT = """Analyze the user's physical activity context.
+
+Rules:
+- Sleeping: Heart Rate < 60 AND (sleep_status='ASLEEP' OR (step_count=0 AND accelerometer nearly zero)).
+- Sedentary: Low movement, low HR (Sitting, Desk work).
+- Commuting: High speed (>10km/h) AND low steps.
+- Running/Workout: High HR (>110) AND High movement (MUST have steps > 0 OR accelerometer variance).
+- Meditating: Low HR (<60) AND Awake AND Stationary.
+- Stress/Anxiety: High HR (>100) AND Low movement (Stationary, 0 steps).
+
+Determine the activity type based on these rules. If HR is high but steps are 0 and movement is low, it is NOT a workout (unless explicitly marked), it is likely Stress/Anxiety."""
+
 def handler(event, context):
     print(f"Activity Expert Received: {json.dumps(event)}")
+    resilience.start_invocation(context)
     
     sensor_data = event.get('sensor_data')
     if not sensor_data:
         return {'error': 'Missing sensor_data'}
         
-    sensor_str = json.dumps(sensor_data, cls=DecimalEncoder)
-    
-    # Fast path for Sleep
-    if sensor_data.get('sleep_status') == 'ASLEEP':
-        return {
-            "activity_type": "Sleeping",
-            "intensity": "Low",
-            "reasoning": "User is marked as ASLEEP in sensor data."
-        }
-    
-    prompt = f"""Analyze the user's physical activity context.
-    Sensor Data: {sensor_str}
-    
-    Rules:
-    - Sleeping: Heart Rate < 60 AND (sleep_status='ASLEEP' OR (step_count=0 AND accelerometer nearly zero)).
-    - Sedentary: Low movement, low HR (Sitting, Desk work).
-    - Commuting: High speed (>10km/h) AND low steps.
-    - Running/Workout: High HR (>110) AND High movement (MUST have steps > 0 OR accelerometer variance).
-    - Meditating: Low HR (<60) AND Awake AND Stationary.
-    - Stress/Anxiety: High HR (>100) AND Low movement (Stationary, 0 steps).
+    previous = event.get('previous_sensor_data')
+
+    # Binned features instead of raw JSON, so similar readings give identical (cacheable) prompts
+    sensor_str = features.expert_input(sensor_data, previous)
     
-    Determine the activity type based on these rules. If HR is high but steps are 0 and movement is low, it is NOT a workout (unless explicitly marked), it is likely Stress/Anxiety."""
+    # Fast path: deterministic rules (e.g. ASLEEP, commuting) skip the model
+    rule_result, rule_id = (None, None) if event.get('rules_checked') else rules.evaluate('activity', sensor_data, previous=previous)
+    if rule_result:
+        print(f"Rule Engine Hit: {rule_id}")
+        return rule_result
     
-    result = llm.invoke_model_structured(prompt, "Analyze Activity", ACTIVITY_EXPERT_SCHEMA, temperature=0.5)
+    user_message = f"Sensor Data: {sensor_str}\n\nAnalyze Activity."
+    result = llm.invoke_model_structured(SYSTEM_PROMPT, user_message, ACTIVITY_EXPERT_SCHEMA, temperature=0.5)
     
+    if not result:
+        # Model unavailable (circuit open / deadline): degrade to the rule engine
+        result, rule_id = rules.fallback('activity', sensor_data, previous=previous)
+        if result:
+            print(f"Rule Engine Fallback: {rule_id}")
+
     if not result:
         return {'error': 'Activity Model Failed'}
         
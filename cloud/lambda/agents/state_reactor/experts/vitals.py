@@ -1,30 +1,46 @@
 import json
 import os
-from core import llm
-from core.utils import DecimalEncoder
+from core import llm, rules, features, resilience
 from core.llm import VITALS_EXPERT_SCHEMA
 
+# Static prefix (cached with the tool spec); the reading goes into the user message
+SYSTEM_PROMPT = """Analyze the user's physiological safety.
+
+Rules:
+- Critical: HR > 180 or SpO2 < 90.
+- Abnormal: Fever (BodyTemp > 37.5).
+- Elevated: HR > 100 at rest.
+- Normal: Everything within standard ranges.
+"""
+
 def handler(event, context):
     print(f"Vitals Expert Received: {json.dumps(event)}")
+    resilience.start_invocation(context)
     
     sensor_data = event.get('sensor_data')
     if not sensor_data:
         return {'error': 'Missing sensor_data'}
         
-    sensor_str = json.dumps(sensor_data, cls=DecimalEncoder)
-    
-    prompt = f"""Analyze the user's physiological safety.
-    Sensor Data: {sensor_str}
-    
-    Rules:
-    - Critical: HR > 180 or SpO2 < 90.
-    - Abnormal: Fever (BodyTemp > 37.5).
-    - Elevated: HR > 100 at rest.
-    - Normal: Everything within standard ranges.
-    """
+    previous = event.get('previous_sensor_data')
+
+    # Binned features instead of raw JSON, so similar readings give identical (cacheable) prompts
+    sensor_str = features.expert_input(sensor_data, previous)
+
+    # Fast path: deterministic rules skip the model on unambiguous readings
+    rule_result, rule_id = (None, None) if event.get('rules_checked') else rules.evaluate('vitals', sensor_data, previous=previous)
+    if rule_result:
+        print(f"Rule Engine Hit: {rule_id}")
+        return rule_result
     
-    result = llm.invoke_model_structured(prompt, "Analyze Vitals", VITALS_EXPERT_SCHEMA, temperature=0.2)
+    user_message = f"Sensor Data: {sensor_str}\n\nAnalyze Vitals."
+    result = llm.invoke_model_structured(SYSTEM_PROMPT, user_message, VITALS_EXPERT_SCHEMA, temperature=0.2)
     
+    if not result:
+        # Model unavailable (circuit open / deadline): degrade to the rule engine
+        result, rule_id = rules.fallback('vitals', sensor_data, previous=previous)
+        if result:
+            print(f"Rule Engine Fallback: {rule_id}")
+
     if not result:
         return {'error': 'Vitals Model Failed'}
         
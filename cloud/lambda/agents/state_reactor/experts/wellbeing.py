@@ -1,29 +1,44 @@
 import json
 import os
-from core import llm
-from core.utils import DecimalEncoder
+from core import llm, rules, features, resilience
 from core.llm import WELLBEING_EXPERT_SCHEMA
 
+# Static prefix (cached with the tool spec); reading and history go into the user message
+SYSTEM_PROMPT = """Analyze the user's mental wellbeing and recovery.
+
+Rules:
+- Exhausted: Poor sleep history or high cumulative stress.
+- Stressed: High stress score (>80).
+- Calm: Low stress, good HRV.
+"""
+
 def handler(event, context):
     print(f"Wellbeing Expert Received: {json.dumps(event)}")
+    resilience.start_invocation(context)
     
     sensor_data = event.get('sensor_data')
     history = event.get('history', 'No history')
     
-    sensor_str = json.dumps(sensor_data, cls=DecimalEncoder)
-    
-    prompt = f"""Analyze the user's mental wellbeing and recovery.
-    Sensor Data: {sensor_str}
-    History: {history}
-    
-    Rules:
-    - Exhausted: Poor sleep history or high cumulative stress.
-    - Stressed: High stress score (>80).
-    - Calm: Low stress, good HRV.
-    """
+    previous = event.get('previous_sensor_data')
+
+    # Binned features instead of raw JSON, so similar readings give identical (cacheable) prompts
+    sensor_str = features.expert_input(sensor_data, previous)
+
+    # Fast path: deterministic rules skip the model on unambiguous readings
+    rule_result, rule_id = (None, None) if event.get('rules_checked') else rules.evaluate('wellbeing', sensor_data, previous=previous)
+    if rule_result:
+        print(f"Rule Engine Hit: {rule_id}")
+        return rule_result
     
-    result = llm.invoke_model_structured(prompt, "Analyze Wellbeing", WELLBEING_EXPERT_SCHEMA, temperature=0.5)
+    user_message = f"Sensor Data: {sensor_str}\nHistory: {history}\n\nAnalyze Wellbeing."
+    result = llm.invoke_model_structured(SYSTEM_PROMPT, user_message, WELLBEING_EXPERT_SCHEMA, temperature=0.5)
     
+    if not result:
+        # Model unavailable (circuit open / deadline): degrade to the rule engine
+        result, rule_id = rules.fallback('wellbeing', sensor_data, previous=previous)
+        if result:
+            print(f"Rule Engine Fallback: {rule_id}")
+
     if not result:
         return {'error': 'Wellbeing Model Failed'}
         
@@ -0,0 +1,81 @@
+import json
+from core import llm, rules, features
+from core.utils import DecimalEncoder
+from core.llm import FUSED_ANALYSIS_SCHEMA
+
+# One call produces four structured objects, so it needs more room than a single expert
+FUSED_MAX_TOKENS = 1200
+
+# Static prefix (cached with the tool spec); the reading and context go into the user message
+SYSTEM_PROMPT = """You are the Tamagotchi Health System. Perform the work of three Expert Agents (Activity, Vitals, Wellbeing) and their Supervisor in one step.
+
+--- ACTIVITY EXPERT RULES ---
+- Sleeping: Heart Rate < 60 AND (sleep_status='ASLEEP' OR (step_count=0 AND accelerometer nearly zero)).
+- Sedentary: Low movement, low HR (Sitting, Desk work).
+- Commuting: High speed (>10km/h) AND low steps.
+- Running/Workout: High HR (>110) AND High movement (MUST have steps > 0 OR accelerometer variance).
+- Meditating: Low HR (<60) AND Awake AND Stationary.
+- Stress/Anxiety: High HR (>100) AND Low movement (Stationary, 0 steps). This is NOT a workout.
+
+--- VITALS EXPERT RULES ---
+- Critical: HR > 180 or SpO2 < 90.
+- Abnormal: Fever (BodyTemp > 37.5).
+- Elevated: HR > 100 at rest.
+- Normal: Everything within standard ranges.
+
+--- WELLBEING EXPERT RULES ---
+- Exhausted: Poor sleep history or high cumulative stress.
+- Stressed: High stress score (>80).
+- Calm: Low stress, good HRV.
+
+--- SUPERVISOR RULES (for 'decision') ---
+- Prioritize VITALS for safety (e.g., if Vitals says 'Critical', state is SICKNESS).
+- Prioritize ACTIVITY for context (e.g., if Activity is 'Running', state is EXERCISE).
+- Prioritize WELLBEING for mood (e.g., if Wellbeing is 'Exhausted', state is TIRED/STRESS).
+- Conflict Resolution: Activity 'Sedentary' + Wellbeing 'Stressed' -> STRESS (Work). Activity 'Sedentary' + Wellbeing 'Calm' -> NEUTRAL/HAPPY.
+
+IMPORTANT: Provide the decision 'reasoning' as a detailed technical explanation of why this state was chosen.
+
+Call the 'pet_state_fused_analysis' tool with all four results.
+"""
+
+def analyze(sensor_data, history, predictive_context, previous_reading=None, usage=None):
+    """
+    Fused execution mode: a single Bedrock call performs the three Expert analyses
+    and the Supervisor decision (replaces the expert fan-out + supervisor hops).
+    Deterministic rule-engine results are passed in as fixed findings and win over
+    the model's output for that expert.
+
+    :param usage: Optional dict that receives the model call's token usage.
+    :return: (experts_result, analysis), or (None, None) if the model call failed.
+    """
+    sensor_features = features.extract_features(sensor_data, previous_reading)
+    fixed = {}
+    for expert in ('activity', 'vitals', 'wellbeing'):
+        rule_result, rule_id = rules.evaluate(expert, features=sensor_features)
+        if rule_result:
+            print(f"Rule Engine Hit ({expert}): {rule_id}")
+            fixed[expert] = rule_result
+
+    sensor_str = features.expert_input(sensor_data, previous_reading)
+    fixed_str = json.dumps(fixed) if fixed else "None"
+
+    user_message = f"""--- INPUT ---
+Sensor Data: {sensor_str}
+History: {history}
+Predictive Trends: {json.dumps(predictive_context, cls=DecimalEncoder)}
+Fixed Findings (already determined, copy them unchanged): {fixed_str}
+
+Analyze and synthesize the state."""
+
+    result = llm.invoke_model_structured(
+        SYSTEM_PROMPT, user_message, FUSED_ANALYSIS_SCHEMA,
+        temperature=0.3, usage=usage, max_tokens=FUSED_MAX_TOKENS
+    )
+
+    if not result or not isinstance(result.get('decision'), dict):
+        print(f"Fused analysis returned no decision: {result}")
+        return None, None
+
+    experts_result = {expert: fixed.get(expert) or result.get(expert) or {} for expert in ('activity', 'vitals', 'wellbeing')}
+    return experts_result, result['decision']
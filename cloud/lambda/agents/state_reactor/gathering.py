@@ -0,0 +1,82 @@
+"""
+Context gathering stage for the State Reactor.
+
+All independent I/O the reactor needs (last reading, historical context, recent
+history, predictive context, user profile, last state) is started concurrently
+at the beginning of an invocation and memoized, so each source is fetched at most
+once. Fetches the reactor only needs late (profile, last state) overlap with the
+expert fan-out. Every fetch is timed to show the critical path.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import database, context, predictions
+
+RECENT_HISTORY_LIMIT = 7
+
+# Source name -> fetch function (user_id, gatherer). A fetch may depend on another
+# source via gatherer.get(); that source is then started (or joined) first.
+FETCHERS = {
+    'last_reading': lambda user_id, g: database.get_last_health_reading(user_id),
+    'historical_context': lambda user_id, g: context.get_historical_context(user_id),
+    'recent_history': lambda user_id, g: database.get_recent_history(user_id, limit=RECENT_HISTORY_LIMIT),
+    'predictive_context': lambda user_id, g: predictions.get_predictive_context(user_id, g.get('recent_history')),
+    'user_profile': lambda user_id, g: database.get_user_profile(user_id),
+    'last_state': lambda user_id, g: database.get_last_state(user_id),
+}
+
+class ContextGatherer:
+    """Per-invocation, memoized, concurrent fetcher of the reactor's context."""
+
+    def __init__(self, user_id, fetchers=None):
+        self.user_id = user_id
+        self.fetchers = fetchers or FETCHERS
+        self.timings = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        # One worker per source, so a fetch waiting on another source can never starve it
+        self._pool = ThreadPoolExecutor(max_workers=len(self.fetchers))
+
+    def _run(self, name):
+        start = time.perf_counter()
+        try:
+            return self.fetchers[name](self.user_id, self)
+        except Exception as e:
+            print(f"Context fetch '{name}' failed: {e}")
+            return None
+        finally:
+            end = time.perf_counter()
+            self.timings[name] = {
+                'start_ms': round((start - self._started_at) * 1000, 1),
+                'duration_ms': round((end - start) * 1000, 1)
+            }
+
+    def start(self, *names):
+        """Starts the given sources (all if none given) unless already started."""
+        with self._lock:
+            for name in names or self.fetchers:
+                if name not in self._futures:
+                    self._futures[name] = self._pool.submit(self._run, name)
+        return self
+
+    def get(self, name):
+        """Result of a source (starting it if needed); None if the fetch failed."""
+        self.start(name)
+        return self._futures[name].result()
+
+    def invalidate(self, name):
+        """Forgets a memoized source, e.g. after the reactor wrote a new state."""
+        with self._lock:
+            self._futures.pop(name, None)
+
+    def report(self):
+        """Logs per-source timings as one JSON line and returns them."""
+        timings = dict(self.timings)
+        print(json.dumps({'context_timings': timings}))
+        return timings
+
+    def close(self):
+        self._pool.shutdown(wait=False)
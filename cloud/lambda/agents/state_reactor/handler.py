@@ -1,94 +1,135 @@
 import json
 import os
-import boto3
 import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from core import database, context, actions, predictions
+from core import database, actions, features, rules, resilience, routing
+import fused
+import backends
+import gathering
+import speculation
+import streaming
+import transitions
 from core.utils import DecimalEncoder
 
-lambda_client = boto3.client('lambda')
+# 'fanout': 3 Expert Lambdas + Supervisor Lambda; 'fused': one model call for experts + supervisor
+REACTOR_MODE = os.environ.get('REACTOR_MODE', 'fanout').lower()
 
-# Env Vars for Child Lambdas
-ACTIVITY_FUNCTION = os.environ.get('ACTIVITY_FUNCTION')
-VITALS_FUNCTION = os.environ.get('VITALS_FUNCTION')
-WELLBEING_FUNCTION = os.environ.get('WELLBEING_FUNCTION')
-SUPERVISOR_FUNCTION = os.environ.get('SUPERVISOR_FUNCTION')
+# Stream the character message to the watch (message-stream record) while it is generated
+STREAM_CHARACTERIZER = os.environ.get('STREAM_CHARACTERIZER', 'false').lower() == 'true'
+
+# Upper bound on how far back coalesced samples are merged into a run's batch
+MAX_COALESCED_LOOKBACK_MS = int(os.environ.get('MAX_COALESCED_LOOKBACK_SECONDS', '600')) * 1000
+
+# Runs the analysis while the invocation thread starts the speculative characterizer
+_analysis_pool = ThreadPoolExecutor(max_workers=1)
 
 def handler(event, lambda_context):
     """
     Orchestrator for the State Reactor Sub-System.
-    Fans out to 3 Expert Lambdas, then calls Supervisor Lambda.
+    Fans out to 3 Experts, then calls the Supervisor (in-process or as Lambdas, see backends.py).
     """
     user_id = event.get('user_id')
     if not user_id:
         return {'statusCode': 400, 'body': json.dumps({'error': 'Missing user_id'})}
 
     print(f"State Reactor Orchestrator for {user_id}")
+    # Model calls made in this process (fused mode, local agents) share the invocation's deadline
+    resilience.start_invocation(lambda_context)
 
     # 1. PERCEPTION & CONTEXT GATHERING
     # Check if sensor_data was passed in event (fast path)
     sensor_batch = event.get('sensor_data')
-    last_reading = None
-    if sensor_batch and isinstance(sensor_batch, list) and len(sensor_batch) > 0:
-        # Assuming the last item in batch is the latest
-        last_reading = sensor_batch[-1]
+    if not isinstance(sensor_batch, list):
+        sensor_batch = []
+
+    # Batches suppressed by the ingest coalescer since the previous run belong to this run.
+    # Only the last two readings are analyzed, so they are read only if this batch lacks
+    # them (single-sample batch, or a trailing flush without a batch).
+    if event.get('coalesced_since') is not None and len(sensor_batch) < 2:
+        sensor_batch = merge_coalesced_batch(user_id, sensor_batch, event['coalesced_since'])
+
+    # Assuming the last item in batch is the latest
+    last_reading = sensor_batch[-1] if sensor_batch else None
+    previous_reading = sensor_batch[-2] if len(sensor_batch) > 1 else None
     
+    # All context I/O starts concurrently; profile and last state keep loading during the fan-out
+    gatherer = gathering.ContextGatherer(user_id)
+    try:
+        return run_reactor(user_id, gatherer, last_reading, previous_reading)
+    finally:
+        gatherer.report()
+        gatherer.close()
+        # Per-route model cost/latency (covers in-process agents; remote agents log their own)
+        print(json.dumps({'llm_routes': routing.get_report()}))
+
+def run_reactor(user_id, gatherer, last_reading, previous_reading):
+    """Analysis, characterization and state update for one reading (context comes from the gatherer)."""
+    run_started_ms = int(time.time() * 1000)
+    sources = [name for name in gathering.FETCHERS if name != 'last_reading' or not last_reading]
+    gatherer.start(*sources)
+
     if not last_reading:
-        last_reading = database.get_last_health_reading(user_id)
+        last_reading = gatherer.get('last_reading')
         
     if not last_reading:
          return {'statusCode': 200, 'message': 'No data'}
 
-    context_data = context.get_historical_context(user_id) or {}
+    backend = backends.get_backend()
+
+    context_data = gatherer.get('historical_context') or {}
     history_context = context_data.get('context_data', "No historical context.")
     
-    recent_history = database.get_recent_history(user_id, limit=7)
-    predictive_context = predictions.get_predictive_context(user_id, recent_history)
+    predictive_context = gatherer.get('predictive_context')
 
-    # 2. FAN-OUT TO EXPERTS
-    # We use a helper to invoke them in parallel if possible, or sequential.
-    # Since Lambda `handler` is synchronous usually, we can use a simple thread pool or just sequential for now to keep it simple and robust, 
-    # OR use the asyncio loop if the runtime supports it (Python 3.11 does).
-    
-    try:
-        experts_result = asyncio.run(invoke_experts_parallel(last_reading, history_context))
-    except Exception as e:
-        print(f"Expert Fan-Out Failed: {e}")
-        return {'statusCode': 500, 'error': str(e)}
+    # 2-3. EXPERTS + SUPERVISOR: fused single model call, or expert fan-out + supervisor Lambda.
+    # Started first, so the speculative characterizer below (which waits for the last state
+    # and profile) overlaps with it instead of delaying it.
+    analysis_start = time.perf_counter()
+    analysis_future = _analysis_pool.submit(analyze, last_reading, history_context, predictive_context, previous_reading)
 
-    SUPERVISOR_FUNCTION = os.environ.get('SUPERVISOR_FUNCTION')
-    CHARACTERIZER_FUNCTION = os.environ.get('CHARACTERIZER_FUNCTION')
+    # Speculative characterizer for the most likely state, overlapping with experts + supervisor
+    speculative_run = None
+    if speculation.SPECULATIVE_CHARACTERIZER:
+        guess = speculation.guess_state(features.extract_features(last_reading, previous_reading), gatherer.get('last_state'))
+        speculative_run = speculation.start(backend, guess, gatherer.get('user_profile'))
 
-    # 3. SUPERVISOR SYNTHESIS
-    supervisor_payload = {
-        'experts_result': experts_result,
-        'predictive_context': predictive_context
-    }
-    
-    try:
-        supervisor_resp = invoke_lambda(SUPERVISOR_FUNCTION, supervisor_payload)
-    except Exception as e:
-        print(f"Supervisor Failed: {e}")
-        return {'statusCode': 500, 'error': str(e)}
-        
-    if 'error' in supervisor_resp:
-        return {'statusCode': 500, 'error': f"Supervisor Error: {supervisor_resp['error']}"}
+    analysis, mode, usage, error = analysis_future.result()
+    if error:
+        return {'statusCode': 500, 'error': error}
+
+    print(json.dumps({
+        'reactor_mode': mode,
+        'analysis_ms': round((time.perf_counter() - analysis_start) * 1000, 1),
+        'usage': usage
+    }))
 
-    analysis = supervisor_resp # The supervisor returns the structured analysis directly
+    CHARACTERIZER_FUNCTION = os.environ.get('CHARACTERIZER_FUNCTION')
     
     # 4. CHARACTERIZER (New Step)
-    # Fetch Profile
-    user_profile = database.get_user_profile(user_id)
+    # Fetch Profile (prefetched by the gathering stage)
+    user_profile = gatherer.get('user_profile')
     
     char_payload = {
         'analysis': analysis,
         'user_profile': user_profile
     }
+    if STREAM_CHARACTERIZER:
+        char_payload.update({'user_id': user_id, 'stream': True, 'stream_id': run_started_ms})
     
-    final_message = None
+    # Reuse the speculative message if the supervisor agreed with the guess
+    final_message = speculative_run.resolve(analysis) if speculative_run else None
+    if speculative_run:
+        print(json.dumps({'speculation': speculation.get_stats()}))
+
     try:
-        if CHARACTERIZER_FUNCTION:
-            char_resp = invoke_lambda(CHARACTERIZER_FUNCTION, char_payload)
+        if final_message:
+            print(f"Characterized Message (speculative): {final_message}")
+            if STREAM_CHARACTERIZER:
+                streaming.publish(user_id, final_message, state=analysis.get('state'), stream_id=run_started_ms).report()
+        elif backend.name == 'local' or CHARACTERIZER_FUNCTION:
+            char_resp = backend.invoke('characterizer', char_payload)
             if 'message' in char_resp:
                 final_message = char_resp['message']
                 print(f"Characterized Message: {final_message}")
@@ -109,28 +150,32 @@ def handler(event, lambda_context):
 
     analysis['message'] = final_message
 
-    # 5. STATE UPDATE (Legacy Logic)
+    # 5. STATE UPDATE (transition engine: dwell times, hysteresis, priority overrides)
     new_state_enum = analysis.get('state', 'UNKNOWN')
     
-    last_state_item = database.get_last_state(user_id)
+    last_state_item = gatherer.get('last_state')
     last_state_enum = last_state_item.get('stateEnum', 'NONE') if last_state_item else 'NONE'
     
-    should_trigger = (new_state_enum != last_state_enum)
-    
-    last_update_ts = last_state_item.get('timestamp', 0) if last_state_item else 0
-    time_since_update = (int(datetime.now().timestamp() * 1000) - last_update_ts) / 1000
-    
-    if time_since_update > 3600: should_trigger = True
-    if new_state_enum in ['STRESS', 'SICKNESS', 'EXERCISE'] and new_state_enum != last_state_enum:
-        should_trigger = True
-
-    if should_trigger:
-        print(f"State Change: {last_state_enum} -> {new_state_enum}")
-        database.update_state_db(user_id, analysis, time_since_update)
-        actions.invoke_avatar_generator(user_id, analysis)
-    
-    # Always fetch the latest state from DB for the response
-    final_state_item = database.get_last_state(user_id)
+    decision, fields = transitions.decide(last_state_item, new_state_enum)
+    print(f"State Decision: {decision} ({last_state_enum} -> {new_state_enum})")
+
+    final_state_item = last_state_item
+    if decision in (transitions.TRANSITION, transitions.REFRESH):
+        # One conditional write; the committed item is the response (no read-back)
+        committed = database.commit_state(user_id, analysis, extra=fields, reading_ts=last_reading.get('timestamp'))
+        if committed and decision == transitions.TRANSITION:
+            actions.invoke_avatar_generator(user_id, analysis)
+        if committed:
+            final_state_item = committed
+        else:
+            # Rejected (a newer reading was committed concurrently) or failed: serve what is stored
+            gatherer.invalidate('last_state')
+            final_state_item = gatherer.get('last_state')
+    elif decision == transitions.PENDING:
+        database.update_pending_state(user_id, fields['pending_state'], fields['pending_count'])
+    elif last_state_item and last_state_item.get('pending_state'):
+        # The stored state was confirmed again: drop the stale proposal
+        database.update_pending_state(user_id, None)
 
     # Handle case where final_state_item might still be None (e.g., first run, or DB error)
     if not final_state_item:
@@ -145,47 +190,121 @@ def handler(event, lambda_context):
         }, cls=DecimalEncoder)
     }
 
-async def invoke_experts_parallel(sensor_data, history):
-    # Convert data to JSON-ready dicts
-    # (sensor_data is likely a DynamoDB item with Decimals, need handling before sending to other Lambdas if they expect JSON)
-    # Ideally we send the raw dict and let boto3 serialize it, but boto3 default serializer fails on Decimal.
-    # So we convert to JSON string and parse it back or just cast Decimals.
-    # Actually, we can just pass the data and let the helper handle it.
+def analyze(last_reading, history_context, predictive_context, previous_reading):
+    """
+    Runs the analysis in REACTOR_MODE (fused, falling back to fan-out).
+
+    :return: (analysis, mode, usage, error) where error is a message if the pipeline failed.
+    """
+    mode = REACTOR_MODE
+    analysis = None
+    usage = {}
+
+    if mode == 'fused':
+        experts_result, analysis = fused.analyze(last_reading, history_context, predictive_context, previous_reading, usage=usage)
+        if not analysis:
+            print("Fused analysis failed, falling back to fan-out")
+            mode = 'fanout'
+
+    if not analysis:
+        analysis, error = run_fanout(last_reading, history_context, predictive_context, previous_reading)
+        if error:
+            return None, mode, usage, error
+    return analysis, mode, usage, None
+
+def merge_coalesced_batch(user_id, sensor_batch, coalesced_since, now_ms=None):
+    """
+    Prepends samples stored between the previous run and this batch (triggers that the
+    ingest coalescer suppressed) so the run covers the merged batch.
+
+    :param coalesced_since: Newest sensor timestamp covered by the previous run.
+    :param now_ms: End of the range for an empty batch (trailing flush); default now.
+    """
+    if sensor_batch:
+        batch_start = sensor_batch[0].get('timestamp')
+        if not batch_start:
+            return sensor_batch
+        batch_start = int(batch_start)
+    else:
+        batch_start = (now_ms or int(time.time() * 1000)) + 1
+    since = max(int(coalesced_since), batch_start - MAX_COALESCED_LOOKBACK_MS)
+    if since + 1 > batch_start - 1:
+        return sensor_batch
+
+    earlier = database.get_health_data_range(user_id, since + 1, batch_start - 1)
+    if earlier:
+        print(f"Merged {len(earlier)} coalesced samples into batch for {user_id}")
+    return earlier + sensor_batch
+
+def run_fanout(sensor_data, history, predictive_context, previous_reading=None):
+    """
+    Fan-out execution mode: parallel Experts, then the Supervisor (via the execution backend).
+
+    :return: (analysis, error) where error is a message if the pipeline failed.
+    """
+    # We use a helper to invoke them in parallel if possible, or sequential.
+    # Since Lambda `handler` is synchronous usually, we can use a simple thread pool or just sequential for now to keep it simple and robust, 
+    # OR use the asyncio loop if the runtime supports it (Python 3.11 does).
     
-    # Payload construction
-    # Activity & Vitals only need sensor data
-    payload_activity = {'sensor_data': json.loads(json.dumps(sensor_data, cls=DecimalEncoder))}
-    payload_vitals = {'sensor_data': json.loads(json.dumps(sensor_data, cls=DecimalEncoder))}
+    try:
+        experts_result = asyncio.run(invoke_experts_parallel(sensor_data, history, previous_reading))
+    except Exception as e:
+        print(f"Expert Fan-Out Failed: {e}")
+        return None, str(e)
+
+    # SUPERVISOR SYNTHESIS
+    supervisor_payload = {
+        'experts_result': experts_result,
+        'predictive_context': predictive_context
+    }
     
-    # Wellbeing needs history
-    payload_wellbeing = {
-        'sensor_data': json.loads(json.dumps(sensor_data, cls=DecimalEncoder)),
-        'history': history
+    try:
+        supervisor_resp = backends.get_backend().invoke('supervisor', supervisor_payload)
+    except Exception as e:
+        print(f"Supervisor Failed: {e}")
+        return None, str(e)
+        
+    if 'error' in supervisor_resp:
+        return None, f"Supervisor Error: {supervisor_resp['error']}"
+
+    # The supervisor returns the structured analysis directly
+    return supervisor_resp, None
+
+async def invoke_experts_parallel(sensor_data, history, previous_reading=None):
+    # Readings are JSON-native (normalized once in core.database, or sent as JSON by ingest),
+    # so every expert shares the same payload objects; agents treat them as read-only.
+    # Rules are evaluated once below, so the experts go straight to the model.
+    shared = {'sensor_data': sensor_data, 'previous_sensor_data': previous_reading, 'rules_checked': True}
+    payloads = {
+        'activity': shared,
+        'vitals': shared,
+        # Wellbeing also needs history
+        'wellbeing': dict(shared, history=history)
     }
 
-    loop = asyncio.get_running_loop()
-    
-    # Run invokes in parallel threads
-    f1 = loop.run_in_executor(None, invoke_lambda, ACTIVITY_FUNCTION, payload_activity)
-    f2 = loop.run_in_executor(None, invoke_lambda, VITALS_FUNCTION, payload_vitals)
-    f3 = loop.run_in_executor(None, invoke_lambda, WELLBEING_FUNCTION, payload_wellbeing)
-    
-    r1, r2, r3 = await asyncio.gather(f1, f2, f3)
-    
-    return {
-        "activity": r1,
-        "vitals": r2,
-        "wellbeing": r3
+    # Deterministic fast path: experts whose rules match confidently are not called at all
+    results = {}
+    sensor_features = features.extract_features(sensor_data, previous_reading)
+    for expert in ('activity', 'vitals', 'wellbeing'):
+        rule_result, rule_id = rules.evaluate(expert, features=sensor_features)
+        if rule_result:
+            print(f"Rule Engine Hit ({expert}): {rule_id}")
+            results[expert] = rule_result
+
+    # Run remaining experts in parallel on the execution backend
+    backend = backends.get_backend()
+    futures = {
+        expert: asyncio.wrap_future(backend.submit(expert, payload))
+        for expert, payload in payloads.items()
+        if expert not in results
     }
+    responses = await asyncio.gather(*futures.values())
+    results.update(zip(futures.keys(), responses))
 
-def invoke_lambda(func_name, payload):
-    if not func_name:
-        print(f"Error: Function name missing for payload keys: {payload.keys()}")
-        return {"error": "Configuration Error: Missing Function Name"}
-        
-    response = lambda_client.invoke(
-        FunctionName=func_name,
-        InvocationType='RequestResponse',
-        Payload=json.dumps(payload)
-    )
-    return json.loads(response['Payload'].read())
\ No newline at end of file
+    print(json.dumps({'rule_engine': rules.get_stats()}))
+
+    return {
+        "activity": results['activity'],
+        "vitals": results['vitals'],
+        "wellbeing": results['wellbeing']
+    }
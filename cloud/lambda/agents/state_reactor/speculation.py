@@ -0,0 +1,114 @@
+"""
+Speculative characterizer execution.
+
+The character message normally starts only after the experts and the supervisor
+have finished. In speculative mode the reactor guesses the most likely final
+state up front (a rule-engine finding that pins the supervisor's decision, else
+the last stored state) and generates the message for it, from this run's readings,
+in parallel with the analysis. The message is kept if the supervisor agrees and
+discarded otherwise.
+"""
+import os
+import time
+
+from core import features, rules
+
+SPECULATIVE_CHARACTERIZER = os.environ.get('SPECULATIVE_CHARACTERIZER', 'false').lower() == 'true'
+
+# Rule findings that decide the supervisor's state (see the supervisor's priority rules)
+RULE_STATE_GUESSES = {
+    'vitals.critical_heart_rate': 'SICKNESS',
+    'vitals.critical_spo2': 'SICKNESS',
+    'vitals.fever': 'SICKNESS',
+    'activity.workout': 'EXERCISE',
+    'activity.asleep': 'TIRED',
+    'wellbeing.stressed': 'STRESS',
+}
+
+# --- Metrics (per warm container) ---
+
+_stats = {'attempts': 0, 'hits': 0, 'misses': 0, 'failed': 0, 'saved_ms': 0.0}
+
+def get_stats():
+    resolved = _stats['hits'] + _stats['misses']
+    return dict(_stats, hit_rate=_stats['hits'] / resolved if resolved else 0.0)
+
+def reset_stats():
+    _stats.update({'attempts': 0, 'hits': 0, 'misses': 0, 'failed': 0, 'saved_ms': 0.0})
+
+def describe_readings(sensor_features):
+    """This run's readings as the speculative prompt's reasoning (binned, as the experts see them)."""
+    return f"Current readings: {features.feature_key(features.quantize_features(sensor_features))}"
+
+def guess_state(sensor_features, last_state_item):
+    """
+    Most likely final state for this reading. The reasoning passed to the characterizer
+    describes this run's readings (never the previous run's stored reasoning), so the
+    message follows the current data.
+
+    :return: (state, reasoning, source) or None if there is nothing to go on.
+    """
+    readings = describe_readings(sensor_features)
+    for expert in ('vitals', 'activity', 'wellbeing'):
+        result, rule_id = rules.evaluate(expert, features=sensor_features, track=False)
+        if rule_id in RULE_STATE_GUESSES:
+            return RULE_STATE_GUESSES[rule_id], f"{result.get('reasoning', '')} {readings}".strip(), 'rules'
+
+    if last_state_item and last_state_item.get('stateEnum'):
+        return last_state_item['stateEnum'], readings, 'last_state'
+    return None
+
+class SpeculativeRun:
+    """A characterizer call started for a guessed state."""
+
+    def __init__(self, backend, guess, user_profile):
+        self.state, reasoning, self.source = guess
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.future = backend.submit('characterizer', {
+            'analysis': {'state': self.state, 'reasoning': reasoning},
+            'user_profile': user_profile
+        })
+        self.future.add_done_callback(self._mark_done)
+        _stats['attempts'] += 1
+
+    def _mark_done(self, _):
+        self.finished_at = time.perf_counter()
+
+    def resolve(self, analysis):
+        """
+        Returns the speculative message if the supervisor agreed with the guess, else None.
+        Logs the outcome and the latency saved compared to characterizing afterwards.
+        """
+        actual = analysis.get('state')
+        if actual != self.state:
+            _stats['misses'] += 1
+            print(f"Speculation Miss: guessed {self.state} ({self.source}), supervisor chose {actual}")
+            return None
+
+        decided_at = time.perf_counter()
+        try:
+            resp = self.future.result()
+        except Exception as e:
+            resp = {'error': str(e)}
+        if not isinstance(resp, dict) or 'message' not in resp:
+            _stats['failed'] += 1
+            print(f"Speculative characterizer returned no message: {resp}")
+            return None
+
+        # Without speculation the call would have started at decided_at and taken as long
+        finished_at = self.finished_at or time.perf_counter()
+        duration = finished_at - self.started_at
+        saved_ms = ((decided_at + duration) - max(decided_at, finished_at)) * 1000
+        _stats['hits'] += 1
+        _stats['saved_ms'] += saved_ms
+        print(f"Speculation Hit: {self.state} ({self.source}), saved {saved_ms:.0f} ms")
+        return resp['message']
+
+def start(backend, guess, user_profile):
+    """Starts a speculative characterizer run, or returns None if speculation is not possible."""
+    if not guess:
+        return None
+    if backend.name != 'local' and not os.environ.get('CHARACTERIZER_FUNCTION'):
+        return None
+    return SpeculativeRun(backend, guess, user_profile)
@@ -0,0 +1,76 @@
+"""
+Streaming of the character message to the watch.
+
+The characterizer streams its output; MessageStream publishes the text generated
+so far to the short-lived message-stream record (see database.write_message_stream),
+which the state endpoint serves with a version counter before the pipeline commits
+the final state. Partial text is cut at the last complete word and written at most
+every STREAM_FLUSH_MS, except for the first word, which is written immediately.
+"""
+import json
+import os
+import time
+
+from core import database
+
+STREAM_FLUSH_MS = int(os.environ.get('STREAM_FLUSH_MS', '250'))
+
+class MessageStream:
+    """Publishes one message, word by word, for a user."""
+
+    def __init__(self, user_id, state=None, stream_id=None, flush_ms=STREAM_FLUSH_MS, writer=None):
+        self.user_id = user_id
+        self.state = state
+        self.stream_id = stream_id or int(time.time() * 1000)
+        self.flush_ms = flush_ms
+        self.writer = writer or database.write_message_stream
+        self.started_at = time.perf_counter()
+        self.first_word_ms = None
+        self.complete_ms = None
+        self.published = ''
+        self.writes = 0
+        self.version = None
+        self._last_flush = None
+
+    def _publish(self, text, complete=False):
+        version = self.writer(self.user_id, self.stream_id, text, complete=complete, state=self.state)
+        self.writes += 1
+        self.published = text
+        self._last_flush = time.perf_counter()
+        if version is not None:
+            self.version = version
+        return version
+
+    def update(self, text):
+        """Called with the full text generated so far."""
+        words = text[:text.rfind(' ')].rstrip() if ' ' in text else ''
+        if not words or words == self.published:
+            return
+        if self.first_word_ms is None:
+            self.first_word_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+        elif (time.perf_counter() - self._last_flush) * 1000 < self.flush_ms:
+            return
+        self._publish(words)
+
+    def complete(self, text):
+        """Publishes the final message."""
+        if self.first_word_ms is None:
+            self.first_word_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+        self._publish(text, complete=True)
+        self.complete_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    def report(self):
+        timings = {
+            'first_word_ms': self.first_word_ms,
+            'complete_ms': self.complete_ms,
+            'writes': self.writes,
+            'version': self.version
+        }
+        print(json.dumps({'message_stream': timings}))
+        return timings
+
+def publish(user_id, message, state=None, stream_id=None):
+    """Publishes an already complete message (e.g. a speculative characterizer hit)."""
+    stream = MessageStream(user_id, state=state, stream_id=stream_id)
+    stream.complete(message)
+    return stream
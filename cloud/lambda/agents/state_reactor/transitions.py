@@ -0,0 +1,95 @@
+"""
+State-transition engine for the pet state.
+
+Replaces the "new state differs from the stored one" trigger, which wrote
+user_state and regenerated the avatar on every flip of a noisy supervisor
+(e.g. NEUTRAL <-> HAPPY). A proposed state now only becomes the stored state if:
+- it is a priority state (SICKNESS > STRESS = EXERCISE) not outranked by the
+  current one: immediate, no dwell or confirmation, or
+- it was proposed STATE_CONFIRMATIONS times in a row (hysteresis) and the current
+  state has been held for its minimum dwell time.
+Unconfirmed proposals are kept as a small pending record on the user_state item.
+The stored state is refreshed (without an avatar) after STATE_REFRESH_SECONDS.
+Every transition is appended to a compact history ("STATE@epoch_seconds").
+"""
+import os
+import time
+
+STATE_CONFIRMATIONS = int(os.environ.get('STATE_CONFIRMATIONS', '2'))
+DEFAULT_DWELL_SECONDS = int(os.environ.get('STATE_MIN_DWELL_SECONDS', '300'))
+STATE_REFRESH_SECONDS = int(os.environ.get('STATE_REFRESH_SECONDS', '3600'))
+TRANSITION_HISTORY_LENGTH = int(os.environ.get('TRANSITION_HISTORY_LENGTH', '20'))
+
+# Higher wins; a priority state overrides anything it is not outranked by
+STATE_PRIORITY = {
+    'SICKNESS': 3,
+    'STRESS': 2,
+    'EXERCISE': 2,
+}
+
+# Minimum time in a state before a non-priority proposal may replace it
+MIN_DWELL_SECONDS = {
+    'SICKNESS': 900,
+    'STRESS': 600,
+    'EXERCISE': 600,
+    'TIRED': 600,
+}
+
+# Decisions
+TRANSITION = 'transition'   # write new state + regenerate avatar
+REFRESH = 'refresh'         # rewrite the same state (stale), no avatar
+PENDING = 'pending'         # record an unconfirmed proposal only
+HOLD = 'hold'               # nothing to write (clear a stale proposal if there is one)
+
+def _priority(state):
+    return STATE_PRIORITY.get(state, 0)
+
+def history_entry(state, at_s):
+    return f"{state}@{int(at_s)}"
+
+def parse_history(entries):
+    """Compact history -> [(state, epoch_seconds)]."""
+    parsed = []
+    for entry in entries or []:
+        state, _, at = str(entry).rpartition('@')
+        if state and at.isdigit():
+            parsed.append((state, int(at)))
+    return parsed
+
+def decide(last_state_item, proposed, now_s=None):
+    """
+    Decides what to do with the supervisor's proposed state.
+
+    :param last_state_item: Stored user_state item (native values) or None.
+    :param proposed: State proposed by this run.
+    :return: (decision, fields) where fields are the transition bookkeeping attributes
+             to store with the state (TRANSITION/REFRESH) or the pending record (PENDING).
+    """
+    now_s = int(now_s if now_s is not None else time.time())
+    item = last_state_item or {}
+    current = item.get('stateEnum')
+    history = list(item.get('transitions') or [])
+
+    def transition(reason):
+        entries = (history + [history_entry(proposed, now_s)])[-TRANSITION_HISTORY_LENGTH:]
+        return TRANSITION, {'state_since': now_s, 'transitions': entries, 'transition_reason': reason}
+
+    if not current:
+        return transition('initial')
+
+    since_s = int(item.get('state_since') or (item.get('timestamp') or 0) / 1000)
+    updated_s = (item.get('timestamp') or 0) / 1000
+
+    if proposed == current:
+        if now_s - updated_s > STATE_REFRESH_SECONDS:
+            return REFRESH, {'state_since': since_s, 'transitions': history}
+        return HOLD, {}
+
+    if _priority(proposed) and _priority(proposed) >= _priority(current):
+        return transition('priority')
+
+    count = int(item.get('pending_count') or 0) + 1 if item.get('pending_state') == proposed else 1
+    dwell = MIN_DWELL_SECONDS.get(current, DEFAULT_DWELL_SECONDS)
+    if count >= STATE_CONFIRMATIONS and now_s - since_s >= dwell:
+        return transition('confirmed')
+    return PENDING, {'pending_state': proposed, 'pending_count': count}
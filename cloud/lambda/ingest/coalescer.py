@@ -0,0 +1,155 @@
+"""
+Reactor Coalescer
+Per-user debounce in front of the State Reactor. The first batch in a window
+claims the run; further batches for the same user inside the window are only
+stored. The first suppressed batch arms a trailing flush (a delayed message on
+the coalescer queue, due when the window closes), so the newest readings are
+analyzed even if uploads stop; a batch that claims the next window first makes
+the flush a no-op. Safety-critical readings bypass the window and trigger immediately.
+
+The gate item tracks the newest sensor timestamp covered by a run (processed_ts);
+the next run merges the samples stored after it.
+"""
+
+import json
+import math
+import os
+import boto3
+from botocore.exceptions import ClientError
+import rollups
+
+# Set to 0 to disable coalescing (every batch triggers the reactor)
+COALESCE_WINDOW_MS = int(float(os.environ.get('COALESCE_WINDOW_SECONDS', '30')) * 1000)
+
+# SQS queue for trailing flushes (delivered to the ingest function); unset disables them
+COALESCE_QUEUE_URL = os.environ.get('COALESCE_QUEUE_URL')
+# SQS maximum message delay
+MAX_FLUSH_DELAY_SECONDS = 900
+
+# Same thresholds as the Vitals Expert's 'Critical' rule
+CRITICAL_HEART_RATE = 180
+CRITICAL_SPO2 = 90
+
+dynamodb = boto3.resource('dynamodb')
+gate_table = dynamodb.Table(os.environ.get('REACTOR_GATE_TABLE', 'reactor_gate'))
+sqs = boto3.client('sqs')
+
+def is_safety_critical(sensor_batch):
+    """True if any sample in the batch has HR > 180 or SpO2 < 90."""
+    for sample in sensor_batch:
+        values = rollups.extract_metrics(sample)
+        hr = values.get('heart_rate')
+        spo2 = values.get('spo2')
+        if (hr is not None and hr > CRITICAL_HEART_RATE) or (spo2 is not None and spo2 < CRITICAL_SPO2):
+            return True
+    return False
+
+def batch_timestamp(sensor_batch):
+    """Newest sensor timestamp in a batch, or None."""
+    timestamps = [int(sample['timestamp']) for sample in sensor_batch if sample.get('timestamp')]
+    return max(timestamps) if timestamps else None
+
+def _previous_processed(attributes):
+    processed = (attributes or {}).get('processed_ts')
+    return int(processed) if processed is not None else None
+
+def claim_run(user_id, now_ms, batch_ts=None, force=False, window_ms=None):
+    """
+    Tries to claim the reactor run for this user's current coalescing window.
+
+    :param user_id: The user ID.
+    :param now_ms: Current time in milliseconds.
+    :param batch_ts: Newest sensor timestamp of the batch (see batch_timestamp).
+    :param force: Claim even if a window is open (safety-critical path).
+    :param window_ms: Override for COALESCE_WINDOW_MS.
+    :return: (should_run, coalesced_since) where coalesced_since is the newest sensor timestamp
+             covered by the previous run (samples after it belong to the merged batch), or None.
+    """
+    window_ms = COALESCE_WINDOW_MS if window_ms is None else window_ms
+    if window_ms <= 0:
+        return True, None
+
+    values = {
+        ':until': now_ms + window_ms,
+        ':now': now_ms,
+        ':exp': int(now_ms / 1000) + 86400,
+        ':one': 1
+    }
+    assignments = 'window_until = :until, last_run_ts = :now, expires_at = :exp'
+    if batch_ts is not None:
+        assignments += ', processed_ts = :batch_ts'
+        values[':batch_ts'] = batch_ts
+    # This run merges everything stored since the previous one: a pending trailing flush is void
+    update_kwargs = {
+        'Key': {'user_id': user_id},
+        'UpdateExpression': f'SET {assignments} REMOVE trailing_until ADD run_count :one',
+        'ExpressionAttributeValues': values,
+        'ReturnValues': 'UPDATED_OLD'
+    }
+    if not force:
+        update_kwargs['ConditionExpression'] = 'attribute_not_exists(window_until) OR window_until <= :now'
+
+    try:
+        response = gate_table.update_item(**update_kwargs)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        record_suppressed(user_id, now_ms, batch_ts)
+        return False, None
+
+    return True, _previous_processed(response.get('Attributes'))
+
+def record_suppressed(user_id, now_ms, batch_ts=None):
+    """Counts a suppressed trigger and arms the trailing flush of the open window (once per window)."""
+    values = {':one': 1}
+    assignments = 'trailing_until = window_until'
+    if batch_ts is not None:
+        assignments += ', pending_ts = :batch_ts'
+        values[':batch_ts'] = batch_ts
+    response = gate_table.update_item(
+        Key={'user_id': user_id},
+        UpdateExpression=f'SET {assignments} ADD suppressed_count :one',
+        ExpressionAttributeValues=values,
+        ReturnValues='ALL_OLD'
+    )
+    old = response.get('Attributes', {}) if response else {}
+    window_until = old.get('window_until')
+    if window_until is not None and old.get('trailing_until') != window_until:
+        schedule_flush(user_id, int(window_until), now_ms)
+
+def schedule_flush(user_id, window_until, now_ms):
+    """Sends the trailing-flush message for a window, delivered when it closes."""
+    if not COALESCE_QUEUE_URL:
+        print(f"COALESCE_QUEUE_URL not set: no trailing run for {user_id}")
+        return
+    delay = min(MAX_FLUSH_DELAY_SECONDS, max(0, math.ceil((window_until - now_ms) / 1000)))
+    try:
+        sqs.send_message(
+            QueueUrl=COALESCE_QUEUE_URL,
+            MessageBody=json.dumps({'user_id': user_id, 'window_until': window_until}),
+            DelaySeconds=delay
+        )
+    except Exception as e:
+        print(f"Failed to schedule trailing run for {user_id}: {e}")
+
+def claim_flush(user_id, window_until, now_ms, window_ms=None):
+    """
+    Claims the trailing run of a closed window. Fails if a newer batch claimed a run since
+    (its merged batch covered the suppressed samples) or the window is still open.
+
+    :return: (should_run, coalesced_since) as for claim_run.
+    """
+    window_ms = COALESCE_WINDOW_MS if window_ms is None else window_ms
+    try:
+        response = gate_table.update_item(
+            Key={'user_id': user_id},
+            UpdateExpression='SET window_until = :until, last_run_ts = :now, processed_ts = pending_ts REMOVE trailing_until ADD run_count :one',
+            ConditionExpression='trailing_until = :armed AND window_until <= :now AND attribute_exists(pending_ts)',
+            ExpressionAttributeValues={':until': now_ms + window_ms, ':now': now_ms, ':armed': window_until, ':one': 1},
+            ReturnValues='UPDATED_OLD'
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        return False, None
+    return True, _previous_processed(response.get('Attributes'))
@@ -0,0 +1,314 @@
+"""
+Health Rollups
+Maintains per-user pre-aggregated rollups of health metrics at 1-minute,
+5-minute and 1-hour resolution (count, sum, sum of squares, min, max per metric)
+so readers can get 24h trends from a few hundred rows instead of raw samples.
+
+Updated incrementally by the ingest Lambda. Run as a script to backfill
+rollups from existing health_data history.
+"""
+
+import argparse
+import os
+import boto3
+from datetime import datetime, timedelta
+from decimal import Decimal
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+ROLLUP_TABLE = os.environ.get('ROLLUP_TABLE', 'health_rollups')
+DEFAULT_REGION = os.environ.get('AWS_REGION', 'eu-central-1')
+
+# Resolution label -> bucket size in ms
+RESOLUTIONS = {
+    '1m': 60000,
+    '5m': 300000,
+    '1h': 3600000
+}
+
+# Fine-grained buckets expire via DynamoDB TTL; hourly rollups are kept.
+RETENTION_DAYS = {
+    '1m': 2,
+    '5m': 14,
+    '1h': None
+}
+
+# Canonical metric name -> keys it may arrive under (seeder / watch / simulator payloads)
+METRIC_ALIASES = {
+    'heart_rate': ('heart_rate', 'heartRate'),
+    'hrv': ('hrv', 'hrvRMSSD'),
+    'sleep_score': ('sleep_score', 'sleepScore'),
+    'stress_score': ('stress_score', 'stressScore'),
+    'spo2': ('spo2',),
+    'body_temp': ('body_temp', 'bodyTemperature'),
+    'step_count': ('step_count', 'stepCount'),
+}
+
+MAX_MERGE_RETRIES = 3
+
+dynamodb = boto3.resource('dynamodb')
+rollup_table = dynamodb.Table(ROLLUP_TABLE)
+
+def rollup_key(user_id, resolution):
+    return f"{user_id}#{resolution}"
+
+def extract_metrics(sample):
+    """Returns {canonical_metric: Decimal} for every numeric metric in a raw sample."""
+    values = {}
+    for metric, aliases in METRIC_ALIASES.items():
+        for alias in aliases:
+            v = sample.get(alias)
+            if v is None or isinstance(v, bool) or not isinstance(v, (int, float, Decimal)):
+                continue
+            values[metric] = v if isinstance(v, Decimal) else Decimal(str(v))
+            break
+    return values
+
+def merge_stats(a, b):
+    """Merges two {count, sum, sumsq, min, max} dicts."""
+    if not a:
+        return dict(b)
+    if not b:
+        return dict(a)
+    return {
+        'count': a['count'] + b['count'],
+        'sum': a['sum'] + b['sum'],
+        'sumsq': a['sumsq'] + b['sumsq'],
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max'])
+    }
+
+def build_partials(samples):
+    """
+    Aggregates raw samples locally into rollup buckets.
+
+    :param samples: Iterable of raw sensor dicts with a 'timestamp'.
+    :return: {(resolution, bucket_ts): {metric: stats}}
+    """
+    partials = {}
+    for sample in samples:
+        ts = sample.get('timestamp')
+        if ts is None:
+            continue
+        ts = int(ts)
+        values = extract_metrics(sample)
+        if not values:
+            continue
+        for resolution, size_ms in RESOLUTIONS.items():
+            bucket = partials.setdefault((resolution, ts - ts % size_ms), {})
+            for metric, v in values.items():
+                bucket[metric] = merge_stats(bucket.get(metric), {
+                    'count': 1, 'sum': v, 'sumsq': v * v, 'min': v, 'max': v
+                })
+    return partials
+
+def _rollup_item(user_id, resolution, bucket_ts, stats, version):
+    item = {
+        'rollup_key': rollup_key(user_id, resolution),
+        'bucket_ts': bucket_ts,
+        'user_id': user_id,
+        'resolution_ms': RESOLUTIONS[resolution],
+        'stats': stats,
+        'version': version
+    }
+    retention = RETENTION_DAYS.get(resolution)
+    if retention:
+        item['expires_at'] = int(bucket_ts / 1000) + retention * 86400
+    return item
+
+def _create_bucket(table, user_id, resolution, bucket_ts, partial):
+    """Writes a new bucket; False if it already exists."""
+    try:
+        table.put_item(
+            Item=_rollup_item(user_id, resolution, bucket_ts, partial, 1),
+            ConditionExpression=Attr('rollup_key').not_exists()
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+def _add_sums(table, key, partial):
+    """Atomically adds count/sum/sumsq of every metric; returns the stored stats."""
+    names = {'#stats': 'stats', '#ver': 'version', '#count': 'count', '#sum': 'sum', '#sumsq': 'sumsq'}
+    values = {':one': 1}
+    adds = ['#ver :one']
+    for i, (metric, stats) in enumerate(sorted(partial.items())):
+        names[f'#m{i}'] = metric
+        for field in ('count', 'sum', 'sumsq'):
+            values[f':{field}{i}'] = stats[field]
+            adds.append(f'#stats.#m{i}.#{field} :{field}{i}')
+    response = table.update_item(
+        Key=key,
+        UpdateExpression='ADD ' + ', '.join(adds),
+        ConditionExpression='attribute_exists(rollup_key)',
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues='ALL_NEW'
+    )
+    return response['Attributes'].get('stats', {})
+
+def _add_metric_maps(table, key, metrics):
+    """Adds empty stats maps for metrics a stored bucket does not have yet (ADD needs the parent map)."""
+    names = {'#stats': 'stats'}
+    assignments = []
+    for i, metric in enumerate(sorted(metrics)):
+        names[f'#m{i}'] = metric
+        assignments.append(f'#stats.#m{i} = if_not_exists(#stats.#m{i}, :empty)')
+    table.update_item(
+        Key=key,
+        UpdateExpression='SET ' + ', '.join(assignments),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues={':empty': {'count': 0, 'sum': 0, 'sumsq': 0}}
+    )
+
+def _extend_range(table, key, metric, field, value):
+    """Sets stats.metric.min/max to value unless the stored value is already as extreme."""
+    op = '>' if field == 'min' else '<'
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET #stats.#m.#f = :v',
+            ConditionExpression=f'attribute_not_exists(#stats.#m.#f) OR #stats.#m.#f {op} :v',
+            ExpressionAttributeNames={'#stats': 'stats', '#m': metric, '#f': field},
+            ExpressionAttributeValues={':v': value}
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        # A concurrent writer stored a more extreme value
+
+def merge_bucket(user_id, resolution, bucket_ts, partial, table=None):
+    """
+    Merges a partial aggregate into the stored bucket. count/sum/sumsq are added atomically
+    (one update_item), so concurrent ingest batches never lose each other's contribution;
+    min/max are only written (conditionally) when the batch extends the stored range, which
+    is rare once a bucket has a few samples. A new bucket is created with a conditional put.
+
+    :return: True once merged, False if the bucket kept changing shape under concurrent writers.
+    """
+    table = table or rollup_table
+    key = {'rollup_key': rollup_key(user_id, resolution), 'bucket_ts': bucket_ts}
+
+    for _ in range(MAX_MERGE_RETRIES):
+        try:
+            stored = _add_sums(table, key, partial)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code == 'ConditionalCheckFailedException':
+                # No bucket yet; another writer may create it first, then add to theirs
+                if _create_bucket(table, user_id, resolution, bucket_ts, partial):
+                    return True
+                continue
+            if code == 'ValidationException':
+                # A metric this bucket has not seen yet
+                _add_metric_maps(table, key, partial)
+                continue
+            raise
+
+        for metric, stats in partial.items():
+            current = stored.get(metric, {})
+            if current.get('min') is None or stats['min'] < current['min']:
+                _extend_range(table, key, metric, 'min', stats['min'])
+            if current.get('max') is None or stats['max'] > current['max']:
+                _extend_range(table, key, metric, 'max', stats['max'])
+        return True
+
+    print(f"Rollup merge gave up after {MAX_MERGE_RETRIES} attempts: {key}")
+    return False
+
+def update_rollups(user_id, samples, table=None):
+    """
+    Incrementally folds a sensor batch into the user's rollups.
+
+    :return: Number of buckets written.
+    :raises RuntimeError: If a bucket could not be merged (the caller logs it; the
+                          backfill rebuilds the bucket).
+    """
+    partials = build_partials(samples)
+    written = 0
+    failed = []
+    for (resolution, bucket_ts), partial in sorted(partials.items(), key=lambda kv: kv[0][1]):
+        if merge_bucket(user_id, resolution, bucket_ts, partial, table):
+            written += 1
+        else:
+            failed.append(f"{resolution}@{bucket_ts}")
+    if failed:
+        raise RuntimeError(f"Rollups not merged for {user_id}: {', '.join(failed)}")
+    return written
+
+# --- Backfill ---
+
+def backfill_user(user_id, health_table, table, start_ts=None, end_ts=None):
+    """
+    Rebuilds rollups for a user from raw health_data. Buckets are recomputed from
+    scratch and overwritten, so re-running is safe. The range is widened to whole
+    buckets of the coarsest resolution, so no bucket is overwritten with partial sums.
+    """
+    coarsest_ms = max(RESOLUTIONS.values())
+    key_condition = Key('user_id').eq(user_id)
+    if start_ts is not None:
+        start_ts -= start_ts % coarsest_ms
+    if end_ts is not None:
+        end_ts += coarsest_ms - 1 - end_ts % coarsest_ms
+    if start_ts is not None and end_ts is not None:
+        key_condition = key_condition & Key('timestamp').between(start_ts, end_ts)
+    elif start_ts is not None:
+        key_condition = key_condition & Key('timestamp').gte(start_ts)
+    elif end_ts is not None:
+        key_condition = key_condition & Key('timestamp').lte(end_ts)
+
+    query_kwargs = {'KeyConditionExpression': key_condition}
+    partials = {}
+    sample_count = 0
+    while True:
+        response = health_table.query(**query_kwargs)
+        items = response.get('Items', [])
+        sample_count += len(items)
+        for bucket_key, stats in build_partials(items).items():
+            bucket = partials.setdefault(bucket_key, {})
+            for metric, s in stats.items():
+                bucket[metric] = merge_stats(bucket.get(metric), s)
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+    with table.batch_writer(overwrite_by_pkeys=['rollup_key', 'bucket_ts']) as batch:
+        for (resolution, bucket_ts), stats in partials.items():
+            batch.put_item(Item=_rollup_item(user_id, resolution, bucket_ts, stats, 1))
+
+    print(f"Backfilled {len(partials)} rollup buckets from {sample_count} samples for user {user_id}")
+    return len(partials)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill health rollups from existing health_data history")
+    parser.add_argument("--user_id", type=str, action="append", help="User ID to backfill (repeatable)")
+    parser.add_argument("--all-users", action="store_true", help="Backfill every user in the users table")
+    parser.add_argument("--days", type=int, help="Only backfill the last N days (default: full history)")
+    parser.add_argument("--health-table", type=str, default=os.environ.get('HEALTH_TABLE', 'health_data'), help="DynamoDB Health Data Table Name")
+    parser.add_argument("--rollup-table", type=str, default=ROLLUP_TABLE, help="DynamoDB Rollup Table Name")
+    parser.add_argument("--users-table", type=str, default=os.environ.get('USERS_TABLE', 'users'), help="DynamoDB Users Table Name")
+    parser.add_argument("--region", type=str, default=DEFAULT_REGION, help="AWS Region")
+
+    args = parser.parse_args()
+
+    resource = boto3.resource('dynamodb', region_name=args.region)
+    user_ids = list(args.user_id or [])
+    if args.all_users:
+        users_table = resource.Table(args.users_table)
+        scan_kwargs = {'ProjectionExpression': 'user_id'}
+        while True:
+            response = users_table.scan(**scan_kwargs)
+            user_ids.extend(item['user_id'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if not user_ids:
+        parser.error("Provide --user_id or --all-users")
+
+    start = int((datetime.now() - timedelta(days=args.days)).timestamp() * 1000) if args.days else None
+    for uid in user_ids:
+        backfill_user(uid, resource.Table(args.health_table), resource.Table(args.rollup_table), start_ts=start)
@@ -1,7 +1,7 @@
 """
 Sensor Ingestion Lambda
 Receives batched sensor data from phone bridge and stores in DynamoDB.
-Triggers the Orchestrator asynchronously.
+Maintains per-user metric rollups and triggers the Orchestrator asynchronously.
 """
 
 import json
@@ -9,6 +9,8 @@ import os
 import boto3
 from datetime import datetime
 from decimal import Decimal
+import rollups
+import coalescer
 
 # Clients
 dynamodb = boto3.resource('dynamodb')
@@ -27,6 +29,9 @@ def handler(event, context):
     """
     Lambda handler for sensor data ingestion
     """
+    if event.get('Records'):
+        return handle_trailing_flush(event['Records'])
+
     try:
         # Parse request with Decimal for DynamoDB
         body = json.loads(event.get('body', '{}'), parse_float=Decimal)
@@ -50,18 +55,43 @@ def handler(event, context):
         print(f"Received {len(sensor_batch)} samples for user {user_id}")
 
         # 1. Fast Track: Store Data
-        store_sensor_data(user_id, sensor_batch)
+        stored_items = store_sensor_data(user_id, sensor_batch)
+
+        # 1b. Fold the batch into the pre-aggregated rollups (non-blocking for ingestion)
+        try:
+            rollups.update_rollups(user_id, stored_items)
+        except Exception as e:
+            print(f"Failed to update rollups for {user_id}: {e}")
+
+        # 2. Trigger Orchestrator (Async), coalesced per user
+        # Only the first batch in a coalescing window triggers a run; later batches are
+        # merged into the next run. Safety-critical readings always trigger immediately.
+        critical = coalescer.is_safety_critical(stored_items)
+        try:
+            should_run, coalesced_since = coalescer.claim_run(
+                user_id, int(datetime.now().timestamp() * 1000),
+                batch_ts=coalescer.batch_timestamp(stored_items), force=critical
+            )
+        except Exception as e:
+            # Fail open: never drop a trigger because the gate is unavailable
+            print(f"Coalescer unavailable for {user_id}: {e}")
+            should_run, coalesced_since = True, None
 
-        # 2. Trigger Orchestrator (Async)
-        # We trigger it every time data comes in to allow the "Brain" to decide if a state change occurred.
-        # The Orchestrator will handle the "debouncing" or history analysis.
-        invoke_orchestrator(user_id, sensor_batch)
+        if should_run:
+            invoke_orchestrator(
+                user_id, sensor_batch,
+                trigger='safety_critical' if critical else 'sensor_ingest',
+                coalesced_since=coalesced_since
+            )
+        else:
+            print(f"Trigger coalesced for user {user_id} (run already scheduled in current window)")
 
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'message': 'Data processed',
-                'samples_count': len(sensor_batch)
+                'samples_count': len(sensor_batch),
+                'reactor_triggered': should_run
             })
         }
 
@@ -72,8 +102,25 @@ def handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+def handle_trailing_flush(records):
+    """
+    Trailing runs of coalescing windows (delayed messages from the coalescer queue): the
+    reactor is triggered without a batch and merges the samples suppressed in the window.
+    """
+    flushed = 0
+    for record in records:
+        message = json.loads(record['body'])
+        user_id = message['user_id']
+        should_run, coalesced_since = coalescer.claim_flush(user_id, message['window_until'], int(datetime.now().timestamp() * 1000))
+        if should_run:
+            invoke_orchestrator(user_id, [], trigger='coalesced_flush', coalesced_since=coalesced_since)
+            flushed += 1
+    print(f"Trailing flush: {flushed} of {len(records)} windows triggered a run")
+    return {'flushed': flushed}
+
 def store_sensor_data(user_id, sensor_batch):
-    """Store sensor batch in DynamoDB"""
+    """Store sensor batch in DynamoDB. Returns the stored items."""
+    items = []
     with health_table.batch_writer() as batch:
         for sensor in sensor_batch:
             # Flatten and add user_id
@@ -88,9 +135,15 @@ def store_sensor_data(user_id, sensor_batch):
                 **sensor
             }
             batch.put_item(Item=item)
+            items.append(item)
+    return items
 
-def invoke_orchestrator(user_id, sensor_data):
-    """Invoke agentic loop orchestrator Lambda asynchronously"""
+def invoke_orchestrator(user_id, sensor_data, trigger='sensor_ingest', coalesced_since=None):
+    """
+    Invoke agentic loop orchestrator Lambda asynchronously.
+    coalesced_since: newest sensor timestamp covered by the previous run; the reactor
+    merges samples stored after it (suppressed batches) into this run's batch.
+    """
     # Construct function name dynamically based on env or use explicit env var
     function_name = os.environ.get('STATE_REACTOR_FUNCTION_NAME')
     if not function_name:
@@ -98,16 +151,20 @@ def invoke_orchestrator(user_id, sensor_data):
         env = os.environ.get('ENV', 'dev')
         function_name = f"{project}-orchestrator-{env}" # Fallback to old name
     
+    payload = {
+        'user_id': user_id,
+        'trigger': trigger,
+        'timestamp': int(datetime.now().timestamp() * 1000),
+        'sensor_data': sensor_data
+    }
+    if coalesced_since is not None:
+        payload['coalesced_since'] = coalesced_since
+
     try:
         lambda_client.invoke(
             FunctionName=function_name,
             InvocationType='Event', # Async - Fire and Forget
-            Payload=json.dumps({
-                'user_id': user_id,
-                'trigger': 'sensor_ingest',
-                'timestamp': int(datetime.now().timestamp() * 1000),
-                'sensor_data': sensor_data
-            }, cls=DecimalEncoder)
+            Payload=json.dumps(payload, cls=DecimalEncoder)
         )
     except Exception as e:
         print(f"Failed to invoke orchestrator {function_name}: {e}")
\ No newline at end of file
@@ -1,6 +1,7 @@
 import json
 import boto3
 import os
+import time
 import uuid
 from botocore.exceptions import ClientError
 
@@ -9,6 +10,8 @@ s3_client = boto3.client('s3')
 
 users_table = dynamodb.Table(os.environ.get('USERS_TABLE', 'users'))
 user_state_table = dynamodb.Table(os.environ.get('USER_STATE_TABLE', 'tamagotchi-health-user-state-dev'))
+# Character message while the State Reactor is still generating it (short-lived, TTL)
+message_stream_table = dynamodb.Table(os.environ.get('MESSAGE_STREAM_TABLE', 'tamagotchi-health-message-stream-dev'))
 bucket_name = os.environ.get('AVATAR_BUCKET', 'avatars')
 
 def handler(event, context):
@@ -85,9 +88,26 @@ def get_user(event):
         "body": json.dumps(item, default=str)
     }
 
+def get_message_stream(user_id):
+    try:
+        item = message_stream_table.get_item(Key={'user_id': user_id}).get('Item')
+    except Exception as e:
+        print(f"Message stream read failed: {e}")
+        return None
+    # DynamoDB TTL deletion is lazy: the record of a reactor run that died mid-stream
+    # would otherwise be served until it is deleted
+    if item and int(item.get('expires_at', 0)) <= time.time():
+        return None
+    return item
+
 def get_user_state(event):
     """
     Retrieves the current state of the user, including avatar-related information.
+    While the State Reactor is writing a newer message, the in-progress text is served
+    under 'stream_message' with the state it is written for ('stream_state') and
+    'stream_complete', so the watch can show the first words of a state transition
+    before it is committed; 'message_version' increases on every update. A newer message
+    for the stored state also replaces 'message' ('message_complete' false until final).
     """
     path_params = event.get('pathParameters', {})
     user_id = path_params.get('user_id')
@@ -97,17 +117,34 @@ def get_user_state(event):
         
     response = user_state_table.get_item(Key={'user_id': user_id})
     item = response.get('Item')
+    stream = get_message_stream(user_id)
     
-    if not item:
+    if not item and not stream:
         return {"statusCode": 404, "body": json.dumps({"error": "State not found"})}
+    item = item or {}
     
     # Construct clean response for Watch
     response_data = {
         "image_url": item.get('image_url'),
         "video_url": item.get('video_url'),
         "timestamp": int(item.get('timestamp', 0)),
-        "message": item.get('message')
+        "message": item.get('message'),
+        "message_version": int(stream.get('version', 0)) if stream else 0,
+        "message_complete": True
     }
+
+    # A message started after the stored state was written is newer than it. It always
+    # comes with its own state: the transition engine may not commit the state the
+    # message was written for (hysteresis), so it only replaces the stored message
+    # when it was written for the stored state.
+    newer = stream and int(stream.get('stream_id', 0)) > response_data['timestamp']
+    if newer:
+        response_data['stream_message'] = stream.get('message')
+        response_data['stream_state'] = stream.get('stateEnum')
+        response_data['stream_complete'] = bool(stream.get('complete'))
+        if not item or stream.get('stateEnum') == item.get('stateEnum'):
+            response_data['message'] = stream.get('message')
+            response_data['message_complete'] = bool(stream.get('complete'))
     
     return {
         "statusCode": 200,
@@ -0,0 +1,56 @@
+"""
+Prompt size of the Proactive Coach's daily summary.
+
+before: the last 20 raw health items dumped as JSON (DecimalEncoder), i.e. the last
+        ~20 minutes of a watch streaming one contract-format reading per minute.
+after:  daily_summary over the 24h of 5-minute rollups (288 buckets).
+
+Token counts are estimated at 4 characters per token.
+
+Run from the repository root:
+    AWS_DEFAULT_REGION=eu-central-1 PYTHONPATH=cloud/lambda/agents/proactive_coach python cloud/tests/benchmarks/bench_coach_prompt.py
+"""
+import json
+from decimal import Decimal
+
+import daily_summary
+from core.utils import DecimalEncoder
+
+BUCKETS = 288
+START_TS = 1760000000000
+
+def reading(i):
+    return {
+        'user_id': 'user123',
+        'timestamp': Decimal(START_TS + i * 60000),
+        'heartRate': Decimal(70 + i % 9),
+        'stepCount': Decimal(4000 + 12 * i),
+        'bodyTemperature': Decimal('36.8'),
+        'speed': Decimal('1.4'),
+        'raw_complex': {
+            'vitals': {'heartRate': Decimal(70 + i % 9), 'spo2': Decimal('97'), 'hrv': Decimal('41.5')},
+            'activity': {'stepCount': Decimal(4000 + 12 * i), 'speed': Decimal('1.4'), 'calories': Decimal('212.3')},
+            'wellbeing': {'stressScore': Decimal(30 + i % 40), 'sleepStatus': 'AWAKE'},
+            'motion': {'accelerometer': {'x': Decimal('0.12'), 'y': Decimal('0.05'), 'z': Decimal('0.98')}}
+        }
+    }
+
+def bucket(i):
+    stats = {}
+    for metric, value in (('heart_rate', 60 + (i * 7) % 70), ('hrv', 40 + i % 15), ('spo2', 97), ('body_temp', 36.7),
+                          ('stress_score', (i * 3) % 90), ('sleep_score', 78), ('step_count', 10 * i)):
+        value = Decimal(str(value))
+        stats[metric] = {'count': Decimal(5), 'sum': 5 * value, 'sumsq': 5 * value * value, 'min': value, 'max': value}
+    return {'bucket_ts': Decimal(START_TS + i * daily_summary.BUCKET_MS), 'stats': stats}
+
+def main():
+    before = json.dumps([reading(i) for i in range(20)], cls=DecimalEncoder)
+    after = daily_summary.format_summary(daily_summary.build_summary([bucket(i) for i in range(BUCKETS)]))
+    for name, text in (('before', before), ('after', after)):
+        print(f"{name:>6}: {len(text):6d} chars, ~{len(text) // 4:5d} tokens")
+    print(f"reduction: {len(before) / len(after):.1f}x")
+    print()
+    print(after)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Microbenchmark: payload preparation per reading in the State Reactor fan-out.
+
+before: three json.dumps(cls=DecimalEncoder) + json.loads round-trips of the reading
+        (one per expert payload), one for the previous reading, and another
+        round-trip per payload in the local backend.
+after:  one from_dynamo pass at the repository boundary; all expert payloads share
+        the native dict and the backend's normalization is a no-op.
+
+Run from the repository root:
+    PYTHONPATH=cloud/lambda/agents/state_reactor python cloud/tests/benchmarks/bench_payload_serialization.py
+"""
+import json
+import timeit
+from decimal import Decimal
+
+from core.utils import DecimalEncoder, from_dynamo
+
+ITERATIONS = 20000
+
+# DynamoDB item as returned by boto3 for a contract-format watch reading
+READING = {
+    'user_id': 'user123',
+    'timestamp': Decimal('1760000000000'),
+    'heartRate': Decimal('96'),
+    'stepCount': Decimal('4312'),
+    'bodyTemperature': Decimal('36.8'),
+    'speed': Decimal('1.4'),
+    'raw_complex': {
+        'vitals': {'heartRate': Decimal('96'), 'spo2': Decimal('97'), 'hrv': Decimal('41.5')},
+        'activity': {'stepCount': Decimal('4312'), 'speed': Decimal('1.4'), 'calories': Decimal('212.3')},
+        'wellbeing': {'stressScore': Decimal('55'), 'sleepStatus': 'AWAKE'},
+        'motion': {'accelerometer': {'x': Decimal('0.12'), 'y': Decimal('0.05'), 'z': Decimal('0.98')}}
+    }
+}
+PREVIOUS = dict(READING, timestamp=Decimal('1759999940000'), stepCount=Decimal('4290'))
+HISTORY = 'Average HR 72 over the last 7 days'
+
+def _round_trip(value):
+    return json.loads(json.dumps(value, cls=DecimalEncoder))
+
+def before():
+    payloads = [
+        {'sensor_data': _round_trip(READING)},
+        {'sensor_data': _round_trip(READING)},
+        {'sensor_data': _round_trip(READING), 'history': HISTORY},
+    ]
+    previous = _round_trip(PREVIOUS)
+    for payload in payloads:
+        payload['previous_sensor_data'] = previous
+        payload['rules_checked'] = True
+    return [_round_trip(payload) for payload in payloads]
+
+def after():
+    reading, previous = from_dynamo(READING), from_dynamo(PREVIOUS)
+    shared = {'sensor_data': reading, 'previous_sensor_data': previous, 'rules_checked': True}
+    payloads = [shared, shared, dict(shared, history=HISTORY)]
+    return [from_dynamo(payload) for payload in payloads]
+
+def main():
+    assert before() == after()
+    results = {}
+    for name, fn in (('before', before), ('after', after)):
+        seconds = min(timeit.repeat(fn, number=ITERATIONS, repeat=3))
+        results[name] = seconds / ITERATIONS * 1e6
+        print(f"{name:>6}: {results[name]:7.2f} us per reading")
+    print(f"speedup: {results['before'] / results['after']:.1f}x")
+
+if __name__ == '__main__':
+    main()
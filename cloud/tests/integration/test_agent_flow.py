@@ -103,6 +103,7 @@ def test_state_reactor_logic(mock_boto_client, mock_boto_resource):
     # Patch the module-level clients in the imported modules
     with patch('core.database.health_table', mock_table), \
          patch('core.database.user_state_table', mock_table), \
+         patch('core.database.rollup_table', mock_table), \
          patch('core.context.lambda_client', side_effect_client('lambda')), \
          patch('core.llm.bedrock_runtime', side_effect_client('bedrock-runtime')):
          
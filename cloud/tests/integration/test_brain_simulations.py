@@ -16,6 +16,9 @@ def load_handler_isolated(handler_path, module_name, core_parent_path):
     for key in list(sys.modules.keys()):
         if key == 'core' or key.startswith('core.'):
             del sys.modules[key]
+        # Sibling modules of the handler (e.g. gathering, backends) hold references to the old 'core'
+        elif (getattr(sys.modules[key], '__file__', None) or '').startswith(core_parent_path + os.sep):
+            del sys.modules[key]
 
     # 2. Prepend the correct parent path to sys.path
     sys.path.insert(0, core_parent_path)
@@ -127,6 +130,7 @@ def test_state_reactor_scenarios(mock_boto_client, mock_boto_resource):
     # We patch 'core.database' which should now be the one from state_reactor
     with patch('core.database.health_table', mock_table), \
          patch('core.database.user_state_table', mock_table), \
+         patch('core.database.rollup_table', mock_table), \
          patch('core.llm.bedrock_runtime', side_effect_client('bedrock-runtime')), \
          patch('core.context.lambda_client', MagicMock()):
 
@@ -170,8 +174,16 @@ def test_proactive_coach_personas(mock_boto_client, mock_boto_resource):
     ]
     
     # Important: Override the scan return value on the table instance that core.database uses
-    mock_table.scan.return_value = {'Items': users_db_data}
-    mock_table.query.return_value = {'Items': []} 
+    # (the planner reads user IDs with a segmented Scan; all users live in segment 0 here)
+    mock_table.scan.side_effect = lambda **kwargs: {'Items': users_db_data if kwargs.get('Segment', 0) == 0 else []}
+    # New samples since the (absent) coaching watermark, so both users are coached
+    mock_table.query.return_value = {'Items': [{'timestamp': 1600000000000, 'heartRate': 80}]}
+
+    # Coach run tracker and the worker's BatchGetItem of its shard's users
+    mock_runs_table = MagicMock()
+    mock_runs_table.update_item.return_value = {'Attributes': {'user_ids': ['user456', 'user123'], 'attempts': 1}}
+    mock_users_resource = MagicMock()
+    mock_users_resource.batch_get_item.return_value = {'Responses': {coach.database.USERS_TABLE: users_db_data}}
     
     mock_bedrock = MagicMock()
     mock_boto_client.return_value = mock_bedrock
@@ -196,13 +208,17 @@ def test_proactive_coach_personas(mock_boto_client, mock_boto_resource):
     # Patch the FRESHLY LOADED core
     with patch('core.database.users_table', mock_table), \
          patch('core.database.health_table', mock_table), \
+         patch('core.database.rollup_table', mock_table), \
+         patch('core.database.coach_runs_table', mock_runs_table), \
+         patch('core.database.dynamodb', mock_users_resource), \
          patch('core.llm.bedrock_runtime', mock_bedrock):
         
         coach.handler({}, None)
         
         assert mock_bedrock.converse.call_count >= 2
         calls = mock_bedrock.converse.call_args_list
-        prompts = [c[1]['system'][0]['text'] for c in calls]
+        # Persona follows the cached static prefix as a separate system block
+        prompts = [' '.join(block.get('text', '') for block in c[1]['system']) for c in calls]
         
         has_strict = any("STRICT" in p for p in prompts)
         has_kind = any("ENCOURAGING" in p for p in prompts)
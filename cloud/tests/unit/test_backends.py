@@ -0,0 +1,64 @@
+import io
+import json
+import sys
+import types
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import backends
+
+
+def _fake_agent(handler):
+    module = types.ModuleType('fake_agent')
+    module.handler = handler
+    return module
+
+
+def test_local_backend_calls_handler_in_process_with_json_payload():
+    received = {}
+
+    def handler(event, context):
+        received.update(event)
+        return {'status': 'Normal'}
+
+    with patch.dict(sys.modules, {'fake_agent': _fake_agent(handler)}), \
+         patch.dict(backends.AGENT_MODULES, {'vitals': 'fake_agent'}):
+        backend = backends.LocalBackend(max_workers=2)
+        assert backend.submit('vitals', {'sensor_data': {'heartRate': Decimal('72')}}).result() == {'status': 'Normal'}
+
+    assert received == {'sensor_data': {'heartRate': 72}}
+
+
+def test_local_backend_turns_exceptions_into_errors():
+    def handler(event, context):
+        raise RuntimeError('boom')
+
+    with patch.dict(sys.modules, {'fake_agent': _fake_agent(handler)}), \
+         patch.dict(backends.AGENT_MODULES, {'supervisor': 'fake_agent'}):
+        assert 'error' in backends.LocalBackend().invoke('supervisor', {})
+
+
+def test_remote_backend_invokes_configured_function():
+    client = MagicMock()
+    client.invoke.return_value = {'Payload': io.BytesIO(json.dumps({'mental_state': 'Calm'}).encode())}
+
+    with patch.dict('os.environ', {'WELLBEING_FUNCTION': 'wellbeing-fn'}):
+        result = backends.RemoteBackend(client=client).invoke('wellbeing', {'history': 'x'})
+
+    assert result == {'mental_state': 'Calm'}
+    assert client.invoke.call_args[1]['FunctionName'] == 'wellbeing-fn'
+    assert backends.RemoteBackend(client=client).invoke('activity', {}) == {'error': 'Configuration Error: Missing Function Name'}
+
+
+def test_default_backend_is_local_when_agents_are_copackaged():
+    try:
+        backends.set_backend(None)
+        with patch.dict('os.environ', {'EXPERT_BACKEND': ''}):
+            assert backends.agents_copackaged()
+            assert backends.get_backend().name == 'local'
+
+        backends.set_backend(None)
+        with patch.dict('os.environ', {'EXPERT_BACKEND': 'remote'}):
+            assert backends.get_backend().name == 'remote'
+    finally:
+        backends.set_backend(None)
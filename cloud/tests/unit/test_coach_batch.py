@@ -0,0 +1,223 @@
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'agents', 'proactive_coach'))
+import batch
+import watermark
+from core.llm import INTERVENTION_TOOL_SCHEMA
+
+TOOL_NAME = INTERVENTION_TOOL_SCHEMA['toolSpec']['name']
+
+
+class FakeDatabase:
+    """In-memory stand-in for the users table and the batch job tracker."""
+
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+        self.jobs = {}
+        self.open_runs = set()
+        self.watermarks = {}
+
+    def scan_user_ids(self, segments=1):
+        return list(self.user_ids)
+
+    def get_users(self, user_ids):
+        return [dict(self.watermarks.get(user_id, {}), user_id=user_id) for user_id in user_ids]
+
+    def open_batch_job(self, run_id, job_id, model_id, records):
+        self.jobs[run_id] = {'run_id': run_id, 'job_id': job_id, 'model_id': model_id, 'records': records, 'status': 'submitted'}
+        self.open_runs.add(run_id)
+
+    def get_open_batch_runs(self):
+        return sorted(self.open_runs)
+
+    def get_batch_job(self, run_id):
+        job = self.jobs.get(run_id)
+        return dict(job) if job else None
+
+    def mark_batch_records(self, run_id, user_ids):
+        self.jobs[run_id]['done_users'] = self.jobs[run_id].get('done_users', []) + list(user_ids)
+
+    def close_batch_job(self, run_id, status):
+        self.jobs[run_id]['status'] = status
+        self.open_runs.discard(run_id)
+
+    def update_coach_watermark(self, user_id, fields):
+        self.watermarks.setdefault(user_id, {}).update(fields)
+
+
+def _prepare(user):
+    if user['user_id'] == 'u0':
+        return {'user': 'u0', 'skipped': 'no_new_samples'}
+    return {'user_id': user['user_id'], 'persona': 'Name: Test', 'user_message': f"summary of {user['user_id']}", 'latest_ts': 1000, 'digest': 'd1'}
+
+
+def _gated_prepare(user):
+    """_prepare behind the watermark gate, as the handler's prepare_user."""
+    if not watermark.has_new_samples(user, 1000) or watermark.is_unchanged(user, 'd1'):
+        return {'user': user['user_id'], 'skipped': 'unchanged'}
+    return _prepare(user)
+
+
+def _build(request):
+    return batch.model_input('system', request['user_message'], INTERVENTION_TOOL_SCHEMA, temperature=0.7, system_context=request['persona'])
+
+
+def _responder(body):
+    """Answers like the model: an intervention for u1, broken output for u2, none needed otherwise."""
+    text = body['messages'][0]['content'][0]['text']
+    if text.endswith('u2'):
+        return {'content': [{'type': 'text', 'text': 'no tool call'}], 'usage': {'input_tokens': 90, 'output_tokens': 5}}
+    tool_input = {'intervention': 'MOTIVATION' if text.endswith('u1') else 'NONE', 'reasoning': 'sat all day'}
+    return {'content': [{'type': 'tool_use', 'name': TOOL_NAME, 'input': tool_input}], 'usage': {'input_tokens': 100, 'output_tokens': 20}}
+
+
+def test_model_input_forces_the_tool_and_keeps_the_persona_as_system_text():
+    body = _build({'user_message': 'summary', 'persona': 'Name: Test'})
+
+    assert body['anthropic_version'] == batch.ANTHROPIC_VERSION
+    assert [block['text'] for block in body['system']] == ['system', 'Name: Test']
+    assert body['tool_choice'] == {'type': 'tool', 'name': TOOL_NAME}
+    assert body['tools'][0]['input_schema'] == INTERVENTION_TOOL_SCHEMA['toolSpec']['inputSchema']['json']
+
+
+def test_parse_output_rejects_missing_or_invalid_tool_input():
+    valid = _responder(_build({'user_message': 'summary of u1', 'persona': None}))
+
+    assert batch.parse_output(valid, INTERVENTION_TOOL_SCHEMA)['intervention'] == 'MOTIVATION'
+    assert batch.parse_output({'content': [{'type': 'text', 'text': 'hi'}]}, INTERVENTION_TOOL_SCHEMA) is None
+    invalid = {'content': [{'type': 'tool_use', 'name': TOOL_NAME, 'input': {'intervention': 'DANCE', 'reasoning': 'x'}}]}
+    assert batch.parse_output(invalid, INTERVENTION_TOOL_SCHEMA) is None
+
+
+def test_local_batch_round_trip_submits_collects_and_records(tmp_path):
+    fake = FakeDatabase([f'u{i}' for i in range(5)])
+    backend = batch.LocalBatchBackend(str(tmp_path))
+    finished = []
+
+    def finish_user(request, analysis):
+        if analysis is None:
+            raise RuntimeError('no answer')
+        finished.append(request['user_id'])
+        fake.update_coach_watermark(request['user_id'], {'coached_at': int(time.time() * 1000)})
+        return None if analysis['intervention'] == 'NONE' else {'user': request['user_id'], 'intervention': analysis['intervention']}
+
+    with patch.object(batch, 'database', fake), patch.object(batch, '_backend', backend), patch.object(batch, 'COACH_BATCH_MIN_RECORDS', 2):
+        submitted = batch.run('run1', _gated_prepare, coach_prepared=None, build_model_input=_build)
+        pending = batch.collect_open_jobs(finish_user)
+        backend.complete('run1', _responder)
+        # A partially completed job: no output record for u4
+        output = tmp_path / 'run1' / 'output' / 'records.jsonl.out'
+        output.write_text('\n'.join(line for line in output.read_text().splitlines() if json.loads(line)['recordId'] != 'u4'))
+        collected = batch.collect_open_jobs(finish_user)
+
+        # The next run picks up exactly the users without an answer
+        coached = []
+        with patch.object(batch, 'COACH_BATCH_MIN_RECORDS', 3):
+            rerun = batch.run('run2', _gated_prepare, lambda request, deadline: coached.append(request['user_id']), _build)
+
+    assert (submitted['mode'], submitted['records'], submitted['skipped']) == ('batch', 4, 1)
+    records = [json.loads(line) for line in (tmp_path / 'run1' / 'input' / 'records.jsonl').read_text().splitlines()]
+    assert sorted(r['recordId'] for r in records) == ['u1', 'u2', 'u3', 'u4']
+
+    assert pending[0]['status'] == 'pending'
+    assert (collected[0]['status'], collected[0]['answered'], collected[0]['failed'], collected[0]['missing']) == ('collected', 2, 2, 1)
+    assert collected[0]['results'] == [{'user': 'u1', 'intervention': 'MOTIVATION'}]
+    assert sorted(finished) == ['u1', 'u3']
+    assert fake.open_runs == set() and fake.jobs['run1']['status'] == 'collected'
+    assert fake.watermarks['u2']['coach_watermark_ts'] is None
+    assert sorted(coached) == ['u2', 'u4'] and rerun['mode'] == 'sync'
+
+
+def test_failed_job_releases_all_its_users(tmp_path):
+    fake = FakeDatabase(['u1', 'u2'])
+    backend = batch.LocalBatchBackend(str(tmp_path))
+
+    with patch.object(batch, 'database', fake), patch.object(batch, '_backend', backend), patch.object(batch, 'COACH_BATCH_MIN_RECORDS', 2):
+        batch.run('run1', _gated_prepare, coach_prepared=None, build_model_input=_build)
+        backend.put('run1', 'job.json', json.dumps({'status': 'Expired', 'model_id': 'm'}))
+        collected = batch.collect_open_jobs(lambda request, analysis: None)
+
+    assert collected[0]['status'] == 'failed'
+    assert all(fake.watermarks[u]['coach_watermark_ts'] is None for u in ('u1', 'u2'))
+    assert fake.open_runs == set()
+
+
+def test_small_runs_are_coached_synchronously():
+    fake = FakeDatabase(['u0', 'u1', 'u2'])
+    coached = []
+
+    def coach_prepared(request, deadline):
+        coached.append(request['user_id'])
+        return None
+
+    with patch.object(batch, 'database', fake), patch.object(batch, 'COACH_BATCH_MIN_RECORDS', 100):
+        summary = batch.run('run1', _prepare, coach_prepared, _build)
+
+    assert summary['mode'] == 'sync'
+    assert sorted(coached) == ['u1', 'u2']
+    assert fake.jobs == {}
+
+
+def test_users_of_an_open_job_are_not_resubmitted(tmp_path):
+    fake = FakeDatabase(['u1', 'u2', 'u3'])
+    backend = batch.LocalBatchBackend(str(tmp_path))
+
+    with patch.object(batch, 'database', fake), patch.object(batch, '_backend', backend), patch.object(batch, 'COACH_BATCH_MIN_RECORDS', 1):
+        batch.run('run1', _prepare, coach_prepared=None, build_model_input=_build)
+        # New samples and a changed summary every hour (the ungated _prepare)
+        second = batch.run('run2', _prepare, coach_prepared=None, build_model_input=_build)
+        backend.complete('run1', _responder)
+        batch.collect_open_jobs(lambda request, analysis: None)
+        third = batch.run('run3', _prepare, coach_prepared=None, build_model_input=_build)
+
+    assert (second['skipped'], second['mode']) == (3, 'sync')
+    assert (third['mode'], third['records']) == ('batch', 3)
+
+
+def test_users_not_prepared_before_the_deadline_lead_the_next_run(tmp_path):
+    fake = FakeDatabase(['u1', 'u2', 'u3', 'u4'])
+    backend = batch.LocalBatchBackend(str(tmp_path))
+    orders = []
+
+    def pool_run(items, work, deadline=None):
+        # Only the first two users fit before the deadline
+        orders.append([item['user_id'] for item in items])
+        return [work(item, deadline) for item in items[:2]], items[2:]
+
+    with patch.object(batch, 'database', fake), patch.object(batch, '_backend', backend), \
+            patch.object(batch, 'COACH_BATCH_MIN_RECORDS', 1), patch.object(batch.coach_pool, 'run', pool_run):
+        first = batch.run('run1', _prepare, coach_prepared=None, build_model_input=_build)
+        batch.run('run2', _prepare, coach_prepared=None, build_model_input=_build)
+
+    assert first['unprepared'] == 2
+    assert orders[1][:2] == ['u3', 'u4']
+
+
+def test_collection_cut_by_the_deadline_continues_without_recording_twice(tmp_path):
+    fake = FakeDatabase(['u1', 'u3', 'u4', 'u5'])
+    backend = batch.LocalBatchBackend(str(tmp_path))
+    clock = SimpleNamespace(now=0.0)
+    recorded = []
+
+    def finish_user(request, analysis):
+        recorded.append(request['user_id'])
+        clock.now += 1.0
+        return None
+
+    fake_time = SimpleNamespace(monotonic=lambda: clock.now, time=time.time)
+    with patch.object(batch, 'database', fake), patch.object(batch, '_backend', backend), \
+            patch.object(batch, 'COACH_BATCH_MIN_RECORDS', 1), patch.object(batch, 'time', fake_time):
+        batch.run('run1', _prepare, coach_prepared=None, build_model_input=_build)
+        backend.complete('run1', _responder)
+        first = batch.collect_open_jobs(finish_user, deadline=2.0)
+        second = batch.collect_open_jobs(finish_user, deadline=10.0)
+
+    assert (first[0]['status'], first[0]['answered'], first[0]['remaining']) == ('partial', 2, 2)
+    assert 'run1' in fake.jobs and fake.jobs['run1']['status'] == 'collected'
+    assert (second[0]['status'], second[0]['answered'], second[0]['missing']) == ('collected', 2, 0)
+    assert sorted(recorded) == ['u1', 'u3', 'u4', 'u5']
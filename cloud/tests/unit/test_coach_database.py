@@ -0,0 +1,120 @@
+import importlib
+import importlib.util
+import os
+import sys
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+COACH_CORE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'agents', 'proactive_coach', 'core'))
+
+
+def _load_coach_core():
+    """
+    The proactive_coach 'core' package under its own name: the unit tests run with the
+    state reactor's 'core' on the path, which has no coach tracker functions.
+    """
+    if 'coach_core' not in sys.modules:
+        spec = importlib.util.spec_from_loader('coach_core', loader=None, is_package=True)
+        package = importlib.util.module_from_spec(spec)
+        package.__path__ = [COACH_CORE]
+        sys.modules['coach_core'] = package
+    return importlib.import_module('coach_core.database')
+
+
+database = _load_coach_core()
+
+
+def _conflict():
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+
+
+def test_module_is_the_coach_copy():
+    assert os.path.dirname(database.__file__) == COACH_CORE
+
+
+def test_scan_user_ids_reads_every_segment_and_page():
+    pages = {
+        (0, None): {'Items': [{'user_id': 'a'}, {'user_id': 'b'}], 'LastEvaluatedKey': {'user_id': 'b'}},
+        (0, 'b'): {'Items': [{'user_id': 'c'}]},
+        (1, None): {'Items': [{'user_id': 'd'}, {}]},
+    }
+
+    def scan(**kwargs):
+        assert kwargs['ProjectionExpression'] == 'user_id' and kwargs['TotalSegments'] == 2
+        return pages[(kwargs['Segment'], kwargs.get('ExclusiveStartKey', {}).get('user_id'))]
+
+    table = MagicMock()
+    table.scan.side_effect = scan
+    with patch.object(database, 'users_table', table):
+        assert database.scan_user_ids(segments=2) == ['a', 'b', 'c', 'd']
+
+
+def test_get_users_retries_unprocessed_keys_and_keeps_order():
+    resource = MagicMock()
+    table = database.USERS_TABLE
+    resource.batch_get_item.side_effect = [
+        {'Responses': {table: [{'user_id': 'u2', 'motivation_style': 'STRICT'}]},
+         'UnprocessedKeys': {table: {'Keys': [{'user_id': 'u1'}]}}},
+        {'Responses': {table: [{'user_id': 'u1'}]}, 'UnprocessedKeys': {}},
+    ]
+
+    with patch.object(database, 'dynamodb', resource):
+        users = database.get_users(['u1', 'u2', 'u3'])
+
+    assert [u['user_id'] for u in users] == ['u1', 'u2', 'u3']
+    assert resource.batch_get_item.call_args_list[1][1]['RequestItems'] == {table: {'Keys': [{'user_id': 'u1'}]}}
+    # Unknown users get a bare item with the default coach profile
+    assert users[2]['motivation_style'] == database.MOCK_PROFILES['user123']['motivation_style']
+
+
+def test_create_shard_keeps_an_existing_shard():
+    table = MagicMock()
+    table.put_item.side_effect = [None, _conflict()]
+
+    with patch.object(database, 'coach_runs_table', table):
+        assert database.create_shard('run1', 0, ['u1', 'u2'])
+        assert not database.create_shard('run1', 0, ['u1', 'u2'])
+
+    kwargs = table.put_item.call_args_list[0][1]
+    assert kwargs['Item']['run_key'] == 'run1#0' and kwargs['Item']['user_ids'] == ['u1', 'u2']
+    assert kwargs['ConditionExpression'] == 'attribute_not_exists(run_key)'
+
+
+def test_claim_shard_returns_native_values_and_progress_is_a_set():
+    table = MagicMock()
+    table.update_item.side_effect = [
+        {'Attributes': {'run_key': 'run1#0', 'user_ids': ['u1', 'u2'], 'done_users': {'u1'}, 'attempts': Decimal(2)}},
+        _conflict(),
+        None,
+    ]
+
+    with patch.object(database, 'coach_runs_table', table):
+        item = database.claim_shard('run1', 0)
+        assert database.claim_shard('run1', 9) is None
+        database.mark_users_coached('run1', 0, ['u2'])
+
+    assert item['attempts'] == 2 and item['done_users'] == ['u1']
+    mark = table.update_item.call_args_list[2][1]
+    assert mark['UpdateExpression'] == 'ADD done_users :users'
+    assert mark['ExpressionAttributeValues'][':users'] == {'u2'}
+
+
+def test_batch_job_lifecycle_maintains_the_open_set():
+    table = MagicMock()
+    table.get_item.return_value = {'Item': {'run_ids': {'run2', 'run1'}}}
+
+    with patch.object(database, 'coach_runs_table', table):
+        database.open_batch_job('run1', 'job-arn', 'model', 120)
+        assert database.get_open_batch_runs() == ['run1', 'run2']
+        database.mark_batch_records('run1', ['u1', 'u2'])
+        database.close_batch_job('run1', 'collected')
+
+    job = table.put_item.call_args[1]['Item']
+    assert (job['run_key'], job['job_id'], job['records'], job['status']) == ('batch#run1', 'job-arn', 120, 'submitted')
+    opened, marked, closed, removed = (c[1] for c in table.update_item.call_args_list)
+    assert opened['Key'] == {'run_key': database.OPEN_BATCH_KEY} and opened['UpdateExpression'].startswith('ADD run_ids')
+    assert marked['Key'] == {'run_key': 'batch#run1'} and marked['ExpressionAttributeValues'][':users'] == {'u1', 'u2'}
+    assert closed['ExpressionAttributeValues'][':status'] == 'collected'
+    assert removed['UpdateExpression'].startswith('DELETE run_ids') and removed['ExpressionAttributeValues'][':run'] == {'run1'}
@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+import time
+
+from core import instrumentation
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'agents', 'proactive_coach'))
+import coach_pool
+
+
+def _users(n):
+    return [{'user_id': f'u{i}'} for i in range(n)]
+
+
+def test_users_run_concurrently_within_the_limit():
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def coach_user(user, deadline):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return user['user_id'] if user['user_id'] != 'u3' else None
+
+    started = time.perf_counter()
+    results, remaining = coach_pool.run(_users(24), coach_user, limiter=coach_pool.AdaptiveLimiter(max_limit=6))
+
+    assert len(results) == 23 and remaining == []
+    assert 1 < peak[0] <= 6
+    assert time.perf_counter() - started < 24 * 0.02
+
+
+def test_throttled_calls_shrink_the_limit_and_back_off():
+    limiter = coach_pool.AdaptiveLimiter(max_limit=8, backoff_base_ms=50, backoff_cap_ms=200)
+
+    limiter.on_call({'outcome': 'ok', 'retries': 2})
+    limiter.on_call({'outcome': 'timeout', 'retries': 0})
+    assert limiter.limit == 2 and limiter.backoff_ms == 100 and limiter.pause_remaining() > 0
+
+    limiter.on_call({'outcome': 'cache_hit', 'retries': 0})
+    assert limiter.limit == 2
+    limiter.on_call({'outcome': 'ok', 'retries': 0})
+    assert limiter.limit == 3 and limiter.backoff_ms == 0
+
+
+def test_pool_reacts_to_recorded_throttling():
+    limiter = coach_pool.AdaptiveLimiter(max_limit=4, backoff_base_ms=10)
+
+    def coach_user(user, deadline):
+        instrumentation.record('proactive_coach_intervention', 'm', retries=1)
+        return user['user_id']
+
+    results, remaining = coach_pool.run(_users(6), coach_user, limiter=limiter)
+
+    assert sorted(results) == [f'u{i}' for i in range(6)] and remaining == []
+    assert limiter.throttles == 6 and limiter.limit == 1
+    assert limiter.on_call not in instrumentation._listeners
+
+
+def test_stops_before_the_deadline_and_returns_unreached_users():
+    deadlines = []
+
+    def coach_user(user, deadline):
+        deadlines.append(deadline)
+        time.sleep(0.05)
+        return user['user_id']
+
+    deadline = time.monotonic() + 0.2
+    results, remaining = coach_pool.run(_users(40), coach_user, deadline=deadline,
+                                        limiter=coach_pool.AdaptiveLimiter(max_limit=2), user_timeout_ms=60)
+
+    assert time.monotonic() < deadline + 0.05
+    assert results and remaining
+    assert len(results) + len(remaining) == 40
+    assert [u['user_id'] for u in remaining] == [f'u{i}' for i in range(len(results), 40)]
+    assert all(d <= deadline for d in deadlines)
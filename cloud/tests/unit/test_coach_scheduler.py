@@ -0,0 +1,112 @@
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'agents', 'proactive_coach'))
+import scheduler
+
+
+class FakeTracker:
+    """In-memory stand-in for the coach_runs shard tracker and the users table."""
+
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+        self.shards = {}
+        self.scan_segments = None
+
+    def scan_user_ids(self, segments=1):
+        self.scan_segments = segments
+        return list(self.user_ids)
+
+    def get_users(self, user_ids):
+        return [{'user_id': user_id} for user_id in user_ids]
+
+    def create_shard(self, run_id, shard, user_ids):
+        self.shards.setdefault((run_id, shard), {'user_ids': list(user_ids), 'done_users': set(), 'attempts': 0, 'status': 'pending'})
+
+    def claim_shard(self, run_id, shard):
+        item = self.shards.get((run_id, shard))
+        if item is None:
+            return None
+        item.update(attempts=item['attempts'] + 1, status='running')
+        return dict(item, done_users=sorted(item['done_users']))
+
+    def mark_users_coached(self, run_id, shard, user_ids):
+        self.shards[(run_id, shard)]['done_users'].update(user_ids)
+
+    def set_shard_status(self, run_id, shard, status):
+        self.shards[(run_id, shard)]['status'] = status
+
+
+def _patched(tracker, dispatched):
+    actions = SimpleNamespace(invoke_coach_shard=lambda function_name, run_id, shard: dispatched.append(shard) or True)
+    return patch.object(scheduler, 'database', tracker), patch.object(scheduler, 'actions', actions)
+
+
+def test_planner_shards_users_and_dispatches_one_worker_per_shard():
+    tracker, dispatched = FakeTracker([f'u{i}' for i in range(95)]), []
+    db, actions = _patched(tracker, dispatched)
+
+    with db, actions, patch.object(scheduler, 'COACH_SHARD_SIZE', 40):
+        summary = scheduler.plan('run1', coach_user=None, function_name='coach')
+
+    assert summary == {'run_id': 'run1', 'users': 95, 'shards': 3, 'dispatched': 3}
+    assert dispatched == [0, 1, 2]
+    assert [len(tracker.shards[('run1', s)]['user_ids']) for s in range(3)] == [40, 40, 15]
+    assert tracker.scan_segments == scheduler.COACH_SCAN_SEGMENTS
+
+
+def test_failed_shard_retries_only_pending_users():
+    tracker, dispatched = FakeTracker([f'u{i}' for i in range(6)]), []
+    tracker.create_shard('run1', 0, tracker.user_ids)
+    coached = []
+
+    def flaky(user, deadline):
+        coached.append(user['user_id'])
+        if user['user_id'] in ('u2', 'u4') and coached.count(user['user_id']) == 1:
+            raise RuntimeError('no answer')
+        return None
+
+    db, actions = _patched(tracker, dispatched)
+    with db, actions:
+        first = scheduler.run_shard('run1', 0, flaky, function_name='coach')
+        second = scheduler.run_shard('run1', 0, flaky, function_name='coach')
+
+    assert (first['status'], first['coached'], first['remaining']) == (scheduler.RETRYING, 4, 2)
+    assert dispatched == [0]
+    assert (second['status'], second['remaining']) == (scheduler.COMPLETE, 0)
+    assert sorted(coached) == ['u0', 'u1', 'u2', 'u2', 'u3', 'u4', 'u4', 'u5']
+    assert tracker.shards[('run1', 0)]['status'] == scheduler.COMPLETE
+
+
+def test_shard_gives_up_after_max_attempts():
+    tracker, dispatched = FakeTracker(['u0']), []
+    tracker.create_shard('run1', 0, ['u0'])
+
+    def failing(user, deadline):
+        raise RuntimeError('no answer')
+
+    db, actions = _patched(tracker, dispatched)
+    with db, actions, patch.object(scheduler, 'COACH_SHARD_MAX_ATTEMPTS', 2):
+        statuses = [scheduler.run_shard('run1', 0, failing, function_name='coach')['status'] for _ in range(2)]
+
+    assert statuses == [scheduler.RETRYING, scheduler.FAILED]
+    assert dispatched == [0]
+
+
+def test_skipped_users_are_done_and_reported_separately():
+    tracker, dispatched = FakeTracker(['u0', 'u1', 'u2']), []
+    tracker.create_shard('run1', 0, tracker.user_ids)
+
+    def coach_user(user, deadline):
+        if user['user_id'] == 'u0':
+            return {'user': 'u0', 'intervention': 'WALK', 'reasoning': 'sat all day'}
+        return {'user': user['user_id'], 'skipped': 'no_new_samples'}
+
+    db, actions = _patched(tracker, dispatched)
+    with db, actions:
+        summary = scheduler.run_shard('run1', 0, coach_user, function_name='coach')
+
+    assert (summary['status'], summary['coached'], summary['skipped']) == (scheduler.COMPLETE, 3, {'no_new_samples': 2})
+    assert [r['user'] for r in summary['results']] == ['u0']
@@ -0,0 +1,87 @@
+import os
+import sys
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'ingest'))
+import coalescer
+
+
+def test_is_safety_critical_thresholds():
+    assert coalescer.is_safety_critical([{'heartRate': 90}, {'heartRate': Decimal('181')}])
+    assert coalescer.is_safety_critical([{'heart_rate': 70, 'spo2': Decimal('89.5')}])
+    assert not coalescer.is_safety_critical([{'heartRate': 180, 'spo2': 90}])
+
+
+def test_claim_run_first_batch_wins_and_later_batches_coalesce():
+    table = MagicMock()
+    table.update_item.side_effect = [
+        {'Attributes': {'processed_ts': Decimal(1000)}},
+        ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem'),
+        {'Attributes': {'window_until': Decimal(80000)}},
+    ]
+
+    with patch.object(coalescer, 'gate_table', table), patch.object(coalescer, 'schedule_flush') as schedule:
+        assert coalescer.claim_run('u1', 50000, batch_ts=49000, window_ms=30000) == (True, 1000)
+        assert coalescer.claim_run('u1', 60000, batch_ts=59000, window_ms=30000) == (False, None)
+
+    claim_kwargs = table.update_item.call_args_list[0][1]
+    assert 'ConditionExpression' in claim_kwargs
+    assert claim_kwargs['ExpressionAttributeValues'][':until'] == 80000
+    # The next run merges from the newest sensor timestamp, not the ingest clock
+    assert claim_kwargs['ExpressionAttributeValues'][':batch_ts'] == 49000
+    # Suppressed trigger is counted and arms the trailing flush of the open window
+    suppressed_kwargs = table.update_item.call_args_list[2][1]
+    assert 'suppressed_count' in suppressed_kwargs['UpdateExpression']
+    assert suppressed_kwargs['ExpressionAttributeValues'][':batch_ts'] == 59000
+    schedule.assert_called_once_with('u1', 80000, 60000)
+
+
+def test_trailing_flush_is_scheduled_once_per_window():
+    table = MagicMock()
+    table.update_item.return_value = {'Attributes': {'window_until': Decimal(80000), 'trailing_until': Decimal(80000)}}
+
+    with patch.object(coalescer, 'gate_table', table), patch.object(coalescer, 'schedule_flush') as schedule:
+        coalescer.record_suppressed('u1', 65000, 64000)
+
+    schedule.assert_not_called()
+
+
+def test_schedule_flush_delays_until_the_window_closes():
+    sqs = MagicMock()
+    with patch.object(coalescer, 'sqs', sqs), patch.object(coalescer, 'COALESCE_QUEUE_URL', 'queue'):
+        coalescer.schedule_flush('u1', 80000, 60500)
+
+    kwargs = sqs.send_message.call_args[1]
+    assert kwargs['DelaySeconds'] == 20
+    assert kwargs['MessageBody'] == '{"user_id": "u1", "window_until": 80000}'
+
+
+def test_claim_flush_runs_only_for_the_armed_closed_window():
+    table = MagicMock()
+    table.update_item.side_effect = [
+        {'Attributes': {'processed_ts': Decimal(49000)}},
+        ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem'),
+    ]
+
+    with patch.object(coalescer, 'gate_table', table):
+        assert coalescer.claim_flush('u1', 80000, 81000, window_ms=30000) == (True, 49000)
+        # A newer batch claimed a run since: its merged batch covered the suppressed samples
+        assert coalescer.claim_flush('u1', 80000, 82000, window_ms=30000) == (False, None)
+
+    flush_kwargs = table.update_item.call_args_list[0][1]
+    assert 'trailing_until = :armed' in flush_kwargs['ConditionExpression']
+    assert 'processed_ts = pending_ts' in flush_kwargs['UpdateExpression']
+
+
+def test_claim_run_force_skips_window_condition():
+    table = MagicMock()
+    table.update_item.return_value = {'Attributes': {}}
+
+    with patch.object(coalescer, 'gate_table', table):
+        assert coalescer.claim_run('u1', 50000, force=True, window_ms=30000) == (True, None)
+        assert coalescer.claim_run('u1', 50000, window_ms=0) == (True, None)
+
+    assert 'ConditionExpression' not in table.update_item.call_args[1]
+    assert table.update_item.call_count == 1
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'agents', 'proactive_coach'))
+import daily_summary
+
+HOUR_MS = 3600000
+
+
+def _bucket(ts, **metrics):
+    stats = {}
+    for metric, values in metrics.items():
+        values = [Decimal(str(v)) for v in values]
+        stats[metric] = {'count': Decimal(len(values)), 'sum': sum(values), 'sumsq': sum(v * v for v in values),
+                         'min': min(values), 'max': max(values)}
+    return {'bucket_ts': Decimal(ts), 'stats': stats}
+
+
+def test_stats_slope_zones_and_stress_distribution():
+    # 12 buckets (1h): HR climbs 60 -> 115 bpm, stress low for the first half, high after
+    buckets = [_bucket(i * daily_summary.BUCKET_MS, heart_rate=[60 + 5 * i, 60 + 5 * i], stress_score=[20 if i < 6 else 70])
+               for i in range(12)]
+    buckets.append(_bucket(12 * daily_summary.BUCKET_MS, sleep_score=[80]))
+
+    summary = daily_summary.build_summary(buckets)
+
+    hr = summary['metrics']['heart_rate']
+    assert (hr['mean'], hr['min'], hr['max'], hr['n']) == (87.5, 60, 115, 24)
+    assert hr['slope_h'] == 60.0
+    assert summary['hr_zones_min'] == {'<60': 0, '60-100': 40, '100-120': 20, '120-140': 0, '140-160': 0, '>=160': 0}
+    assert summary['stress_pct'] == {'low': 50, 'mid': 0, 'high': 50}
+    assert summary['sleep_score'] == {'mean': 80, 'last': 80}
+
+    text = daily_summary.format_summary(summary)
+    assert 'heart_rate: 87.5 60 115 +60 (24)' in text
+    assert 'hr_zone_minutes: <60:0 60-100:40 100-120:20' in text
+
+
+def test_raw_samples_fallback_uses_sample_spacing():
+    samples = [{'timestamp': Decimal(i * 60000), 'heartRate': Decimal(130), 'stressScore': Decimal(40)} for i in range(10)]
+    summary = daily_summary.build_summary(daily_summary.samples_to_buckets(samples))
+
+    assert summary['metrics']['heart_rate']['n'] == 10
+    assert summary['hr_zones_min']['120-140'] == 14  # 9 one-minute gaps + the last sample's 5 minutes
+    assert summary['stress_pct'] == {'low': 0, 'mid': 100, 'high': 0}
+
+
+def test_step_counter_is_summarised_as_steps_over_the_window():
+    # Counter climbs 4000 -> 9000, resets at midnight (spanning bucket 3: 9100 then 50), climbs to 1200
+    buckets = [_bucket(0, step_count=[4000, 6000]), _bucket(daily_summary.BUCKET_MS, step_count=[6000, 9000]),
+               _bucket(2 * daily_summary.BUCKET_MS, step_count=[50, 9100]), _bucket(3 * daily_summary.BUCKET_MS, step_count=[300, 1200]),
+               _bucket(4 * daily_summary.BUCKET_MS, heart_rate=[70])]
+
+    summary = daily_summary.build_summary(buckets)
+
+    assert 'step_count' not in summary['metrics']
+    assert summary['steps'] == 5000 + 1150
+    assert 'steps: 6150' in daily_summary.format_summary(summary)
+    assert daily_summary.step_total([_bucket(0, heart_rate=[70])]) is None
+
+
+def test_summary_is_an_order_of_magnitude_smaller_than_raw_rows():
+    raw = [{'user_id': 'user123', 'timestamp': Decimal(1760000000000 + i * 60000), 'heartRate': Decimal(72 + i % 5),
+            'stepCount': Decimal(4000 + i), 'bodyTemperature': Decimal('36.7'),
+            'raw_complex': {'vitals': {'heartRate': Decimal(72), 'spo2': Decimal(97), 'hrv': Decimal('41.5')},
+                            'wellbeing': {'stressScore': Decimal(35), 'sleepStatus': 'AWAKE'}}} for i in range(20)]
+    buckets = [_bucket(i * daily_summary.BUCKET_MS, heart_rate=[70, 74], hrv=[41], spo2=[97], body_temp=[36.7],
+                       stress_score=[35], sleep_score=[78], step_count=[4000 + i]) for i in range(288)]
+
+    raw_prompt = json.dumps(raw, default=float)
+    summary_prompt = daily_summary.format_summary(daily_summary.build_summary(buckets))
+    assert len(summary_prompt) * 10 <= len(raw_prompt)
+
+
+def test_load_buckets_reads_the_head_not_rolled_up_from_raw_samples():
+    now = datetime.fromtimestamp(100 * HOUR_MS / 1000)
+    start_ts = (100 - daily_summary.SUMMARY_HOURS) * HOUR_MS
+    # Rollups only for the last two hours (e.g. right after deploy)
+    rolled_up = [_bucket(98 * HOUR_MS, heart_rate=[70])]
+    db = MagicMock()
+    db.get_rollups.return_value = rolled_up
+    db.get_health_data_range.return_value = [{'timestamp': start_ts + 1000, 'heartRate': Decimal(60)}]
+
+    with patch.object(daily_summary, 'database', db):
+        buckets = daily_summary.load_buckets('u1', now=now)
+
+    assert db.get_health_data_range.call_args[0][1:3] == (start_ts, 98 * HOUR_MS - 1)
+    assert [int(b['bucket_ts']) for b in buckets] == [start_ts + 1000, 98 * HOUR_MS]
+
+    # A fully rolled-up window needs no raw read
+    db.reset_mock()
+    db.get_rollups.return_value = [_bucket(start_ts, heart_rate=[65])] + rolled_up
+    with patch.object(daily_summary, 'database', db):
+        daily_summary.load_buckets('u1', now=now)
+    db.get_health_data_range.assert_not_called()
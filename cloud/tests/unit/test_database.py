@@ -0,0 +1,101 @@
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+from core import database
+from core.utils import from_dynamo
+
+
+def paged_query(items, page_size):
+    """Fake Table.query that honours the key range and paginates like DynamoDB."""
+    calls = []
+
+    def query(**kwargs):
+        calls.append(kwargs)
+        values = kwargs['KeyConditionExpression'].get_expression()['values'][1].get_expression()['values']
+        start_ts, end_ts = values[1], values[2]
+        in_range = [i for i in items if start_ts <= i['timestamp'] <= end_ts]
+        offset = kwargs.get('ExclusiveStartKey', {}).get('offset', 0)
+        page = in_range[offset:offset + page_size]
+        response = {'Items': page}
+        if offset + page_size < len(in_range):
+            response['LastEvaluatedKey'] = {'offset': offset + page_size}
+        return response
+
+    return query, calls
+
+
+def test_get_health_data_range_follows_pagination_and_projects():
+    items = [{'timestamp': t, 'heart_rate': 70} for t in range(0, 1000, 10)]
+    query, calls = paged_query(items, page_size=7)
+    table = MagicMock()
+    table.query.side_effect = query
+
+    with patch('core.database.health_table', table):
+        result = database.get_health_data_range('u1', 0, 999, attributes=['heart_rate'])
+
+    assert result == items
+    assert len(calls) == 15
+    assert set(calls[0]['ExpressionAttributeNames'].values()) == {'timestamp', 'heart_rate'}
+    assert calls[1]['ExclusiveStartKey'] == {'offset': 7}
+
+
+def test_get_health_data_range_parallel_segments_keep_order():
+    items = [{'timestamp': t, 'heart_rate': 70} for t in range(0, 1000, 10)]
+    query, calls = paged_query(items, page_size=9)
+    table = MagicMock()
+    table.query.side_effect = query
+
+    with patch('core.database.health_table', table):
+        result = database.get_health_data_range('u1', 0, 999, segments=4)
+
+    assert result == items
+    assert database.split_time_range(0, 999, 4) == [(0, 249), (250, 499), (500, 749), (750, 999)]
+
+
+def test_from_dynamo_converts_once_and_never_copies_native_data():
+    item = {'heartRate': Decimal('72'), 'temp': Decimal('36.6'), 'tags': {'a'}, 'motion': {'x': Decimal('0.5')}, 'name': 'x'}
+    native = from_dynamo(item)
+    assert native == {'heartRate': 72, 'temp': 36.6, 'tags': ['a'], 'motion': {'x': 0.5}, 'name': 'x'}
+    assert type(native['heartRate']) is int
+    assert item['heartRate'] == Decimal('72')
+
+    payload = {'sensor_data': native, 'history': ['x']}
+    assert from_dynamo(payload) is payload
+
+
+def test_readers_return_native_values():
+    table = MagicMock()
+    table.query.return_value = {'Items': [{'heartRate': Decimal('80'), 'timestamp': Decimal('1000')}]}
+
+    with patch('core.database.health_table', table):
+        reading = database.get_last_health_reading('u1')
+        history = database.get_recent_history('u1')
+
+    assert reading == {'heartRate': 80, 'timestamp': 1000}
+    assert not any(isinstance(v, Decimal) for v in history[0].values())
+
+
+def test_commit_state_is_one_conditional_update_returning_the_item():
+    table = MagicMock()
+    table.update_item.return_value = {'Attributes': {'stateEnum': 'HAPPY', 'message': 'Yay', 'image_url': 'https://img', 'state_version': Decimal('4')}}
+
+    with patch('core.database.user_state_table', table):
+        item = database.commit_state('u1', {'state': 'HAPPY', 'message': 'Yay'}, extra={'state_since': 5}, reading_ts=2000)
+
+    assert item == {'stateEnum': 'HAPPY', 'message': 'Yay', 'image_url': 'https://img', 'state_version': 4}
+    kwargs = table.update_item.call_args.kwargs
+    assert kwargs['ReturnValues'] == 'ALL_NEW'
+    assert kwargs['ConditionExpression'] == 'attribute_not_exists(#reading_ts) OR #reading_ts <= :a_reading_ts'
+    assert kwargs['ExpressionAttributeValues'][':a_reading_ts'] == 2000
+    assert {'timestamp', 'stateEnum', 'state_since', 'reading_ts', 'state_version'} <= set(kwargs['ExpressionAttributeNames'].values())
+    assert 'REMOVE #pending_state, #pending_count' in kwargs['UpdateExpression']
+    table.put_item.assert_not_called()
+    table.get_item.assert_not_called()
+
+
+def test_commit_state_drops_out_of_order_commit():
+    table = MagicMock()
+    table.update_item.side_effect = ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+
+    with patch('core.database.user_state_table', table):
+        assert database.commit_state('u1', {'state': 'SAD'}, reading_ts=1000) is None
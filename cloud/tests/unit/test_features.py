@@ -0,0 +1,64 @@
+import json
+from decimal import Decimal
+
+from core import features
+
+
+def test_bin_labels_respect_rule_boundaries():
+    hr_edges, hr_side = features.QUANTIZATION_BINS['heart_rate']
+    assert features.bin_label(180, hr_edges, hr_side) == '110-180'
+    assert features.bin_label(181, hr_edges, hr_side) == '>180'
+    assert features.bin_label(45, hr_edges, hr_side) == '<=50'
+
+    spo2_edges, spo2_side = features.QUANTIZATION_BINS['spo2']
+    assert features.bin_label(90, spo2_edges, spo2_side) == '90-95'
+    assert features.bin_label(89.5, spo2_edges, spo2_side) == '<90'
+    assert features.bin_label(98, spo2_edges, spo2_side) == '>=95'
+
+
+def test_step_delta_from_previous_reading():
+    current = {'stepCount': 5400, 'heartRate': 70}
+    assert features.extract_features(current, {'stepCount': 5400})['steps'] == 0.0
+    assert features.extract_features(current, {'stepCount': 5300})['steps'] == 100.0
+    # Counter reset (new day): fall back to the reported count
+    assert features.extract_features(current, {'stepCount': 9000})['step_delta'] is None
+
+
+def test_contract_nested_payload():
+    reading = {
+        'vitals': {'heartRate': 130, 'spo2': 97},
+        'wellbeing': {'stressScore': 85, 'sleepScore': 72, 'sleepStatus': 'Awake'},
+        'motion': {'accelerometer': {'x': 0.6, 'y': 0.4, 'z': 1.1}}
+    }
+    extracted = features.extract_features(reading)
+    assert extracted['heart_rate'] == 130.0
+    assert extracted['stress_score'] == 85.0
+    assert extracted['sleep_status'] == 'Awake'
+    assert extracted['sleep_score'] == 72.0
+    assert extracted['moving'] is True
+
+
+def test_expert_input_keeps_the_sleep_score():
+    reading = {'heart_rate': 72, 'hrv': 45, 'sleep_score': 35, 'stress_score': 40}
+    assert json.loads(features.expert_input(reading))['sleep_score'] == '<60'
+    assert json.loads(features.expert_input({'sleepScore': 80}))['sleep_score'] == '>=80'
+
+
+def test_similar_readings_share_a_key_and_volatile_fields_are_dropped():
+    a = {'timestamp': 1700000000123, 'heartRate': Decimal('72'), 'spo2': 98, 'accelerometer': {'x': 0.01, 'y': 0.02, 'z': 0.98}, 'deviceId': 'w1'}
+    b = {'timestamp': 1700000055999, 'heart_rate': 88, 'spo2': Decimal('96.5'), 'accelerometer': {'x': 0.0, 'y': 0.03, 'z': 1.01}, 'deviceId': 'w2'}
+
+    key_a = features.expert_input(a)
+    assert key_a == features.expert_input(b)
+    assert 'timestamp' not in key_a and 'w1' not in key_a
+
+    assert key_a != features.expert_input(dict(a, heartRate=105))
+
+
+def test_expert_input_can_send_raw_json():
+    original = features.QUANTIZE_EXPERT_INPUT
+    try:
+        features.QUANTIZE_EXPERT_INPUT = False
+        assert features.expert_input({'heartRate': Decimal('72.5')}) == '{"heartRate": 72.5}'
+    finally:
+        features.QUANTIZE_EXPERT_INPUT = original
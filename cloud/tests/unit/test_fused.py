@@ -0,0 +1,58 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core import llm, llm_cache
+import fused
+
+
+@pytest.fixture(autouse=True)
+def _no_cache():
+    llm_cache.clear()
+    with patch.object(llm_cache, 'cache_table', None):
+        yield
+    llm_cache.clear()
+
+
+def _client(tool_input, usage=None):
+    client = MagicMock()
+    client.converse.return_value = {
+        'output': {'message': {'content': [{'toolUse': {'input': tool_input}}]}},
+        'usage': usage or {'inputTokens': 900, 'outputTokens': 200},
+        'metrics': {'latencyMs': 1500}
+    }
+    return client
+
+
+MODEL_OUTPUT = {
+    'activity': {'activity_type': 'Sedentary', 'intensity': 'Low', 'reasoning': 'Desk work.'},
+    'vitals': {'status': 'Normal', 'reasoning': 'Within range.'},
+    'wellbeing': {'mental_state': 'Anxious', 'reasoning': 'Moderate stress.'},
+    'decision': {'state': 'ANXIOUS', 'mood': 'Restless', 'reasoning': 'Stress while seated.', 'activity': 'Working'}
+}
+
+
+def test_single_call_returns_experts_and_decision():
+    client = _client(MODEL_OUTPUT)
+    usage = {}
+    with patch.object(llm, 'bedrock_runtime', client):
+        experts, decision = fused.analyze({'heartRate': 95, 'stress_score': 60}, 'No history', {}, usage=usage)
+
+    assert client.converse.call_count == 1
+    assert client.converse.call_args[1]['toolConfig']['toolChoice'] == {'tool': {'name': 'pet_state_fused_analysis'}}
+    assert decision['state'] == 'ANXIOUS'
+    assert experts['wellbeing']['mental_state'] == 'Anxious'
+    assert usage == {'inputTokens': 900, 'outputTokens': 200, 'latencyMs': 1500}
+
+
+def test_rule_engine_findings_override_model_output():
+    with patch.object(llm, 'bedrock_runtime', _client(MODEL_OUTPUT)):
+        experts, _ = fused.analyze({'heartRate': 190}, 'No history', {})
+
+    assert experts['vitals']['status'] == 'Critical'
+    assert experts['activity']['activity_type'] == 'Sedentary'
+
+
+def test_missing_decision_signals_fallback():
+    with patch.object(llm, 'bedrock_runtime', _client({'activity': {}})):
+        assert fused.analyze({'heartRate': 95}, 'No history', {}) == (None, None)
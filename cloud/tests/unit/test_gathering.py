@@ -0,0 +1,60 @@
+import threading
+import time
+
+import gathering
+
+
+def _fetchers(calls, delay=0.05):
+    lock = threading.Lock()
+
+    def fetch(name, value):
+        def _fetch(user_id, g):
+            with lock:
+                calls.append(name)
+            time.sleep(delay)
+            return value
+        return _fetch
+
+    return {
+        'historical_context': fetch('historical_context', {'context_data': 'ctx'}),
+        'recent_history': fetch('recent_history', [{'heart_rate': 70}]),
+        'predictive_context': lambda user_id, g: {'history_len': len(g.get('recent_history'))},
+        'user_profile': fetch('user_profile', {'name': 'Alex'}),
+        'last_state': fetch('last_state', {'stateEnum': 'HAPPY'}),
+    }
+
+
+def test_sources_are_fetched_concurrently_and_memoized():
+    calls = []
+    gatherer = gathering.ContextGatherer('u1', fetchers=_fetchers(calls))
+    try:
+        started = time.perf_counter()
+        gatherer.start()
+        assert gatherer.get('predictive_context') == {'history_len': 1}
+        assert gatherer.get('user_profile') == {'name': 'Alex'}
+        assert gatherer.get('last_state') == {'stateEnum': 'HAPPY'}
+        assert gatherer.get('historical_context') == {'context_data': 'ctx'}
+        elapsed = time.perf_counter() - started
+
+        assert gatherer.get('recent_history') == [{'heart_rate': 70}]
+        # Four 50ms fetches overlap instead of running back to back
+        assert elapsed < 0.18
+        assert sorted(calls) == ['historical_context', 'last_state', 'recent_history', 'user_profile']
+        assert set(gatherer.report()) == {'historical_context', 'recent_history', 'predictive_context', 'user_profile', 'last_state'}
+    finally:
+        gatherer.close()
+
+
+def test_invalidate_refetches_and_failures_return_none():
+    calls = []
+    fetchers = _fetchers(calls, delay=0)
+    fetchers['historical_context'] = lambda user_id, g: 1 / 0
+    gatherer = gathering.ContextGatherer('u1', fetchers=fetchers)
+    try:
+        assert gatherer.get('historical_context') is None
+        gatherer.get('last_state')
+        gatherer.invalidate('last_state')
+        gatherer.get('last_state')
+        assert calls.count('last_state') == 2
+    finally:
+        gatherer.close()
@@ -0,0 +1,73 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from core import instrumentation, llm, llm_cache, resilience
+
+
+@pytest.fixture(autouse=True)
+def _fresh_state(monkeypatch):
+    instrumentation.reset()
+    resilience.reset()
+    monkeypatch.setattr(resilience, 'RETRY_BASE_MS', 1)
+    monkeypatch.setattr(resilience, 'HEDGE_AFTER_MS', 0)
+    yield
+    instrumentation.reset()
+    resilience.reset()
+
+
+def _response(tool_input):
+    return {
+        'output': {'message': {'content': [{'toolUse': {'input': tool_input}}]}},
+        'usage': {'inputTokens': 300, 'outputTokens': 40, 'cacheReadInputTokens': 700},
+        'metrics': {'latencyMs': 850}
+    }
+
+
+def test_emf_line_declares_every_metric():
+    record = instrumentation.call_record('vitals_expert_analysis', 'm1', {'inputTokens': 5}, 120, 130.0, 1, 'ok')
+    document = json.loads(instrumentation.emf_line(record))
+
+    directive = document['_aws']['CloudWatchMetrics'][0]
+    assert directive['Dimensions'] == [['Schema'], ['Schema', 'Model', 'Outcome']]
+    for metric in directive['Metrics']:
+        assert metric['Name'] in document
+    assert document['InputTokens'] == 5 and document['Retries'] == 1
+
+
+def test_calls_are_recorded_with_retries_and_outcome(capsys):
+    client = MagicMock()
+    throttle = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'Converse')
+    client.converse.side_effect = [throttle, _response({'message': 'Hi!'})]
+    seen = []
+    instrumentation.add_listener(seen.append)
+    try:
+        with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None):
+            llm.invoke_model_structured('sys', 'msg', llm.SUPERVISOR_SCHEMA)
+            llm.invoke_model_structured('sys', 'msg', llm.SUPERVISOR_SCHEMA)
+    finally:
+        instrumentation.remove_listener(seen.append)
+        llm_cache.clear()
+
+    assert [r['outcome'] for r in seen] == ['ok', 'cache_hit']
+    assert seen[0]['retries'] == 1
+    assert seen[0]['server_latency_ms'] == 850
+    assert seen[0]['cache_read_tokens'] == 700
+    assert '"CloudWatchMetrics"' in capsys.readouterr().out
+
+    summary = instrumentation.get_summary()['pet_state_supervisor_decision']
+    assert summary['calls'] == 2
+    assert summary['outcomes'] == {'ok': 1, 'cache_hit': 1}
+    assert summary['input_tokens'] == 300
+
+
+def test_failed_calls_are_recorded():
+    client = MagicMock()
+    client.converse.side_effect = ValueError('bad request')
+
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None):
+        assert llm.invoke_model_structured('sys', 'msg', llm.SUPERVISOR_SCHEMA, use_cache=False) is None
+
+    assert instrumentation.get_summary()['pet_state_supervisor_decision']['outcomes'] == {'failed': 1}
@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core import llm, llm_cache
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    llm_cache.clear()
+    llm_cache.reset_stats()
+    yield
+    llm_cache.clear()
+    llm_cache.reset_stats()
+
+
+def _converse_response(tool_input):
+    return {'output': {'message': {'content': [{'toolUse': {'input': tool_input}}]}}}
+
+
+def test_request_key_is_canonical():
+    schema_a = {'toolSpec': {'name': 't', 'description': 'd'}}
+    schema_b = {'toolSpec': {'description': 'd', 'name': 't'}}
+    key = llm_cache.request_key('m', 'sys', 'msg', schema_a, 0.5)
+    assert key == llm_cache.request_key('m', 'sys', 'msg', schema_b, 0.5)
+    assert key != llm_cache.request_key('m', 'sys', 'msg', schema_a, 0.7)
+    assert key != llm_cache.request_key('other', 'sys', 'msg', schema_a, 0.5)
+
+
+def test_lru_evicts_least_recently_used_and_expires():
+    cache = llm_cache.LRUCache(max_entries=2, ttl_seconds=10)
+    cache.put('a', 1, now=0)
+    cache.put('b', 2, now=0)
+    assert cache.get('a', now=1) == 1
+    cache.put('c', 3, now=1)
+    assert cache.get('b', now=1) is None
+    assert cache.get('a', now=1) == 1
+    assert cache.get('a', now=11) is None
+
+
+def test_lru_is_safe_under_concurrent_access():
+    cache = llm_cache.LRUCache(max_entries=4, ttl_seconds=0.001)
+    errors = []
+
+    def worker(offset):
+        try:
+            for i in range(2000):
+                key = str((i + offset) % 8)
+                cache.put(key, i)
+                cache.get(key)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == [] and len(cache) <= 4
+
+
+def test_memory_tier_faults_count_as_a_miss():
+    client = MagicMock()
+    client.converse.return_value = _converse_response({'status': 'Normal'})
+    memory = MagicMock()
+    memory.get.side_effect = KeyError('k')
+
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None), patch.object(llm_cache, '_memory', memory):
+        assert llm.invoke_model_structured('sys', 'msg', llm.VITALS_EXPERT_SCHEMA) == {'status': 'Normal'}
+
+    stats = llm_cache.get_stats()['schemas']['vitals_expert_analysis']
+    assert (stats['errors'], stats['misses']) == (1, 1)
+
+
+def test_repeated_request_skips_bedrock():
+    client = MagicMock()
+    client.converse.return_value = _converse_response({'message': 'I feel great!'})
+
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None):
+        first = llm.invoke_model_structured('sys', 'msg', llm.SUPERVISOR_SCHEMA, temperature=0.3)
+        second = llm.invoke_model_structured('sys', 'msg', llm.SUPERVISOR_SCHEMA, temperature=0.3)
+        llm.invoke_model_structured('sys', 'msg', llm.SUPERVISOR_SCHEMA, temperature=0.3, use_cache=False)
+
+    assert first == second == {'message': 'I feel great!'}
+    assert client.converse.call_count == 2
+    stats = llm_cache.get_stats()['schemas']['pet_state_supervisor_decision']
+    assert stats['memory_hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_failed_invocations_are_not_cached():
+    client = MagicMock()
+    client.converse.side_effect = [Exception('throttled'), _converse_response({'status': 'Normal'})]
+
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None):
+        assert llm.invoke_model_structured('sys', 'msg', llm.VITALS_EXPERT_SCHEMA) is None
+        assert llm.invoke_model_structured('sys', 'msg', llm.VITALS_EXPERT_SCHEMA) == {'status': 'Normal'}
+
+
+def test_shared_tier_hit_populates_memory_and_ignores_expired_items():
+    table = MagicMock()
+    table.get_item.return_value = {'Item': {'response': json.dumps({'status': 'Normal'}), 'expires_at': int(time.time()) + 60}}
+
+    with patch.object(llm_cache, 'cache_table', table):
+        assert llm_cache.get('k1', 'vitals') == {'status': 'Normal'}
+        assert llm_cache.get('k1', 'vitals') == {'status': 'Normal'}
+        table.get_item.return_value = {'Item': {'response': '{}', 'expires_at': int(time.time()) - 1}}
+        assert llm_cache.get('k2', 'vitals') is None
+
+    assert table.get_item.call_count == 2
+    assert llm_cache.get_stats()['schemas']['vitals'] == {'memory_hits': 1, 'shared_hits': 1, 'misses': 1, 'stores': 0, 'errors': 0}
+
+
+def test_shared_tier_errors_fail_open():
+    table = MagicMock()
+    table.get_item.side_effect = Exception('throttled')
+    table.put_item.side_effect = Exception('throttled')
+
+    with patch.object(llm_cache, 'cache_table', table):
+        assert llm_cache.get('k', 'vitals') is None
+        llm_cache.put('k', 'vitals', {'status': 'Normal'})
+        assert llm_cache.get('k', 'vitals') == {'status': 'Normal'}
+
+    assert llm_cache.get_stats()['schemas']['vitals']['errors'] == 2
+
+
+def test_per_schema_disable():
+    try:
+        llm_cache.set_schema_enabled('generate_character_message', False)
+        assert not llm_cache.is_enabled('generate_character_message')
+        assert llm_cache.is_enabled('vitals_expert_analysis')
+    finally:
+        llm_cache.set_schema_enabled('generate_character_message', True)
+    assert llm_cache.is_enabled('generate_character_message')
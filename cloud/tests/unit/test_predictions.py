@@ -2,7 +2,7 @@ import pytest
 from datetime import datetime, timedelta
 from decimal import Decimal
 from core.predictions import analyze_trend
-from core.utils import adaptive_aggregate_data
+from core.utils import adaptive_aggregate_data, iter_adaptive_aggregate, rollup_gap, RunningStats
 
 # Mock data for testing adaptive_aggregate_data
 # Create data points with steady HR then a spike then steady again
@@ -122,3 +122,30 @@ def test_adaptive_aggregate_data_stable_period():
     assert len(aggregated) >= (len(steady_data) * (steady_data[1]['timestamp'] - steady_data[0]['timestamp'])) / max_win
 
 
+def test_running_stats_matches_statistics():
+    from statistics import mean, stdev
+    values = [70.0, 72.5, 71.0, 90.0, 65.5, 80.0]
+    stats = RunningStats()
+    for v in values:
+        stats.add(v)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(mean(values))
+    assert stats.stdev == pytest.approx(stdev(values))
+
+
+def test_iter_adaptive_aggregate_streams_from_iterator(mock_data_adaptive):
+    kwargs = dict(min_window_ms=60 * 1000, max_window_ms=5 * 60 * 1000, threshold=2.0)
+
+    # Simulate DynamoDB pages arriving one after another
+    pages = [mock_data_adaptive[i:i + 7] for i in range(0, len(mock_data_adaptive), 7)]
+    streamed = list(iter_adaptive_aggregate((item for page in pages for item in page), **kwargs))
+
+    assert len(streamed) > 1
+    assert streamed == adaptive_aggregate_data(mock_data_adaptive, **kwargs)
+
+
+def test_rollup_gap_covers_the_head_of_a_partly_rolled_up_window():
+    buckets = [{'bucket_ts': Decimal(3_600_000)}, {'bucket_ts': Decimal(3_900_000)}]
+    assert rollup_gap([], 0, 10_000_000, 300_000) == (0, 10_000_000)
+    assert rollup_gap(buckets, 0, 10_000_000, 300_000) == (0, 3_599_999)
+    assert rollup_gap(buckets, 3_500_000, 10_000_000, 300_000) is None
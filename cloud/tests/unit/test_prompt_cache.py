@@ -0,0 +1,109 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core import instrumentation, llm, llm_cache, resilience, routing
+
+
+@pytest.fixture(autouse=True)
+def _fresh_state():
+    routing.reset_report()
+    resilience.reset()
+    yield
+    routing.reset_report()
+    resilience.reset()
+
+
+def _client(usage):
+    client = MagicMock()
+    client.converse.return_value = {
+        'output': {'message': {'content': [{'toolUse': {'input': {'message': 'Hi!'}}}]}},
+        'usage': usage
+    }
+    return client
+
+
+SONNET = 'eu.anthropic.claude-sonnet-4-5-20250929-v1:0'
+HAIKU = 'eu.anthropic.claude-haiku-4-5-20251001-v1:0'
+# A static prefix above Sonnet's minimum (1024 tokens), below Haiku 4.5's (4096)
+LONG_RULES = 'rule ' * 1000
+
+
+def test_cache_point_follows_static_prefix_on_supported_models():
+    request = {'system': [{'text': LONG_RULES}, {'text': 'persona'}]}
+    cached = llm.with_cache_point(request, SONNET)
+    assert cached['system'] == [{'text': LONG_RULES}, {'cachePoint': {'type': 'default'}}, {'text': 'persona'}]
+    assert request['system'] == [{'text': LONG_RULES}, {'text': 'persona'}]
+    assert llm.with_cache_point(request, 'eu.meta.llama3-2-3b-instruct-v1:0') is request
+
+
+def test_prefixes_below_the_model_minimum_get_no_cache_point():
+    assert llm.with_cache_point({'system': [{'text': 'short rules'}]}, SONNET)['system'] == [{'text': 'short rules'}]
+    request = {'system': [{'text': LONG_RULES}]}
+    assert llm.with_cache_point(request, HAIKU) is request
+    # The fused analysis prefix is the one long enough today
+    fused = llm._build_request('x' * 1600, 'msg', llm.FUSED_ANALYSIS_SCHEMA, 0.3, 500)
+    assert {'cachePoint': {'type': 'default'}} in llm.with_cache_point(fused, SONNET)['system']
+    supervisor = llm._build_request('x' * 800, 'msg', llm.SUPERVISOR_SCHEMA, 0.3, 500)
+    assert llm.with_cache_point(supervisor, SONNET) is supervisor
+
+
+class FakePromptCacheBedrock:
+    """Converse stand-in with Bedrock's cache semantics: a prefix up to a cachePoint is
+    written on first use and read afterwards, if it reaches the model's minimum."""
+
+    def __init__(self):
+        self.cached = set()
+
+    def converse(self, modelId, system, toolConfig, messages, **kwargs):
+        usage = {'inputTokens': 50, 'outputTokens': 10, 'cacheReadInputTokens': 0, 'cacheWriteInputTokens': 0}
+        if {'cachePoint': {'type': 'default'}} in system:
+            prefix = (json.dumps(toolConfig), system[0]['text'])
+            tokens = (len(prefix[0]) + len(prefix[1])) // 4
+            if tokens >= llm.prompt_cache_min_tokens(modelId):
+                key = 'cacheReadInputTokens' if prefix in self.cached else 'cacheWriteInputTokens'
+                usage[key] = tokens
+                self.cached.add(prefix)
+        return {'output': {'message': {'content': [{'toolUse': {'input': {'message': 'Hi!'}}}]}}, 'usage': usage}
+
+
+def test_long_static_prefix_is_read_from_cache_on_repeat_calls():
+    reads = []
+    with patch.object(llm, 'bedrock_runtime', FakePromptCacheBedrock()), patch.object(llm_cache, 'cache_table', None), \
+            patch.object(routing, 'route', lambda name, default: (SONNET, 'large', False)):
+        for reading in ('reading 1', 'reading 2'):
+            usage = {}
+            llm.invoke_model_structured(LONG_RULES, reading, llm.SUPERVISOR_SCHEMA, use_cache=False, usage=usage)
+            reads.append(usage.get('cacheReadInputTokens', 0))
+
+    assert reads[0] == 0 and reads[1] > 1024
+
+
+def test_dynamic_data_stays_out_of_the_cached_prefix():
+    client = _client({'inputTokens': 50, 'outputTokens': 10})
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None):
+        llm.invoke_model_structured(LONG_RULES, 'reading 1', llm.SUPERVISOR_SCHEMA, use_cache=False, system_context='persona A')
+        llm.invoke_model_structured(LONG_RULES, 'reading 2', llm.SUPERVISOR_SCHEMA, use_cache=False, system_context='persona B')
+
+    first, second = (c.kwargs for c in client.converse.call_args_list)
+    assert first['system'][:2] == second['system'][:2] == [{'text': LONG_RULES}, {'cachePoint': {'type': 'default'}}]
+    assert first['toolConfig'] == second['toolConfig']
+    assert first['system'][2] == {'text': 'persona A'}
+    assert first['messages'][0]['content'][0]['text'] == 'reading 1'
+
+
+def test_cached_input_tokens_are_accounted_separately():
+    usage = {'inputTokens': 40, 'cacheReadInputTokens': 960, 'cacheWriteInputTokens': 0, 'outputTokens': 20}
+    call_usage = {}
+    with patch.object(llm, 'bedrock_runtime', _client(usage)), patch.object(llm_cache, 'cache_table', None):
+        llm.invoke_model_structured('static rules', 'reading', llm.SUPERVISOR_SCHEMA, use_cache=False, usage=call_usage)
+
+    assert call_usage['cacheReadInputTokens'] == 960
+    record = instrumentation.aggregator.records[-1]
+    assert (record['input_tokens'], record['cache_read_tokens'], record['output_tokens']) == (40, 960, 20)
+    route = routing.get_report()['routes']['pet_state_supervisor_decision']
+    assert route['cache_read_tokens'] == 960
+    assert route['cached_input_share'] == pytest.approx(0.96)
+    # Cache reads are billed at a tenth of the input price
+    assert route['cost_usd'] == pytest.approx((40 + 96) * 3.0 / 1e6 + 20 * 15.0 / 1e6)
@@ -0,0 +1,178 @@
+import threading
+import time
+
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from core import resilience, rules
+
+
+def _throttle():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'Converse')
+
+
+@pytest.fixture(autouse=True)
+def _fast_policy(monkeypatch):
+    resilience.reset()
+    monkeypatch.setattr(resilience, 'RETRY_BASE_MS', 1)
+    monkeypatch.setattr(resilience, 'RETRY_CAP_MS', 2)
+    monkeypatch.setattr(resilience, 'HEDGE_AFTER_MS', 0)
+    yield
+    resilience.reset()
+
+
+def test_hedged_duplicate_wins_when_first_call_is_slow(monkeypatch):
+    monkeypatch.setattr(resilience, 'HEDGE_AFTER_MS', 20)
+    calls = []
+    lock = threading.Lock()
+
+    def call(model_id):
+        with lock:
+            calls.append(model_id)
+            first = len(calls) == 1
+        time.sleep(0.5 if first else 0.01)
+        return 'slow' if first else 'fast'
+
+    started = time.monotonic()
+    assert resilience.invoke(call, ['m1']) == ('fast', 'm1')
+    assert time.monotonic() - started < 0.3
+    stats = resilience.get_stats()
+    assert stats['hedges'] == 1 and stats['hedge_wins'] == 1
+
+
+def test_losing_hedge_stream_is_closed(monkeypatch):
+    monkeypatch.setattr(resilience, 'HEDGE_AFTER_MS', 20)
+    streams = [MagicMock(name='slow'), MagicMock(name='fast')]
+    finished = threading.Event()
+
+    def call(model_id):
+        stream = streams.pop(0)
+        if stream._mock_name == 'slow':
+            time.sleep(0.2)
+            finished.set()
+        return {'stream': stream}
+
+    slow, fast = streams
+    response, _ = resilience.invoke(call, ['m1'])
+    assert response['stream'] is fast
+    finished.wait(1)
+    time.sleep(0.05)
+    slow.close.assert_called_once()
+    fast.close.assert_not_called()
+
+
+def test_throttling_is_retried_with_backoff():
+    responses = [_throttle(), _throttle(), 'ok']
+
+    def call(model_id):
+        result = responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert resilience.invoke(call, ['m1']) == ('ok', 'm1')
+    assert resilience.get_stats()['retries'] == 2
+
+
+def test_breaker_opens_and_fallback_model_answers(monkeypatch):
+    monkeypatch.setattr(resilience, 'MAX_RETRIES', 0)
+    primary_calls = []
+
+    def call(model_id):
+        if model_id == 'primary':
+            primary_calls.append(1)
+            raise _throttle()
+        return 'cheap answer'
+
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD + 2):
+        assert resilience.invoke(call, ['primary', 'cheap']) == ('cheap answer', 'cheap')
+
+    # Once open, the primary is skipped entirely
+    assert len(primary_calls) == resilience.BREAKER_FAILURE_THRESHOLD
+    stats = resilience.get_stats()
+    assert stats['breakers']['primary'] == 'open'
+    assert stats['breaker_skips'] == 2
+
+
+def test_half_open_breaker_closes_after_successful_trial():
+    breaker = resilience.CircuitBreaker(failure_threshold=1, cooldown_s=0.01)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial call
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_deadline_bounds_a_hung_call():
+    def call(model_id):
+        time.sleep(1)
+        return 'late'
+
+    started = time.monotonic()
+    assert resilience.invoke(call, ['m1'], deadline=time.monotonic() + 0.05) == (None, None)
+    assert time.monotonic() - started < 0.5
+    assert resilience.get_stats()['timeouts'] == 1
+
+
+def test_invocation_deadline_comes_from_lambda_context():
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 10000
+
+    deadline = resilience.start_invocation(Context(), reserve_ms=3000)
+    assert 6.5 < deadline - time.monotonic() <= 7.0
+    # In-process agent handlers (context None) keep the reactor's deadline
+    assert resilience.start_invocation(None) == deadline
+
+
+def test_non_retryable_errors_do_not_trip_the_breaker():
+    def call(model_id):
+        raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}}, 'Converse')
+
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD + 1):
+        assert resilience.invoke(call, ['m1']) == (None, None)
+    assert resilience.get_stats()['breakers']['m1'] == 'closed'
+
+
+def test_non_retryable_error_during_half_open_trial_frees_the_trial():
+    breaker = resilience.get_breaker('m1')
+    breaker.cooldown_s = 0.01
+    breaker.record_failure()
+    breaker.opened_at = time.monotonic() - 1
+    responses = [ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}}, 'Converse'), 'ok']
+
+    def call(model_id):
+        result = responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert resilience.invoke(call, ['m1']) == (None, None)
+    # The next call still gets the trial and closes the breaker
+    assert resilience.invoke(call, ['m1']) == ('ok', 'm1')
+    assert breaker.state == 'closed'
+
+
+def test_rule_engine_fallback_covers_ambiguous_readings():
+    # Not confident enough for the fast path, but usable when no model answers
+    assert rules.evaluate('activity', {'heartRate': 120}) == (None, None)
+    assert rules.fallback('vitals', {'heartRate': 120})[1] == 'vitals.fallback_elevated'
+    assert rules.fallback('wellbeing', {'heartRate': 70})[0]['mental_state'] == 'Calm'
+
+
+def test_rule_engine_fallback_is_counted_apart_from_the_hit_rate():
+    rules.reset_stats()
+    try:
+        assert rules.evaluate('vitals', {'heartRate': 120}) == (None, None)
+        rules.fallback('vitals', {'heartRate': 120})
+
+        stats = rules.get_stats()
+        assert stats['evaluations'] == {'vitals': 1} and stats['hit_rate'] == 0.0
+        assert stats['fallback_hits'] == {'vitals.fallback_elevated': 1}
+        assert stats['rule_hits']['vitals.fallback_elevated'] == 0
+    finally:
+        rules.reset_stats()
@@ -0,0 +1,110 @@
+import os
+import sys
+import pytest
+from decimal import Decimal
+from statistics import mean, stdev
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'ingest'))
+import rollups
+from core.utils import rollup_stats, rollups_to_items
+
+
+def make_samples():
+    # 10 minutes of 10-second samples, mixing watch and seeder key styles
+    samples = []
+    for i in range(60):
+        key = 'heartRate' if i % 2 else 'heart_rate'
+        samples.append({'timestamp': 1_700_000_000_000 + i * 10000, key: Decimal(str(60 + i % 7)), 'sleep_status': 'AWAKE'})
+    return samples
+
+
+def test_build_partials_buckets_per_resolution():
+    samples = make_samples()
+    partials = rollups.build_partials(samples)
+
+    minute_buckets = [k for k in partials if k[0] == '1m']
+    assert len(minute_buckets) in (10, 11)
+    assert sum(p['heart_rate']['count'] for k, p in partials.items() if k[0] == '1h') == 60
+
+    rows = [{'bucket_ts': ts, 'stats': stats} for (res, ts), stats in partials.items() if res == '1m']
+    values = [float(s.get('heart_rate', s.get('heartRate'))) for s in samples]
+    combined = rollup_stats(rows, 'heart_rate')
+    assert combined['count'] == 60
+    assert combined['mean'] == pytest.approx(mean(values))
+    assert combined['stdev'] == pytest.approx(stdev(values))
+    assert combined['min'] == min(values) and combined['max'] == max(values)
+    assert len(rollups_to_items(rows)) == len(rows)
+
+
+def _hr(count, total, sumsq, low, high):
+    return {'heart_rate': {'count': count, 'sum': Decimal(total), 'sumsq': Decimal(sumsq), 'min': Decimal(low), 'max': Decimal(high)}}
+
+
+def test_merge_bucket_adds_atomically_and_extends_the_range_only_when_needed():
+    table = MagicMock()
+    # Stored after the ADD: an earlier batch had 70..95, this one adds 90
+    table.update_item.side_effect = [{'Attributes': {'stats': _hr(3, 255, 21725, 70, 95)}}, {}]
+
+    assert rollups.merge_bucket('u1', '1h', 0, _hr(1, 90, 8100, 90, 90), table=table)
+
+    add = table.update_item.call_args_list[0][1]
+    assert add['UpdateExpression'].startswith('ADD ')
+    assert add['ConditionExpression'] == 'attribute_exists(rollup_key)'
+    assert add['ExpressionAttributeValues'][':sum0'] == Decimal(90)
+    assert table.update_item.call_count == 1
+    table.get_item.assert_not_called()
+    table.put_item.assert_not_called()
+
+
+def test_merge_bucket_conditionally_sets_a_new_minimum():
+    table = MagicMock()
+    table.update_item.side_effect = [
+        {'Attributes': {'stats': _hr(3, 230, 17900, 70, 90)}},
+        ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem'),
+    ]
+
+    assert rollups.merge_bucket('u1', '1h', 0, _hr(1, 60, 3600, 60, 60), table=table)
+
+    extend = table.update_item.call_args_list[1][1]
+    assert extend['ExpressionAttributeNames']['#f'] == 'min'
+    assert extend['ConditionExpression'] == 'attribute_not_exists(#stats.#m.#f) OR #stats.#m.#f > :v'
+
+
+def test_merge_bucket_creates_new_buckets_and_metric_maps():
+    conflict = ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+    missing_path = ClientError({'Error': {'Code': 'ValidationException'}}, 'UpdateItem')
+
+    table = MagicMock()
+    table.update_item.side_effect = [conflict]
+    assert rollups.merge_bucket('u1', '1h', 0, _hr(1, 90, 8100, 90, 90), table=table)
+    item = table.put_item.call_args[1]['Item']
+    assert item['stats'] == _hr(1, 90, 8100, 90, 90) and 'expires_at' not in item
+
+    # A bucket that has not seen heart_rate yet: the empty map is added, then the ADD retried
+    table = MagicMock()
+    table.update_item.side_effect = [missing_path, {}, {'Attributes': {'stats': _hr(1, 90, 8100, 90, 90)}}]
+    assert rollups.merge_bucket('u1', '1h', 0, _hr(1, 90, 8100, 90, 90), table=table)
+    assert 'if_not_exists' in table.update_item.call_args_list[1][1]['UpdateExpression']
+    table.put_item.assert_not_called()
+
+
+def test_update_rollups_surfaces_failed_merges():
+    table = MagicMock()
+    table.update_item.side_effect = ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+    table.put_item.side_effect = ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+
+    with pytest.raises(RuntimeError):
+        rollups.update_rollups('u1', make_samples()[:1], table=table)
+
+
+def test_backfill_widens_the_range_to_whole_buckets():
+    health, table = MagicMock(), MagicMock()
+    health.query.return_value = {'Items': []}
+
+    rollups.backfill_user('u1', health, table, start_ts=3_600_000 * 5 + 1234)
+
+    condition = health.query.call_args[1]['KeyConditionExpression']
+    bound = condition.get_expression()['values'][1].get_expression()['values'][1]
+    assert bound == 3_600_000 * 5
@@ -0,0 +1,105 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from core import llm, llm_cache, resilience, routing
+
+
+@pytest.fixture(autouse=True)
+def _fresh_state():
+    routing.reset_report()
+    resilience.reset()
+    yield
+    routing.reset_report()
+    resilience.reset()
+
+
+def _converse_response(tool_input, input_tokens=1000, output_tokens=100):
+    return {
+        'output': {'message': {'content': [{'toolUse': {'input': tool_input}}]}},
+        'usage': {'inputTokens': input_tokens, 'outputTokens': output_tokens, 'totalTokens': input_tokens + output_tokens}
+    }
+
+
+def _invoke(client, schema, **kwargs):
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None):
+        return llm.invoke_model_structured('sys', 'msg', schema, use_cache=False, **kwargs)
+
+
+def test_schemas_route_to_their_tier():
+    assert routing.route('vitals_expert_analysis', 'default')[0] == routing.MODEL_TIERS['small']
+    assert routing.route('pet_state_supervisor_decision', 'default')[0] == routing.MODEL_TIERS['large']
+    assert routing.route('unknown_tool', 'default') == ('default', None, False)
+    # The hourly coach runs on the small model and only escalates bad answers
+    assert routing.route('proactive_coach_intervention', 'default') == (routing.MODEL_TIERS['small'], 'small', True)
+
+
+def test_validate_checks_required_enum_and_bounds():
+    schema = llm.WELLBEING_EXPERT_SCHEMA['toolSpec']['inputSchema']['json']
+    assert routing.validate({'mental_state': 'Calm', 'reasoning': 'ok', 'recovery_score': 80}, schema) == []
+    errors = routing.validate({'mental_state': 'Happy', 'recovery_score': 120}, schema)
+    assert len(errors) == 3
+
+
+def test_valid_small_model_answer_is_not_escalated():
+    client = MagicMock()
+    client.converse.return_value = _converse_response({'status': 'Normal', 'reasoning': 'HR 70', 'confidence': 0.9})
+
+    assert _invoke(client, llm.VITALS_EXPERT_SCHEMA)['status'] == 'Normal'
+    assert client.converse.call_count == 1
+    assert client.converse.call_args.kwargs['modelId'] == routing.MODEL_TIERS['small']
+
+
+def test_invalid_or_unsure_answers_escalate_to_large_model():
+    client = MagicMock()
+    client.converse.side_effect = [
+        _converse_response({'status': 'Fine', 'reasoning': 'HR 70'}),
+        _converse_response({'status': 'Normal', 'reasoning': 'HR 70'}),
+        _converse_response({'activity_type': 'Walking', 'intensity': 'Low', 'reasoning': '?', 'confidence': 0.3}),
+        _converse_response({'activity_type': 'Commuting', 'intensity': 'Low', 'reasoning': 'speed'}),
+    ]
+    usage = {}
+
+    assert _invoke(client, llm.VITALS_EXPERT_SCHEMA, usage=usage)['status'] == 'Normal'
+    assert _invoke(client, llm.ACTIVITY_EXPERT_SCHEMA)['activity_type'] == 'Commuting'
+    models = [c.kwargs['modelId'] for c in client.converse.call_args_list]
+    assert models == [routing.MODEL_TIERS['small'], routing.MODEL_TIERS['large']] * 2
+    assert usage['inputTokens'] == 2000
+
+    report = routing.get_report()['routes']
+    assert report['vitals_expert_analysis']['escalations'] == 1
+    assert report['vitals_expert_analysis']['tiers'] == {'small': 1, 'large': 1}
+
+
+def test_invalid_answer_is_not_cached_when_escalation_fails():
+    client = MagicMock()
+    client.converse.side_effect = [
+        _converse_response({'status': 'Fine', 'reasoning': 'HR 70'}),
+        ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}}, 'Converse'),
+    ]
+
+    with patch.object(llm, 'bedrock_runtime', client), \
+            patch.object(llm_cache, 'is_enabled', return_value=True), \
+            patch.object(llm_cache, 'get', return_value=None), \
+            patch.object(llm_cache, 'put') as put:
+        assert llm.invoke_model_structured('sys', 'msg', llm.VITALS_EXPERT_SCHEMA)['status'] == 'Fine'
+
+    put.assert_not_called()
+
+
+def test_report_shows_savings_against_large_only():
+    client = MagicMock()
+    client.converse.return_value = _converse_response({'message': 'Hi!'})
+
+    _invoke(client, llm.SUPERVISOR_SCHEMA)
+    for _ in range(3):
+        _invoke(client, llm.VITALS_EXPERT_SCHEMA)  # invalid for vitals: every call escalates
+    report = routing.get_report()
+
+    supervisor = report['routes']['pet_state_supervisor_decision']
+    assert supervisor['savings_usd'] == pytest.approx(0.0)
+    vitals = report['routes']['vitals_expert_analysis']
+    assert vitals['calls'] == 6 and vitals['escalations'] == 3
+    assert report['savings_usd'] > 0
+    assert vitals['avg_latency_ms'] >= 0
@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import pytest
+
+from core import features, rules
+
+
+@pytest.fixture(autouse=True)
+def _reset_counters():
+    rules.reset_stats()
+    yield
+    rules.reset_stats()
+
+
+STILL = {'x': 0.0, 'y': 0.0, 'z': 1.0}
+SHAKING = {'x': 0.6, 'y': 0.4, 'z': 1.1}
+
+
+def test_extract_features_normalizes_payload_shapes():
+    watch = features.extract_features({'heartRate': Decimal('72'), 'stepCount': 0, 'speed': Decimal('5'), 'accelerometer': STILL})
+    assert watch['heart_rate'] == 72.0
+    assert watch['speed_kmh'] == pytest.approx(18.0)
+    assert watch['moving'] is False
+
+    simulated = features.extract_features({'raw_complex': {'vitals': {'heartRate': 130, 'spo2': 97}, 'activity': {'stepCount': 40}}})
+    assert simulated['heart_rate'] == 130.0
+    assert simulated['spo2'] == 97.0
+    assert simulated['moving'] is None
+
+    assert features.extract_features({'heart_rate': 70, 'accelerometer': SHAKING})['moving'] is True
+
+
+def test_vitals_critical_and_fever():
+    result, rule_id = rules.evaluate('vitals', {'heartRate': 190})
+    assert rule_id == 'vitals.critical_heart_rate'
+    assert result['status'] == 'Critical'
+
+    result, rule_id = rules.evaluate('vitals', {'heartRate': 80, 'spo2': 88})
+    assert rule_id == 'vitals.critical_spo2'
+
+    result, rule_id = rules.evaluate('vitals', {'heartRate': 80, 'bodyTemperature': Decimal('38.2')})
+    assert rule_id == 'vitals.fever'
+    assert result == {'status': 'Abnormal', 'potential_issues': ['Fever'], 'reasoning': 'Body temperature above 37.5C indicates fever.'}
+
+
+def test_activity_rules():
+    assert rules.evaluate('activity', {'sleep_status': 'ASLEEP', 'heartRate': 55})[1] == 'activity.asleep'
+    assert rules.evaluate('activity', {'speed': 15, 'stepCount': 0})[0]['activity_type'] == 'Commuting'
+    assert rules.evaluate('activity', {'heartRate': 140, 'accelerometer': SHAKING})[1] == 'activity.workout'
+
+    # High HR while stationary must not be classified as a workout
+    result, rule_id = rules.evaluate('activity', {'heartRate': 120, 'stepCount': 0, 'accelerometer': STILL})
+    assert rule_id == 'activity.stationary_high_hr'
+    assert result['activity_type'] == 'Sedentary'
+
+
+def test_ambiguous_readings_fall_through_to_llm():
+    # Elevated HR with unknown movement: the model decides
+    assert rules.evaluate('activity', {'heartRate': 120}) == (None, None)
+    assert rules.evaluate('vitals', {'heartRate': 45}) == (None, None)
+    assert rules.evaluate('wellbeing', {'stress_score': 55}) == (None, None)
+    # Calm readings can still be Exhausted given the history: left to the model
+    assert rules.evaluate('wellbeing', {'stress_score': 10, 'hrv': 70}) == (None, None)
+
+
+def test_min_confidence_gates_rules():
+    reading = {'heartRate': 75, 'spo2': 98}
+    assert rules.evaluate('vitals', reading)[1] == 'vitals.normal'
+    assert rules.evaluate('vitals', reading, min_confidence=0.95) == (None, None)
+    assert rules.evaluate('vitals', {'heartRate': 200}, min_confidence=0.95)[1] == 'vitals.critical_heart_rate'
+
+
+def test_results_are_copies():
+    result, _ = rules.evaluate('vitals', {'heartRate': 190})
+    result['potential_issues'].append('mutated')
+    assert rules.evaluate('vitals', {'heartRate': 190})[0]['potential_issues'] == ['Tachycardia']
+
+
+def test_stats_track_hits_and_fallthroughs():
+    rules.evaluate('vitals', {'heartRate': 190})
+    rules.evaluate('vitals', {'heartRate': 190})
+    rules.evaluate('wellbeing', {'stress_score': 55})
+
+    stats = rules.get_stats()
+    assert stats['rule_hits']['vitals.critical_heart_rate'] == 2
+    assert stats['evaluations'] == {'vitals': 2, 'wellbeing': 1}
+    assert stats['llm_fallthroughs'] == {'wellbeing': 1}
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
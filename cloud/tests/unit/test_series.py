@@ -0,0 +1,53 @@
+import pytest
+from decimal import Decimal
+from core.series import HealthSeries, discover_metrics
+from core.utils import aggregate_data_by_window, iter_adaptive_aggregate
+
+
+def make_items(n, step_ms=60000):
+    return [
+        {
+            'timestamp': i * step_ms,
+            'heart_rate': Decimal(str(70 + (i % 4) * (10 if 20 <= i < 40 else 1))),
+            'hrv': Decimal('50') if i % 2 else None,
+            'spo2': Decimal('98'),
+            'sleep_status': 'AWAKE'
+        }
+        for i in range(n)
+    ]
+
+
+def test_from_items_builds_typed_columns():
+    items = list(reversed(make_items(10)))
+    series = HealthSeries.from_items(items)
+
+    assert discover_metrics(items) == ['heart_rate', 'hrv', 'spo2']
+    assert len(series) == 10
+    assert list(series.timestamps) == sorted(item['timestamp'] for item in items)
+    assert series.columns['heart_rate'].dtype.kind == 'f'
+    # Missing values become NaN, not 0
+    assert series.columns['hrv'][0] != series.columns['hrv'][0]
+
+
+def test_fixed_windows_legacy_and_aligned():
+    items = make_items(90, step_ms=60000)[5:]  # starts at minute 5
+    legacy = aggregate_data_by_window(items, window_ms=30 * 60000)
+    aligned = aggregate_data_by_window(items, window_ms=30 * 60000, metrics=['hrv', 'spo2'], aligned=True)
+
+    assert [w['timestamp'] for w in legacy] == [5 * 60000, 35 * 60000, 65 * 60000]
+    assert [w['timestamp'] for w in aligned] == [0, 30 * 60000, 60 * 60000]
+    assert aligned[0]['spo2'] == pytest.approx(98.0)
+    assert aligned[0]['hrv'] == pytest.approx(50.0)
+
+
+def test_adaptive_windows_match_streaming_aggregator():
+    items = make_items(120)
+    kwargs = dict(min_window_ms=3 * 60000, max_window_ms=30 * 60000, threshold=4.0, target_metric='heart_rate', metrics=['heart_rate', 'hrv'])
+
+    vectorized = HealthSeries.from_items(items, ['heart_rate', 'hrv']).adaptive_windows(**kwargs)
+    streamed = list(iter_adaptive_aggregate(items, **kwargs))
+
+    assert [w['timestamp'] for w in vectorized] == [w['timestamp'] for w in streamed]
+    assert [w['window_duration_min'] for w in vectorized] == [w['window_duration_min'] for w in streamed]
+    for v, s in zip(vectorized, streamed):
+        assert v['heart_rate'] == pytest.approx(s['heart_rate'])
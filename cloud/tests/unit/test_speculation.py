@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core import features, rules
+import speculation
+
+
+class FakeBackend:
+    name = 'local'
+
+    def __init__(self, response, delay=0.0):
+        self.response = response
+        self.delay = delay
+        self.payloads = []
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, agent, payload):
+        time.sleep(self.delay)
+        return self.response
+
+    def submit(self, agent, payload):
+        self.payloads.append((agent, payload))
+        return self._pool.submit(self._run, agent, payload)
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    speculation.reset_stats()
+    rules.reset_stats()
+    yield
+    speculation.reset_stats()
+
+
+def test_guess_prefers_deciding_rule_findings_over_last_state():
+    last_state = {'stateEnum': 'HAPPY', 'reasoning': 'All good.'}
+    assert speculation.guess_state(features.extract_features({'heartRate': 190}), last_state)[0] == 'SICKNESS'
+    state, reasoning, source = speculation.guess_state(features.extract_features({'heartRate': 75}), last_state)
+    assert (state, source) == ('HAPPY', 'last_state')
+    # The message is built from this run's readings, not the previous run's reasoning
+    assert reasoning == 'Current readings: {"heart_rate":"60-100"}'
+    assert speculation.guess_state(features.extract_features({'heartRate': 75}), None) is None
+    # Lookahead guesses do not count as rule-engine evaluations
+    assert rules.get_stats()['evaluations'] == {}
+
+
+def test_hit_reuses_message_and_records_saved_latency():
+    backend = FakeBackend({'message': 'I feel great!'}, delay=0.05)
+    run = speculation.start(backend, ('HAPPY', 'All good.', 'last_state'), {'name': 'Alex'})
+    time.sleep(0.06)
+
+    assert run.resolve({'state': 'HAPPY', 'reasoning': 'Stable vitals.'}) == 'I feel great!'
+    assert backend.payloads[0][1]['analysis']['state'] == 'HAPPY'
+    stats = speculation.get_stats()
+    assert stats['hits'] == 1 and stats['hit_rate'] == 1.0
+    assert stats['saved_ms'] >= 40
+
+
+def test_miss_and_failed_speculation_fall_back():
+    run = speculation.start(FakeBackend({'message': 'I feel great!'}), ('HAPPY', '', 'last_state'), {})
+    assert run.resolve({'state': 'STRESS'}) is None
+
+    run = speculation.start(FakeBackend({'error': 'Model failed'}), ('HAPPY', '', 'last_state'), {})
+    assert run.resolve({'state': 'HAPPY'}) is None
+
+    stats = speculation.get_stats()
+    assert (stats['attempts'], stats['hits'], stats['misses'], stats['failed']) == (2, 0, 1, 1)
+    assert stats['hit_rate'] == 0.0
@@ -0,0 +1,128 @@
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core import instrumentation, llm, llm_cache, resilience
+import characterizer
+import streaming
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'user'))
+import manager
+
+
+@pytest.fixture(autouse=True)
+def _fresh_state():
+    instrumentation.reset()
+    resilience.reset()
+    llm_cache.clear()
+    yield
+    llm_cache.clear()
+
+
+def _stream_events(chunks):
+    events = [{'messageStart': {'role': 'assistant'}}]
+    events += [{'contentBlockDelta': {'delta': {'toolUse': {'input': chunk}}}} for chunk in chunks]
+    events.append({'metadata': {'usage': {'inputTokens': 200, 'outputTokens': 20}, 'metrics': {'latencyMs': 400}}})
+    return {'stream': iter(events)}
+
+
+def test_partial_string_field_decodes_incomplete_json():
+    assert llm.partial_string_field('{"mess', 'message') is None
+    assert llm.partial_string_field('{"message": "I feel gr', 'message') == 'I feel gr'
+    assert llm.partial_string_field('{"message": "Say \\"hi\\" \\u00e9', 'message') == 'Say "hi" é'
+    assert llm.partial_string_field('{"message": "Done!"}', 'message') == 'Done!'
+
+
+def test_stream_reports_text_as_it_arrives():
+    client = MagicMock()
+    client.converse_stream.return_value = _stream_events(['{"mess', 'age": "I feel ', 'great today', '!"}'])
+    seen = []
+
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None):
+        result = llm.invoke_model_structured_stream('sys', 'msg', characterizer.CHARACTERIZER_SCHEMA, seen.append)
+
+    assert result == {'message': 'I feel great today!'}
+    assert seen == ['I feel ', 'I feel great today', 'I feel great today!']
+    summary = instrumentation.get_summary()['generate_character_message']
+    assert summary['outcomes'] == {'ok': 1} and summary['output_tokens'] == 20
+
+
+def test_message_stream_publishes_whole_words_and_throttles():
+    writer = MagicMock(side_effect=[1, 2, 3])
+    stream = streaming.MessageStream('u1', state='HAPPY', stream_id=1000, flush_ms=60_000, writer=writer)
+
+    stream.update('I')
+    stream.update('I feel')
+    stream.update('I feel great to')  # throttled
+    stream.complete('I feel great today!')
+
+    texts = [c.args[2] for c in writer.call_args_list]
+    assert texts == ['I', 'I feel great today!']
+    assert writer.call_args.kwargs == {'complete': True, 'state': 'HAPPY'}
+    assert stream.version == 2 and stream.first_word_ms is not None
+
+
+def test_characterizer_streams_only_when_asked():
+    client = MagicMock()
+    client.converse_stream.return_value = _stream_events(['{"message": "Let\'s ', 'move a bit."}'])
+    writer = MagicMock(return_value=1)
+
+    with patch.object(llm, 'bedrock_runtime', client), patch.object(llm_cache, 'cache_table', None), \
+         patch.object(streaming.database, 'write_message_stream', writer):
+        resp = characterizer.handler({'analysis': {'state': 'TIRED'}, 'user_id': 'u1', 'stream': True, 'stream_id': 5}, None)
+
+    assert resp == {'message': "Let's move a bit."}
+    assert writer.call_args_list[-1].args == ('u1', 5, "Let's move a bit.")
+    assert writer.call_args_list[-1].kwargs['complete'] is True
+    client.converse.assert_not_called()
+
+
+def _state_event():
+    return {'routeKey': 'GET /api/v1/user/{user_id}/state', 'pathParameters': {'user_id': 'u1'}}
+
+
+def test_state_endpoint_serves_newer_in_progress_message():
+    state_table, stream_table = MagicMock(), MagicMock()
+    state_table.get_item.return_value = {'Item': {'timestamp': Decimal(1000), 'stateEnum': 'HAPPY', 'message': 'old'}}
+    stream_table.get_item.return_value = {'Item': {'stream_id': Decimal(2000), 'stateEnum': 'HAPPY', 'message': 'I feel', 'complete': False, 'version': Decimal(3), 'expires_at': Decimal(int(time.time()) + 60)}}
+
+    with patch.object(manager, 'user_state_table', state_table), patch.object(manager, 'message_stream_table', stream_table):
+        body = json.loads(manager.handler(_state_event(), None)['body'])
+        assert (body['message'], body['message_version'], body['message_complete']) == ('I feel', 3, False)
+
+        # Once the state commit is newer than the stream, the stored message wins
+        state_table.get_item.return_value = {'Item': {'timestamp': Decimal(3000), 'stateEnum': 'HAPPY', 'message': 'I feel rested.'}}
+        body = json.loads(manager.handler(_state_event(), None)['body'])
+        assert (body['message'], body['message_complete']) == ('I feel rested.', True)
+
+
+def test_state_endpoint_ignores_message_for_an_uncommitted_state():
+    state_table, stream_table = MagicMock(), MagicMock()
+    state_table.get_item.return_value = {'Item': {'timestamp': Decimal(1000), 'stateEnum': 'HAPPY', 'message': 'All good.'}}
+    # Hysteresis kept HAPPY; the message was written for the proposed STRESS
+    stream_table.get_item.return_value = {'Item': {'stream_id': Decimal(2000), 'stateEnum': 'STRESS', 'message': 'I am tense', 'complete': True, 'version': Decimal(1), 'expires_at': Decimal(int(time.time()) + 60)}}
+
+    with patch.object(manager, 'user_state_table', state_table), patch.object(manager, 'message_stream_table', stream_table):
+        body = json.loads(manager.handler(_state_event(), None)['body'])
+
+    assert (body['message'], body['message_complete']) == ('All good.', True)
+    # The transition's first words are served with the state they were written for
+    assert (body['stream_message'], body['stream_state'], body['stream_complete']) == ('I am tense', 'STRESS', True)
+
+
+def test_state_endpoint_drops_expired_stream_records():
+    state_table, stream_table = MagicMock(), MagicMock()
+    state_table.get_item.return_value = {'Item': {'timestamp': Decimal(1000), 'stateEnum': 'HAPPY', 'message': 'All good.'}}
+    # Left by a reactor run that died mid-stream; TTL has not deleted it yet
+    stream_table.get_item.return_value = {'Item': {'stream_id': Decimal(2000), 'stateEnum': 'HAPPY', 'message': 'I feel', 'complete': False, 'version': Decimal(2), 'expires_at': Decimal(int(time.time()) - 1)}}
+
+    with patch.object(manager, 'user_state_table', state_table), patch.object(manager, 'message_stream_table', stream_table):
+        body = json.loads(manager.handler(_state_event(), None)['body'])
+
+    assert (body['message'], body['message_complete'], body['message_version']) == ('All good.', True, 0)
+    assert 'stream_message' not in body
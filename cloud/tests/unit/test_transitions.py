@@ -0,0 +1,70 @@
+import transitions
+
+NOW = 1_760_000_000
+
+
+def _item(state, since_s, pending=None, count=0, updated_s=None):
+    item = {'stateEnum': state, 'state_since': since_s, 'timestamp': (updated_s or since_s) * 1000, 'transitions': [f'{state}@{since_s}']}
+    if pending:
+        item.update(pending_state=pending, pending_count=count)
+    return item
+
+
+def _apply(item, decision, fields, state, now_s):
+    """What the reactor stores for a decision (commit_state and update_pending_state both merge)."""
+    if decision in (transitions.TRANSITION, transitions.REFRESH):
+        stored = {k: v for k, v in item.items() if k not in ('pending_state', 'pending_count')}
+        return dict(stored, **fields, stateEnum=state, timestamp=now_s * 1000)
+    if decision == transitions.PENDING:
+        return dict(item, **fields)
+    return {k: v for k, v in item.items() if k not in ('pending_state', 'pending_count')}
+
+
+def test_first_state_and_priority_states_apply_immediately():
+    assert transitions.decide(None, 'NEUTRAL', NOW)[0] == transitions.TRANSITION
+
+    decision, fields = transitions.decide(_item('HAPPY', NOW - 5), 'STRESS', NOW)
+    assert decision == transitions.TRANSITION and fields['transition_reason'] == 'priority'
+    assert fields['transitions'][-1] == f'STRESS@{NOW}'
+
+    # Leaving SICKNESS for a lower-priority state is not an override
+    assert transitions.decide(_item('SICKNESS', NOW - 5), 'EXERCISE', NOW)[0] == transitions.PENDING
+
+
+def test_transition_needs_confirmation_and_dwell():
+    item = _item('NEUTRAL', NOW - 1000)
+    decision, fields = transitions.decide(item, 'HAPPY', NOW)
+    assert (decision, fields) == (transitions.PENDING, {'pending_state': 'HAPPY', 'pending_count': 1})
+
+    assert transitions.decide(dict(item, **fields), 'HAPPY', NOW + 60)[0] == transitions.TRANSITION
+    # Confirmed, but NEUTRAL has not been held for its dwell time yet
+    young = _item('NEUTRAL', NOW - 10, pending='HAPPY', count=1)
+    assert transitions.decide(young, 'HAPPY', NOW)[0] == transitions.PENDING
+
+
+def test_flapping_supervisor_writes_far_less_than_legacy_trigger():
+    item = _item('NEUTRAL', NOW - 3600, updated_s=NOW - 60)
+    legacy_writes = state_writes = 0
+    last_legacy = 'NEUTRAL'
+    for minute in range(60):
+        proposed = 'HAPPY' if minute % 2 else 'NEUTRAL'
+        now_s = NOW + minute * 60
+        legacy_writes += proposed != last_legacy
+        last_legacy = proposed
+
+        decision, fields = transitions.decide(item, proposed, now_s)
+        state_writes += decision in (transitions.TRANSITION, transitions.REFRESH)
+        item = _apply(item, decision, fields, proposed, now_s)
+
+    assert legacy_writes == 59
+    assert state_writes <= 1
+    assert item['stateEnum'] == 'NEUTRAL'
+
+
+def test_stale_state_is_refreshed_keeping_avatar_and_history():
+    item = dict(_item('HAPPY', NOW - 7200), image_url='https://img')
+    decision, fields = transitions.decide(item, 'HAPPY', NOW)
+    assert decision == transitions.REFRESH
+    assert _apply(item, decision, fields, 'HAPPY', NOW)['image_url'] == 'https://img'
+    assert fields['state_since'] == NOW - 7200
+    assert transitions.parse_history(fields['transitions']) == [('HAPPY', NOW - 7200)]
@@ -0,0 +1,38 @@
+import os
+import sys
+from decimal import Decimal
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'agents', 'proactive_coach'))
+import watermark
+
+NOW = 1_760_000_000
+
+
+def _rows(start_ts, heart_rate='72.2'):
+    return [{'user_id': 'u1', 'timestamp': Decimal(start_ts + i * 60000), 'heartRate': Decimal(heart_rate), 'sleepStatus': 'AWAKE'} for i in range(3)]
+
+
+def test_users_without_new_samples_are_skipped():
+    user = {'user_id': 'u1', 'coach_watermark_ts': Decimal(5000), 'coached_at': Decimal((NOW - 3600) * 1000)}
+    assert not watermark.has_new_samples(user, Decimal(5000), NOW)
+    assert not watermark.has_new_samples(user, None, NOW)
+    assert watermark.has_new_samples(user, 5001, NOW)
+    assert watermark.has_new_samples({'user_id': 'u1'}, 5000, NOW)
+    # Coached again once the re-coach interval has passed, if the data is recent
+    recent_ts = (NOW - 7200) * 1000
+    assert watermark.has_new_samples(dict(user, coach_watermark_ts=recent_ts, coached_at=0), recent_ts, NOW)
+    # A watch that has been off for longer than the summary window is not re-coached
+    assert not watermark.has_new_samples(dict(user, coached_at=0), 5000, NOW)
+
+
+def test_materially_identical_summaries_share_a_digest():
+    digest = watermark.summary_digest(_rows(1000))
+    assert watermark.summary_digest(_rows(900000, heart_rate='71.9')) == digest
+    assert watermark.summary_digest(_rows(1000, heart_rate='95')) != digest
+
+    user = {'coach_summary_digest': digest, 'coached_at': (NOW - 60) * 1000}
+    assert watermark.is_unchanged(user, digest, NOW)
+    assert not watermark.is_unchanged(user, watermark.summary_digest(_rows(1000, heart_rate='95')), NOW)
+    assert not watermark.is_unchanged(dict(user, coached_at=0), digest, NOW)
+    # A summary without metrics does not force the periodic re-coach
+    assert watermark.is_unchanged(dict(user, coached_at=0), digest, NOW, has_data=False)